@@ -0,0 +1,53 @@
+import argparse
+import sys
+
+from benchmarks import timing
+from benchmarks.corpora import build_corpora
+
+SUITES = ("pda", "tokenizer", "decoding")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="CPU benchmarks for the JSON PDA, the JSON tokenizer and PDA-guided decoding.",
+    )
+    parser.add_argument("suites", nargs="*", default=list(SUITES), choices=SUITES,
+                        help="suites to run (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="size factor of the synthetic corpora")
+    parser.add_argument("--steps", type=int, default=200, help="decoding steps of the end-to-end benchmark")
+    parser.add_argument("--baseline-dir", default=timing.BASELINE_DIR, help="where baseline JSON files live")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare with the stored baseline and exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    corpora = build_corpora(args.scale)
+    print("Corpora: " + ", ".join(f"{name} ({len(text)} chars)" for name, text in corpora.items()))
+
+    regressions = []
+    for suite in args.suites:
+        if suite == "pda":
+            from benchmarks import bench_pda
+            results = bench_pda.run(corpora)
+        elif suite == "tokenizer":
+            from benchmarks import bench_tokenizer
+            results = bench_tokenizer.run(corpora)
+        else:
+            from benchmarks import bench_decoding
+            results = bench_decoding.run(steps=args.steps)
+
+        timing.print_results(suite, results)
+        if args.compare:
+            regressions.extend(timing.compare_to_baseline(suite, results, args.baseline_dir, args.tolerance))
+        if args.save_baseline:
+            print(f"Saved baseline to {timing.save_baseline(suite, results, args.baseline_dir)}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions against the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
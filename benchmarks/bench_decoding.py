@@ -0,0 +1,151 @@
+import time
+
+import torch
+
+from benchmarks.corpora import build_corpora
+from benchmarks.timing import latency_stats, rate
+from llm.generate_candidates import top_k_from_logits
+from llm.grammar_mask import build_mask_cache, build_vocab_trie
+from llm.incremental_decoder import IncrementalDecoder
+from llm.pda_augmented_generation import generate_with_pda, select_masked_token, select_pda_candidate
+from llm.speculative_decoding import measure_speculative_speedup
+from pda.json_pda import JsonPDA
+
+PROMPT = "Describe the user as a JSON object with a name, an age and a list of tags.\n"
+
+_TRAINING_TEXT = [
+    PROMPT,
+    '{"name": "Ada Lovelace", "age": 36, "tags": ["math", "poetry"], "active": true, "manager": null}',
+    '[{"id": 1, "value": -3.25e10}, {"id": 2, "value": false}]',
+    "The quick brown fox jumps over the lazy dog. Respond with a single, valid JSON object and nothing else.",
+]
+
+
+def build_local_tokenizer(vocab_size=512):
+    """Trains a small byte-level BPE tokenizer on local text, so no download is needed."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<eos>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    corpora = build_corpora(scale=0.02)
+    backend.train_from_iterator(_TRAINING_TEXT * 50 + list(corpora.values()), trainer=trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=backend, eos_token="<eos>", pad_token="<eos>")
+
+
+def build_tiny_model(vocab_size, seed=0, hidden_size=64, num_layers=2):
+    """A randomly initialised Llama-architecture causal LM small enough for a CPU."""
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=4096,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def bench_decode_loop(model, tokenizer, vocab_trie=None, steps=200, top_k=50):
+    """
+    Runs the decoding loop of ``generate_with_pda`` inside the JSON document
+    and times the forward pass and the token selection of every step.
+    """
+    decoder = IncrementalDecoder(model, tokenizer)
+    pda = JsonPDA()
+    forward_latencies = []
+    select_latencies = []
+    generated = 0
+
+    start = time.perf_counter()
+    begin = time.perf_counter()
+    logits = decoder.prefill(PROMPT)
+    prefill_seconds = time.perf_counter() - begin
+    for _ in range(steps):
+        begin = time.perf_counter()
+        if vocab_trie is not None:
+            choice = select_masked_token(logits, pda, vocab_trie)
+        else:
+            choice = select_pda_candidate(top_k_from_logits(logits, tokenizer, k=top_k), pda, True)
+        select_latencies.append(time.perf_counter() - begin)
+        if choice is None:
+            break
+        token_id, pda = choice[0], choice[2]
+        generated += 1
+        if pda.state == "END":
+            break
+
+        begin = time.perf_counter()
+        logits = decoder.step(token_id)
+        forward_latencies.append(time.perf_counter() - begin)
+    seconds = time.perf_counter() - start
+
+    step_latencies = [forward + select for forward, select in zip(forward_latencies, select_latencies)]
+    return {
+        "tokens_per_s": rate(generated, seconds),
+        "num_tokens": generated,
+        "prefill_ms": round(prefill_seconds * 1e3, 3),
+        **{f"step_{key}": value for key, value in latency_stats(step_latencies, "ms").items()},
+        **{f"forward_{key}": value for key, value in latency_stats(forward_latencies, "ms").items()},
+        **{f"select_{key}": value for key, value in latency_stats(select_latencies, "ms").items()},
+    }
+
+
+def bench_generate(model, tokenizer, vocab_trie=None, steps=200):
+    """Wall time of the public ``generate_with_pda`` entry point."""
+    start = time.perf_counter()
+    output = generate_with_pda(PROMPT, model, tokenizer, max_steps=steps, vocab_trie=vocab_trie)
+    seconds = time.perf_counter() - start
+    return {"chars_per_s": rate(len(output), seconds), "total_s": round(seconds, 3)}
+
+
+def bench_speculative(model, draft_model, tokenizer, vocab_trie, steps=200, num_draft_tokens=4):
+    """Greedy grammar-masked decoding with and without a draft model; both must produce the same JSON."""
+    result = measure_speculative_speedup(
+        PROMPT, model, draft_model, tokenizer, vocab_trie, max_steps=steps, num_draft_tokens=num_draft_tokens
+    )
+    return {
+        "baseline_s": round(result["baseline_seconds"], 3),
+        "speculative_s": round(result["speculative_seconds"], 3),
+        "speedup": round(result["speedup"], 3),
+        "acceptance_rate": round(result["acceptance_rate"], 3),
+        "target_forward_passes": result["target_forward_passes"],
+        "baseline_forward_passes": result["baseline_forward_passes"],
+        "same_output": result["same_output"],
+    }
+
+
+def run(steps=200, seed=0):
+    tokenizer = build_local_tokenizer()
+    model = build_tiny_model(len(tokenizer), seed=seed)
+
+    begin = time.perf_counter()
+    vocab_trie = build_vocab_trie(tokenizer)
+    trie_seconds = time.perf_counter() - begin
+    mask_cache = build_mask_cache(vocab_trie, maxsize=512)
+
+    results = {
+        "build_vocab_trie": {"total_ms": round(trie_seconds * 1e3, 3), "vocab_size": len(tokenizer)},
+        "decode_topk": bench_decode_loop(model, tokenizer, steps=steps),
+        "decode_vocab_mask": bench_decode_loop(model, tokenizer, vocab_trie=vocab_trie, steps=steps),
+        "decode_mask_cache": bench_decode_loop(model, tokenizer, vocab_trie=mask_cache, steps=steps),
+        "generate_with_pda_topk": bench_generate(model, tokenizer, steps=steps),
+        "generate_with_pda_mask_cache": bench_generate(model, tokenizer, vocab_trie=mask_cache, steps=steps),
+    }
+    results["decode_mask_cache"]["cache_hit_rate"] = round(mask_cache.hit_rate, 3)
+    # The model as its own draft bounds the speedup (every proposal is accepted);
+    # a smaller, differently seeded model shows the cost of poor proposals.
+    results["speculative_self_draft"] = bench_speculative(model, model, tokenizer, mask_cache, steps=steps)
+    draft_model = build_tiny_model(len(tokenizer), seed=seed + 1, hidden_size=32, num_layers=1)
+    results["speculative_tiny_draft"] = bench_speculative(model, draft_model, tokenizer, mask_cache, steps=steps)
+    return results
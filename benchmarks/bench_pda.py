@@ -0,0 +1,126 @@
+import time
+
+from benchmarks.timing import best_of, latency_stats, rate
+from pda.candidates import select_pda_candidate, valid_pda_candidates
+from pda.json_pda import JsonPDA
+
+# Token texts in the style of a BPE vocabulary, used as top-k candidates.
+CANDIDATE_TOKENS = [
+    '"', ' "', '":', '": ', '",', '", "', ' {', '{', '}', '},', ' [', '[', ']', '],', ',', ', ',
+    'name', ' name', 'value', 'id', '_', 'ing', 'the', ' the', 'A', 'Z', '0', '1', '12', '123', '.', '-',
+    'e', 'E+', ' true', 'true', 'false', ' null', 'null', 'tr', 'fal', 'nu', '\\', '\\n', '\\"', ' ',
+    '\n', '  ', ':', '{"', '"}',
+]
+
+# Prefixes that put the PDA into the typical states of a generation step.
+CANDIDATE_STATES = {
+    "expect_key": '{"user": {"name": "Ada", ',
+    "in_string": '{"user": {"name": "Ada Lov',
+    "expect_value": '{"user": {"name": "Ada", "age": ',
+    "in_array": '{"tags": ["a", 1, true, ',
+}
+
+
+def _consume_chars(text):
+    pda = JsonPDA()
+    for char in text:
+        if not pda.consume_char(char):
+            raise ValueError("benchmark corpus rejected by the PDA")
+    return pda
+
+
+def bench_consume_char(text, block=256):
+    """Character-by-character feeding; latencies are per character, averaged over blocks of ``block`` characters."""
+    seconds, _ = best_of(lambda: _consume_chars(text))
+    latencies = []
+    pda = JsonPDA()
+    for start in range(0, len(text), block):
+        chunk = text[start:start + block]
+        begin = time.perf_counter()
+        for char in chunk:
+            pda.consume_char(char)
+        latencies.append((time.perf_counter() - begin) / len(chunk))
+    return {"chars_per_s": rate(len(text), seconds), **latency_stats(latencies, "ns")}
+
+
+def bench_consume_token(text, token_length=4):
+    """Feeding in fixed-size pieces, the way generation feeds LLM tokens."""
+    tokens = [text[start:start + token_length] for start in range(0, len(text), token_length)]
+
+    def run():
+        pda = JsonPDA()
+        for token in tokens:
+            pda.consume_token(token)
+
+    seconds, _ = best_of(run)
+    latencies = []
+    pda = JsonPDA()
+    for token in tokens:
+        begin = time.perf_counter()
+        pda.consume_token(token)
+        latencies.append(time.perf_counter() - begin)
+    return {
+        "chars_per_s": rate(len(text), seconds),
+        "tokens_per_s": rate(len(tokens), seconds),
+        **latency_stats(latencies, "ns"),
+    }
+
+
+def bench_accepts(text):
+    seconds, accepted = best_of(lambda: JsonPDA().accepts(text))
+    if not accepted:
+        raise ValueError("benchmark corpus rejected by the PDA")
+    return {"chars_per_s": rate(len(text), seconds)}
+
+
+def bench_clone(text, count=100000):
+    """Clones a PDA that has consumed the first half of ``text`` (a deep stack for nested corpora)."""
+    pda = JsonPDA()
+    pda.consume_token(text[:len(text) // 2])
+
+    def run():
+        for _ in range(count):
+            pda.clone()
+
+    seconds, _ = best_of(run)
+    return {"clones_per_s": rate(count, seconds), "stack_depth": len(pda.stack)}
+
+
+def bench_candidate_filter(repeats=2000):
+    """The top-k filtering step of ``generate_with_pda`` on 50 BPE-like candidates."""
+    candidates = list(enumerate(CANDIDATE_TOKENS))
+    results = {}
+    for name, prefix in CANDIDATE_STATES.items():
+        pda = JsonPDA()
+        pda.consume_token(prefix)
+        # Worst case: every candidate is checked.
+        candidates_checked = len(candidates) * repeats
+
+        def run():
+            for _ in range(repeats):
+                for _ in valid_pda_candidates(candidates, pda, True):
+                    pass
+
+        seconds, _ = best_of(run)
+        latencies = []
+        for _ in range(min(repeats, 500)):
+            begin = time.perf_counter()
+            select_pda_candidate(candidates, pda, True)
+            latencies.append(time.perf_counter() - begin)
+        results[f"filter_{name}"] = {
+            "candidates_per_s": rate(candidates_checked, seconds),
+            **latency_stats(latencies, "us"),
+        }
+    return results
+
+
+def run(corpora, include_candidates=True):
+    results = {}
+    for name, text in corpora.items():
+        results[f"consume_char_{name}"] = bench_consume_char(text)
+        results[f"consume_token_{name}"] = bench_consume_token(text)
+        results[f"accepts_{name}"] = bench_accepts(text)
+        results[f"clone_{name}"] = bench_clone(text)
+    if include_candidates:
+        results.update(bench_candidate_filter())
+    return results
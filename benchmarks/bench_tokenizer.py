@@ -0,0 +1,47 @@
+import time
+
+from benchmarks.timing import best_of, latency_stats, rate
+from tokenizors.json_tokenizor import JsonTokenizer
+
+
+def bench_tokenize(tokenizer, text, allow_partial=False, repeats=20):
+    seconds, tokens = best_of(lambda: tokenizer.tokenize(text, allow_partial=allow_partial))
+    latencies = []
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        tokenizer.tokenize(text, allow_partial=allow_partial)
+        latencies.append(time.perf_counter() - begin)
+    return {
+        "chars_per_s": rate(len(text), seconds),
+        "tokens_per_s": rate(len(tokens), seconds),
+        "num_tokens": len(tokens),
+        **latency_stats(latencies, "ms"),
+    }
+
+
+def bench_prefixes(tokenizer, text, count=200):
+    """Re-tokenizes growing prefixes with ``allow_partial``, as a streaming caller would."""
+    step = max(1, len(text) // count)
+    prefixes = [text[:end] for end in range(step, len(text) + 1, step)]
+    latencies = []
+    total_chars = 0
+    start = time.perf_counter()
+    for prefix in prefixes:
+        begin = time.perf_counter()
+        try:
+            tokenizer.tokenize(prefix, allow_partial=True)
+        except SyntaxError:
+            pass
+        latencies.append(time.perf_counter() - begin)
+        total_chars += len(prefix)
+    seconds = time.perf_counter() - start
+    return {"chars_per_s": rate(total_chars, seconds), **latency_stats(latencies, "ms")}
+
+
+def run(corpora):
+    tokenizer = JsonTokenizer()
+    results = {}
+    for name, text in corpora.items():
+        results[f"tokenize_{name}"] = bench_tokenize(tokenizer, text)
+        results[f"tokenize_prefixes_{name}"] = bench_prefixes(tokenizer, text[:20000])
+    return results
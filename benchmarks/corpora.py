@@ -0,0 +1,65 @@
+import json
+import random
+
+
+def deep_nesting(depth=2000):
+    """Objects and arrays nested ``depth`` levels deep, alternating per level."""
+    opening = []
+    closing = []
+    for level in range(depth):
+        if level % 2:
+            opening.append("[")
+            closing.append("]")
+        else:
+            opening.append('{"k": ')
+            closing.append("}")
+    return "".join(opening) + "null" + "".join(reversed(closing))
+
+
+def long_strings(count=20, length=20000, seed=0):
+    """An object of ``count`` string values of ``length`` characters, with escapes and non-ASCII text."""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,;-_äöüé€"
+    values = {}
+    for index in range(count):
+        chars = [rng.choice(alphabet) for _ in range(length)]
+        for position in range(0, length, 97):
+            chars[position] = rng.choice('"\\\n\t/')
+        values[f"field_{index}"] = "".join(chars)
+    return json.dumps(values, ensure_ascii=False)
+
+
+def long_numbers(count=2000, digits=60, seed=0):
+    """An array of ``count`` numbers with ``digits`` digits, fractions and exponents."""
+    rng = random.Random(seed)
+    numbers = []
+    for _ in range(count):
+        integer = str(rng.randint(1, 9)) + "".join(rng.choice("0123456789") for _ in range(digits // 2))
+        fraction = "".join(rng.choice("0123456789") for _ in range(digits - digits // 2))
+        sign = "-" if rng.random() < 0.5 else ""
+        exponent = rng.choice(["", f"e{rng.randint(-300, 300)}", f"E+{rng.randint(0, 300)}"])
+        numbers.append(f"{sign}{integer}.{fraction}{exponent}")
+    return "[" + ", ".join(numbers) + "]"
+
+
+def wide_arrays(width=50000, seed=0):
+    """A flat array of ``width`` short mixed values."""
+    rng = random.Random(seed)
+    choices = ["true", "false", "null", "0", "-1", "3.5", '"x"', '"hello"', "{}", "[]", '{"a": 1}', "[1, 2]"]
+    return "[" + ", ".join(rng.choice(choices) for _ in range(width)) + "]"
+
+
+def build_corpora(scale=1.0):
+    """
+    Returns the synthetic benchmark documents by name. ``scale`` shrinks or
+    grows every document, e.g. 0.1 for a quick run.
+    """
+    def size(value):
+        return max(1, int(value * scale))
+
+    return {
+        "deep_nesting": deep_nesting(size(2000)),
+        "long_strings": long_strings(length=size(20000)),
+        "long_numbers": long_numbers(count=size(2000)),
+        "wide_arrays": wide_arrays(size(50000)),
+    }
@@ -0,0 +1,107 @@
+import json
+import os
+import platform
+import time
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Nearest-rank percentiles of a list of numbers, as ``{"p50": ..., ...}``."""
+    if not samples:
+        return {f"p{point}": 0.0 for point in points}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        rank = max(0, min(len(ordered) - 1, int(round(point / 100 * len(ordered))) - 1))
+        result[f"p{point}"] = ordered[rank]
+    return result
+
+
+def latency_stats(seconds, unit="us"):
+    """Summarizes per-step latencies given in seconds as percentiles in ``unit``."""
+    scale = {"s": 1.0, "ms": 1e3, "us": 1e6, "ns": 1e9}[unit]
+    return {f"{name}_{unit}": round(value * scale, 3) for name, value in percentiles(seconds).items()}
+
+
+def best_of(function, repeats=3):
+    """Runs ``function`` ``repeats`` times and returns the fastest wall time in seconds and its result."""
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+
+def baseline_path(suite, directory=None):
+    return os.path.join(directory or BASELINE_DIR, f"{suite}.json")
+
+
+def save_baseline(suite, results, directory=None):
+    """Writes the results of one suite, together with the machine they were measured on."""
+    path = baseline_path(suite, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = {
+        "suite": suite,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare_to_baseline(suite, results, directory=None, tolerance=0.10):
+    """
+    Compares results with the saved baseline of the suite and prints every
+    metric that changed by more than ``tolerance``. Throughputs (``*_per_s``)
+    should not drop, latencies (``*_us``, ``*_ns``, ``*_ms``, ``*_s``) should not grow.
+
+    Returns:
+        list: ``(case, metric, baseline, current)`` for every regression.
+    """
+    path = baseline_path(suite, directory)
+    if not os.path.exists(path):
+        print(f"[{suite}] no baseline at {path}")
+        return []
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for case, metrics in results.items():
+        for metric, current in metrics.items():
+            previous = baseline.get(case, {}).get(metric)
+            if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or previous == 0:
+                continue
+            change = current / previous - 1
+            if metric.endswith("_per_s"):
+                worse = change < -tolerance
+            elif metric.rsplit("_", 1)[-1] in ("s", "ms", "us", "ns"):
+                worse = change > tolerance
+            else:
+                continue
+            if abs(change) > tolerance:
+                marker = "REGRESSION" if worse else "improved"
+                print(f"[{suite}] {case}.{metric}: {previous} -> {current} ({change:+.1%}) {marker}")
+            if worse:
+                regressions.append((case, metric, previous, current))
+    print(f"[{suite}] {len(regressions)} regressions beyond {tolerance:.0%} against {path}")
+    return regressions
+
+
+def print_results(suite, results):
+    print(f"\n===== {suite} =====")
+    for case, metrics in results.items():
+        formatted = ", ".join(f"{metric}={value}" for metric, value in metrics.items())
+        print(f"{case}: {formatted}")
@@ -1,47 +1,94 @@
 import json
+import os
 import pandas as pd
 from datasets import load_dataset
 from tqdm import tqdm
 
+from llm.batch_generation import generate_with_pda_batch
+from llm.beam_search import generate_with_pda_beam
+from llm.grammar_mask import build_mask_cache, load_vocab_index
+from llm.logits_processor import generate_with_logits_processor
 from llm.model_setup import load_model
+from llm.prefix_cache import PrefixCache
 from llm.pda_augmented_generation import generate_with_pda 
+from llm.speculative_decoding import generate_with_pda_speculative
 from llm.standard_generator import generate_standard
+from llm.tracing import TraceCollector
+from evaluation.parallel_runner import run_parallel_evaluation
+from evaluation.result_cache import GenerationCache, cache_key, source_version
 from pda.json_pda import JsonPDA
+from pda.schema_pda import cache_stats as schema_cache_stats, compile_schema
 
 def extract_prompt(prompt_list: list) -> str:
     """Extracts and combines system and user messages for the prompt."""
     return "\n".join(msg["content"] for msg in prompt_list if msg["role"] in ("system", "user"))
 
-def main():
-    """Main function to run the JSON evaluation pipeline for PDA-guided generation."""
-    # --- Evaluation Configuration ---
-   ## just uncomment aone model and comment the other to use one ##
-    MODEL_NAME = "deepseek-ai/deepseek-coder-1.3b-instruct"
-#    MODEL_NAME = "google/gemma-2-2b-it"
-    
+def extract_schema(prompt_list: list):
+    """Returns the JSON schema between <schema> tags of the system prompt, or None."""
+    for msg in prompt_list:
+        if msg["role"] != "system":
+            continue
+        content = msg["content"]
+        start = content.find("<schema>")
+        end = content.find("</schema>", start)
+        if start == -1 or end == -1:
+            continue
+        try:
+            return json.loads(content[start + len("<schema>"):end])
+        except json.JSONDecodeError:
+            return None
+    return None
 
-    DATASET_NAME = "NousResearch/json-mode-eval"
-    DATASET_SPLIT = "train"
-    NUM_SAMPLES = 100
+def load_examples(dataset_name: str, split: str, num_examples: int, snapshot_dir: str = None) -> list:
+    """
+    Returns the first ``num_examples`` raw examples (``prompt`` and
+    ``completion``) of the dataset.
 
+    With ``snapshot_dir`` they are read from a local JSON snapshot of the
+    dataset split when it holds enough of them. Otherwise the dataset is
+    streamed once and the snapshot is (re)written, so later runs work offline.
+    """
+    snapshot_path = None
+    if snapshot_dir is not None:
+        snapshot_path = os.path.join(snapshot_dir, f"{dataset_name.replace('/', '__')}-{split}.json")
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if len(snapshot["examples"]) >= num_examples or snapshot["exhausted"]:
+                return snapshot["examples"][:num_examples]
 
-    # --- Setup ---
-    print("Loading model and tokenizer...")
-    tokenizer, model = load_model(MODEL_NAME)
-    
-    print(f"Loading dataset '{DATASET_NAME}'...")
-    dataset = load_dataset(DATASET_NAME, split=DATASET_SPLIT, streaming=True)
-    
-    print(f"\n--- Starting Evaluation on {NUM_SAMPLES} samples ---")
+    dataset = load_dataset(dataset_name, split=split, streaming=True)
+    examples = []
     dataset_iterator = iter(dataset)
-    for i in range(NUM_SAMPLES):
+    exhausted = False
+    for _ in range(num_examples):
         try:
             example = next(dataset_iterator)
         except StopIteration:
+            exhausted = True
             break
+        examples.append({"prompt": example["prompt"], "completion": example["completion"]})
 
-        print(f"\n\n{'='*25} Processing Sample {i + 1} {'='*25}")
+    if snapshot_path is not None:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        temporary = snapshot_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"dataset": dataset_name, "split": split, "exhausted": exhausted, "examples": examples},
+                      f, ensure_ascii=False)
+        os.replace(temporary, snapshot_path)
+    return examples
 
+def load_samples(dataset_name: str, split: str, num_samples: int, snapshot_dir: str = None) -> list:
+    """
+    Loads the first ``num_samples`` examples of the dataset (see
+    ``load_examples``) and prepares them for generation.
+
+    Returns:
+        list: One dict per example with ``sample_id``, ``prompt``,
+        ``reference`` and ``schema`` (None if the prompt carries no schema).
+    """
+    samples = []
+    for i, example in enumerate(load_examples(dataset_name, split, num_samples, snapshot_dir)):
         prompt_str = extract_prompt(example["prompt"])
         reference_completion = example["completion"]
 
@@ -53,15 +100,198 @@ def main():
         prompt_str = prompt_str + explicit_instruction
 
         #######################################################################
-        
-        pda_gen = generate_with_pda(prompt_str, model, tokenizer, max_steps=200)
-        std_gen = generate_standard(prompt_str, model, tokenizer, max_new_tokens=200)
+
+        samples.append({
+            "sample_id": i,
+            "prompt": prompt_str,
+            "reference": reference_completion,
+            "schema": extract_schema(example["prompt"]),
+        })
+    return samples
+
+def main(num_workers: int = 0, output_dir: str = "results/json_evaluation", devices: list = None,
+         beam_size: int = None):
+    """
+    Main function to run the JSON evaluation pipeline for PDA-guided generation.
+
+    With ``num_workers`` > 0 the samples are sharded over that many worker
+    processes (spread over ``devices``) and the results are appended to
+    resumable JSONL files in ``output_dir`` instead of being printed.
+    ``beam_size`` overrides ``BEAM_SIZE`` below.
+    """
+    # --- Evaluation Configuration ---
+   ## just uncomment aone model and comment the other to use one ##
+    MODEL_NAME = "deepseek-ai/deepseek-coder-1.3b-instruct"
+#    MODEL_NAME = "google/gemma-2-2b-it"
+    
+
+    DATASET_NAME = "NousResearch/json-mode-eval"
+    DATASET_SPLIT = "train"
+    NUM_SAMPLES = 100
+    MAX_STEPS = 200  # tokens generated per sample by every generator
+    USE_VOCAB_MASK = True  # full-vocabulary grammar mask instead of top-k filtering
+    MAX_TOP_K = 1024  # candidates tried in growing chunks before a top-k step counts as a dead end
+    MASK_CACHE_SIZE = 512  # PDA configurations whose masks are kept in memory
+    BATCH_SIZE = 8  # prompts decoded together by the PDA generator; 1 runs them one at a time
+    PIPELINE_DEPTH = 4  # grammar masks computed on a worker thread while the batched forward runs; 0 disables it
+    JUMP_FORWARD = False  # append grammar-forced tokens without sampling; only the one-prompt-at-a-time generator (BATCH_SIZE = 1) supports it
+    USE_SCHEMA = True  # constrain generation with the sample's JSON schema, not just JSON syntax
+    PREFIX_CACHE_MB = 2048  # KV states of shared prompt prefixes kept between runs; 0 disables it
+    USE_LOGITS_PROCESSOR = False  # constrain model.generate with PDALogitsProcessor instead of the PDA loop (needs USE_VOCAB_MASK)
+    DRAFT_MODEL_NAME = None  # small model sharing MODEL_NAME's tokenizer for speculative decoding (needs USE_VOCAB_MASK); None disables it
+    NUM_DRAFT_TOKENS = 4  # tokens the draft model proposes per speculative round
+    TRACE_PATH = None  # JSONL file for per-step traces of the one-prompt-at-a-time PDA generator; None disables tracing
+    RESULT_CACHE_MB = 256  # on-disk cache of outputs, reused while model, prompt, settings and code are unchanged; 0 disables it
+    DATASET_SNAPSHOT_DIR = "cache/datasets"  # local copy of the dataset for offline reruns; None streams it every run
+    BEAM_SIZE = 1  # beams of the grammar-constrained beam search (one prompt at a time); 1 disables it
+    if beam_size is not None:
+        BEAM_SIZE = beam_size
+
+    # The generation settings above, as handed to the parallel runner, which
+    # warns about the ones its workers cannot apply.
+    options = {
+        "max_steps": MAX_STEPS, "max_top_k": MAX_TOP_K, "use_vocab_mask": USE_VOCAB_MASK,
+        "mask_cache_size": MASK_CACHE_SIZE, "batch_size": BATCH_SIZE, "pipeline_depth": PIPELINE_DEPTH,
+        "jump_forward": JUMP_FORWARD, "use_schema": USE_SCHEMA, "prefix_cache_mb": PREFIX_CACHE_MB,
+        "use_logits_processor": USE_LOGITS_PROCESSOR, "draft_model": DRAFT_MODEL_NAME,
+        "num_draft_tokens": NUM_DRAFT_TOKENS, "trace_path": TRACE_PATH, "result_cache_mb": RESULT_CACHE_MB,
+        "beam_size": BEAM_SIZE,
+    }
+
+    if num_workers > 0:
+        print(f"Loading dataset '{DATASET_NAME}'...")
+        samples = load_samples(DATASET_NAME, DATASET_SPLIT, NUM_SAMPLES, snapshot_dir=DATASET_SNAPSHOT_DIR)
+        run_parallel_evaluation(samples, MODEL_NAME, output_dir=output_dir, num_workers=num_workers,
+                                devices=devices, **options)
+        return
+
+    # --- Samples and cached results ---
+    print(f"Loading dataset '{DATASET_NAME}'...")
+    samples = load_samples(DATASET_NAME, DATASET_SPLIT, NUM_SAMPLES, snapshot_dir=DATASET_SNAPSHOT_DIR)
+    for sample in samples:
+        schema = sample["schema"] if USE_SCHEMA else None
+        sample["pda"] = compile_schema(schema).new_pda() if schema is not None else None
+
+    # Runs that replace the PDA loop decode one prompt at a time.
+    single_prompt = BEAM_SIZE > 1 or USE_VOCAB_MASK and (USE_LOGITS_PROCESSOR or DRAFT_MODEL_NAME is not None)
+    if BEAM_SIZE > 1:
+        pda_params = {"generator": "pda_beam", "beam_size": BEAM_SIZE}
+    elif USE_VOCAB_MASK and DRAFT_MODEL_NAME is not None:
+        pda_params = {"generator": "pda_speculative", "draft_model": DRAFT_MODEL_NAME,
+                      "num_draft_tokens": NUM_DRAFT_TOKENS}
+    elif single_prompt:
+        pda_params = {"generator": "pda_logits_processor"}
+    elif BATCH_SIZE > 1:
+        pda_params = {"generator": "pda_batch", "batch_size": BATCH_SIZE}
+    else:
+        pda_params = {"generator": "pda", "jump_forward": JUMP_FORWARD}
+    # Jump-forward and tracing are features of the PDA loop of generate_with_pda only.
+    pda_loop = pda_params["generator"] == "pda"
+    ignored = [name for name, value in (("JUMP_FORWARD", JUMP_FORWARD), ("TRACE_PATH", TRACE_PATH)) if value]
+    if ignored and not pda_loop:
+        print(f"--- WARNING: {' and '.join(ignored)} only apply to the one-prompt-at-a-time PDA generator "
+              f"(BATCH_SIZE = 1, no beam search, logits processor or draft model); "
+              f"'{pda_params['generator']}' ignores them ---")
+    pda_params.update(model=MODEL_NAME, max_steps=MAX_STEPS, max_top_k=MAX_TOP_K, vocab_mask=USE_VOCAB_MASK,
+                      pda_version=source_version("pda"), generator_version=source_version("llm"))
+    std_params = {"generator": "standard", "model": MODEL_NAME, "max_new_tokens": MAX_STEPS,
+                  "generator_version": source_version("llm/standard_generator.py", "llm/kv_cache.py",
+                                                      "llm/prefix_cache.py")}
+
+    result_cache = GenerationCache(max_megabytes=RESULT_CACHE_MB) if RESULT_CACHE_MB > 0 else None
+    pda_keys = [cache_key(**pda_params, prompt=sample["prompt"], schema=sample["schema"] if USE_SCHEMA else None)
+                for sample in samples]
+    std_keys = [cache_key(**std_params, prompt=sample["prompt"]) for sample in samples]
+    if result_cache is not None:
+        pda_outputs = [result_cache.get(key) for key in pda_keys]
+        std_outputs = [result_cache.get(key) for key in std_keys]
+    else:
+        pda_outputs = [None] * len(samples)
+        std_outputs = [None] * len(samples)
+    num_missing = sum(output is None for output in pda_outputs + std_outputs)
+
+    # --- Setup ---
+    model = tokenizer = mask_cache = prefix_cache = tracer = draft_model = None
+    if num_missing:
+        print("Loading model and tokenizer...")
+        tokenizer, model = load_model(MODEL_NAME)
+        if USE_VOCAB_MASK:
+            mask_cache = build_mask_cache(load_vocab_index(tokenizer), maxsize=MASK_CACHE_SIZE)
+        prefix_cache = PrefixCache(max_megabytes=PREFIX_CACHE_MB) if PREFIX_CACHE_MB > 0 else None
+        tracer = TraceCollector(TRACE_PATH) if TRACE_PATH and pda_loop else None
+        if BEAM_SIZE <= 1 and DRAFT_MODEL_NAME is not None and mask_cache is not None:
+            _, draft_model = load_model(DRAFT_MODEL_NAME)
+    else:
+        print("All outputs are cached; the model is not loaded.")
+
+    print(f"\n--- Starting Evaluation on {len(samples)} samples ({num_missing} outputs to generate) ---")
+    missing = [i for i, output in enumerate(pda_outputs) if output is None]
+    if BATCH_SIZE > 1 and not single_prompt and missing:
+        prompts = [samples[i]["prompt"] for i in missing]
+        pdas = [samples[i]["pda"] for i in missing]
+        batch_outputs = generate_with_pda_batch(
+            prompts, model, tokenizer, batch_size=BATCH_SIZE, max_steps=MAX_STEPS, vocab_trie=mask_cache, pdas=pdas,
+            prefix_cache=prefix_cache, max_top_k=MAX_TOP_K, pipeline_depth=PIPELINE_DEPTH,
+        )
+        for i, output in zip(missing, batch_outputs):
+            pda_outputs[i] = output
+            if result_cache is not None:
+                result_cache.put(pda_keys[i], output, **pda_params)
+
+    for i, sample in enumerate(samples):
+        print(f"\n\n{'='*25} Processing Sample {i + 1} {'='*25}")
+        prompt_str = sample["prompt"]
+        reference_completion = sample["reference"]
+
+        pda_gen = pda_outputs[i]
+        if pda_gen is None:
+            if BEAM_SIZE > 1:
+                pda_gen = generate_with_pda_beam(
+                    prompt_str, model, tokenizer, beam_width=BEAM_SIZE, max_steps=MAX_STEPS, vocab_trie=mask_cache,
+                    pda=sample["pda"],
+                )
+            elif draft_model is not None:
+                pda_gen = generate_with_pda_speculative(
+                    prompt_str, model, draft_model, tokenizer, mask_cache, max_steps=MAX_STEPS,
+                    num_draft_tokens=NUM_DRAFT_TOKENS, pda=sample["pda"], prefix_cache=prefix_cache,
+                )
+            elif USE_LOGITS_PROCESSOR and mask_cache is not None:
+                pda_gen = generate_with_logits_processor(
+                    prompt_str, model, tokenizer, mask_cache, max_new_tokens=MAX_STEPS, pda=sample["pda"],
+                    prefix_cache=prefix_cache,
+                )
+            else:
+                pda_gen = generate_with_pda(
+                    prompt_str, model, tokenizer, max_steps=MAX_STEPS, vocab_trie=mask_cache,
+                    jump_forward=JUMP_FORWARD, pda=sample["pda"], prefix_cache=prefix_cache,
+                    max_top_k=MAX_TOP_K, hooks=tracer,
+                )
+            if result_cache is not None:
+                result_cache.put(pda_keys[i], pda_gen, **pda_params)
+        std_gen = std_outputs[i]
+        if std_gen is None:
+            std_gen = generate_standard(prompt_str, model, tokenizer, max_new_tokens=MAX_STEPS, prefix_cache=prefix_cache)
+            if result_cache is not None:
+                result_cache.put(std_keys[i], std_gen, **std_params)
 
         print("\n--- Final Comparison ---")
         print(f"[PDA Output]:\n{pda_gen}")
         print(f"[Standard Output]:\n{std_gen}")
         print(f"\n[Reference JSON]:\n{reference_completion}")
+        if mask_cache is not None:
+            print(f"[Mask Cache]: {mask_cache.hits} hits, {mask_cache.misses} misses "
+                  f"({mask_cache.hit_rate:.1%} hit rate)")
         print("=" * 70)
 
+    if USE_SCHEMA:
+        print(f"[Schema Cache]: {schema_cache_stats['hits']} hits, {schema_cache_stats['misses']} compiled")
+    if prefix_cache is not None:
+        print(f"[Prefix Cache]: {prefix_cache.report()}")
+    if result_cache is not None:
+        print(f"[Result Cache]: {result_cache.report()}")
+    if tracer is not None:
+        tracer.close()
+        print(f"[Trace]: {TRACE_PATH}\n{tracer.report()}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,224 @@
+import json
+import multiprocessing as mp
+import os
+import time
+
+
+# Generation options the worker processes apply; run_parallel_evaluation requires all of them.
+WORKER_OPTIONS = ("max_steps", "max_top_k", "use_vocab_mask", "mask_cache_size", "jump_forward", "use_schema",
+                  "prefix_cache_mb", "beam_size")
+# Options of the in-process evaluation that the workers do not apply. The
+# dependent ones (pipeline_depth, num_draft_tokens) are only named through
+# the option they depend on.
+IGNORED_OPTIONS = ("batch_size", "pipeline_depth", "use_logits_processor", "draft_model", "num_draft_tokens",
+                   "trace_path", "result_cache_mb")
+
+
+def ignored_options(options):
+    """Names of the options that are set but that the workers cannot apply."""
+    ignored = ["batch_size"] if options.get("batch_size", 1) > 1 else []
+    ignored.extend(name for name in ("use_logits_processor", "draft_model", "trace_path", "result_cache_mb")
+                   if options.get(name))
+    return ignored
+
+
+def shard_path(output_dir: str, shard: int) -> str:
+    return os.path.join(output_dir, f"shard-{shard:03d}.jsonl")
+
+
+def read_results(output_dir: str) -> list:
+    """
+    Reads every record of every shard file in ``output_dir``. A line cut
+    short by a crash is skipped, so its sample is simply run again.
+    """
+    results = []
+    if not os.path.isdir(output_dir):
+        return results
+    for name in sorted(os.listdir(output_dir)):
+        if not (name.startswith("shard-") and name.endswith(".jsonl")):
+            continue
+        with open(os.path.join(output_dir, name), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "sample_id" in record:
+                    results.append(record)
+    return results
+
+
+def is_valid_json(text) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except (TypeError, json.JSONDecodeError):
+        return False
+
+
+def _run_shard(shard, samples, output_dir, model_name, device, options):
+    """Worker process: generates the outputs of one shard and appends them to its JSONL file."""
+    if device is not None:
+        # Must be set before CUDA is initialised in this process.
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device)
+
+    from llm.beam_search import generate_with_pda_beam
+    from llm.grammar_mask import build_mask_cache, load_vocab_index
+    from llm.model_setup import load_model
+    from llm.pda_augmented_generation import generate_with_pda
+    from llm.prefix_cache import PrefixCache
+    from llm.standard_generator import generate_standard
+    from pda.schema_pda import compile_schema
+
+    tokenizer, model = load_model(model_name)
+    mask_cache = None
+    if options["use_vocab_mask"]:
+        mask_cache = build_mask_cache(load_vocab_index(tokenizer), maxsize=options["mask_cache_size"])
+    prefix_cache = PrefixCache(max_megabytes=options["prefix_cache_mb"]) if options["prefix_cache_mb"] > 0 else None
+
+    path = shard_path(output_dir, shard)
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+
+    with open(path, "a", encoding="utf-8") as f:
+        if torn:
+            # Terminate a record cut short by a crash so the next one starts on its own line.
+            f.write("\n")
+        for sample in samples:
+            schema = sample["schema"] if options["use_schema"] else None
+            pda = compile_schema(schema).new_pda() if schema is not None else None
+
+            start = time.perf_counter()
+            if options["beam_size"] > 1:
+                pda_gen = generate_with_pda_beam(
+                    sample["prompt"], model, tokenizer, beam_width=options["beam_size"],
+                    max_steps=options["max_steps"], vocab_trie=mask_cache, pda=pda,
+                )
+            else:
+                pda_gen = generate_with_pda(
+                    sample["prompt"], model, tokenizer, max_steps=options["max_steps"],
+                    max_top_k=options["max_top_k"], vocab_trie=mask_cache, jump_forward=options["jump_forward"],
+                    pda=pda, prefix_cache=prefix_cache,
+                )
+            pda_seconds = time.perf_counter() - start
+            std_gen = generate_standard(
+                sample["prompt"], model, tokenizer, max_new_tokens=options["max_steps"], prefix_cache=prefix_cache
+            )
+            std_seconds = time.perf_counter() - start - pda_seconds
+
+            record = {
+                "sample_id": sample["sample_id"],
+                "shard": shard,
+                "pda_output": pda_gen,
+                "standard_output": std_gen,
+                "reference": sample["reference"],
+                "pda_seconds": round(pda_seconds, 3),
+                "standard_seconds": round(std_seconds, 3),
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def merge_results(output_dir: str) -> dict:
+    """
+    Merges all shard files into ``report.jsonl`` (ordered by sample id, one
+    record per sample) and a ``report.json`` summary, and returns the summary.
+    """
+    by_id = {}
+    for record in read_results(output_dir):
+        by_id[record["sample_id"]] = record
+    records = [by_id[sample_id] for sample_id in sorted(by_id)]
+
+    with open(os.path.join(output_dir, "report.jsonl"), "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    count = len(records)
+    summary = {
+        "num_samples": count,
+        "pda_valid_json": sum(is_valid_json(r["pda_output"]) for r in records),
+        "standard_valid_json": sum(is_valid_json(r["standard_output"]) for r in records),
+        "pda_seconds": round(sum(r["pda_seconds"] for r in records), 3),
+        "standard_seconds": round(sum(r["standard_seconds"] for r in records), 3),
+    }
+    with open(os.path.join(output_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_parallel_evaluation(
+    samples: list,
+    model_name: str,
+    output_dir: str = "results",
+    num_workers: int = 1,
+    devices: list = None,
+    **options,
+) -> dict:
+    """
+    Runs the JSON evaluation on ``samples`` across worker processes.
+
+    Samples are dealt round-robin into ``num_workers`` shards. Every worker
+    loads its own model, on ``devices[shard % len(devices)]`` if devices are
+    given, and appends each result to its shard's JSONL file as soon as it
+    is done. Samples whose id already appears in any shard file are skipped,
+    so a crashed or interrupted run resumes where it stopped.
+
+    Args:
+        samples (list): Sample dicts as returned by ``json_evaluation.load_samples``.
+        model_name (str): HuggingFace model to evaluate.
+        output_dir (str): Directory for the shard files and the merged report.
+        num_workers (int): Number of worker processes.
+        devices (list, optional): CUDA device indices to spread the workers over.
+        **options: Generation options: every name in ``WORKER_OPTIONS``, and
+            optionally those in ``IGNORED_OPTIONS``, which only produce a
+            warning when set.
+
+    Returns:
+        dict: The merged summary, also written to ``output_dir/report.json``.
+    """
+    unknown = set(options) - set(WORKER_OPTIONS) - set(IGNORED_OPTIONS)
+    missing = set(WORKER_OPTIONS) - set(options)
+    if unknown or missing:
+        raise ValueError(f"unknown options {sorted(unknown)}, missing options {sorted(missing)}")
+    ignored = ignored_options(options)
+    if ignored:
+        print(f"--- WARNING: the workers decode one prompt at a time with generate_with_pda (or beam search) "
+              f"and ignore {', '.join(ignored)} ---")
+    os.makedirs(output_dir, exist_ok=True)
+
+    done = {record["sample_id"] for record in read_results(output_dir)}
+    pending = [sample for sample in samples if sample["sample_id"] not in done]
+    print(f"--- {len(done)} samples already done, {len(pending)} to run on {num_workers} workers ---")
+
+    shards = [pending[shard::num_workers] for shard in range(num_workers)]
+    if num_workers == 1:
+        if shards[0]:
+            _run_shard(0, shards[0], output_dir, model_name, devices[0] if devices else None, options)
+    else:
+        context = mp.get_context("spawn")
+        processes = []
+        for shard, shard_samples in enumerate(shards):
+            if not shard_samples:
+                continue
+            device = devices[shard % len(devices)] if devices else None
+            process = context.Process(
+                target=_run_shard, args=(shard, shard_samples, output_dir, model_name, device, options)
+            )
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
+        failed = [process for process in processes if process.exitcode != 0]
+        if failed:
+            print(f"--- WARNING: {len(failed)} workers failed; rerun to resume their samples ---")
+
+    summary = merge_results(output_dir)
+    print(f"--- Report: {summary['num_samples']} samples, "
+          f"PDA valid JSON {summary['pda_valid_json']}, "
+          f"standard valid JSON {summary['standard_valid_json']} ---")
+    return summary
+
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "generations")
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _source_files(relative_path):
+    root = os.path.join(_PACKAGE_ROOT, relative_path)
+    if os.path.isfile(root):
+        yield root
+        return
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(name for name in subdirectories if name != "__pycache__")
+        for name in sorted(files):
+            if name.endswith((".py", ".ebnf")):
+                yield os.path.join(directory, name)
+
+
+def source_version(*relative_paths) -> str:
+    """
+    Hash of the given source files, and of the Python sources and grammar
+    files under the given directories, of the repository, e.g.
+    ``source_version("pda")`` for the PDA/grammar version. Any edit to
+    those files changes it.
+    """
+    digest = hashlib.sha256()
+    for relative_path in relative_paths:
+        for path in _source_files(relative_path):
+            digest.update(os.path.relpath(path, _PACKAGE_ROOT).replace(os.sep, "/").encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                digest.update(f.read().replace(b"\r\n", b"\n"))
+    return digest.hexdigest()[:16]
+
+
+def cache_key(**fields) -> str:
+    """Content address of a generation: a SHA-256 over the canonical JSON of its inputs."""
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    On-disk cache of generated outputs, one JSON file per key.
+
+    Keys come from ``cache_key`` over everything that determines an output
+    (model, generator, prompt, decoding parameters, PDA version), so a
+    changed prompt or setting simply misses and an unchanged one is read
+    back. Reading an entry refreshes its modification time; when the files
+    exceed ``max_megabytes`` the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_megabytes=256):
+        self.directory = directory
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(directory, name))
+                self._entries[name[:-5]] = [stat.st_mtime, stat.st_size]
+        self._total_bytes = sum(size for _, size in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Returns the cached output for ``key``, or None."""
+        if key in self._entries:
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    output = json.load(f)["output"]
+            except (OSError, ValueError, KeyError):
+                self._forget(key)
+            else:
+                now = time.time()
+                os.utime(self._path(key), (now, now))
+                self._entries[key][0] = now
+                self.hits += 1
+                return output
+        self.misses += 1
+        return None
+
+    def put(self, key, output, **metadata):
+        """Stores ``output`` under ``key``; ``metadata`` is saved alongside for inspection."""
+        data = json.dumps({"output": output, **metadata}, ensure_ascii=False).encode("utf-8")
+        temporary = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, self._path(key))
+        if key in self._entries:
+            self._total_bytes -= self._entries[key][1]
+        self._entries[key] = [time.time(), len(data)]
+        self._total_bytes += len(data)
+        self._evict()
+
+    def _forget(self, key):
+        _, size = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda key: self._entries[key][0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._forget(key)
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), "
+                f"{len(self._entries)} entries, {self._total_bytes / 1024 / 1024:.1f} MB")
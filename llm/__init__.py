@@ -1,4 +1,21 @@
 # llm/__init__.py
 
-from .model_setup import load_model
-from .generate_candidates import get_top_k_candidates
+# The public helpers are imported on first use, so importing a light module
+# such as llm.tracing or llm.serving does not pull in torch and transformers.
+# Helpers that only need the PDA (e.g. candidate filtering) live in the pda
+# package, next to the automata, and import without them as well.
+_LAZY_ATTRIBUTES = {
+    "load_model": "model_setup",
+    "get_top_k_candidates": "generate_candidates",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
\ No newline at end of file
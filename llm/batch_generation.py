@@ -0,0 +1,485 @@
+import multiprocessing as mp
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import torch
+
+from llm import kv_cache
+from llm.generate_candidates import top_k_from_logits
+from llm.grammar_mask import full_token_texts
+from llm.incremental_decoder import last_position_kwargs
+from llm.pda_augmented_generation import escalate_pda_candidate, extract_json, select_masked_token
+from pda.candidates import select_pda_candidate
+from pda.json_pda import JsonPDA
+from pda.mask_cache import TokenMaskCache
+from pda.vocab_index import VocabIndex
+
+
+def left_pad(sequences, pad_token_id):
+    """
+    Left-pads lists of token ids into ``input_ids`` and ``attention_mask``
+    tensors, so the last position of every row is a real token.
+    """
+    width = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        if ids:
+            input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, width - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+class _Row:
+    """Decoding state of one prompt in the batch."""
+
+    __slots__ = ("request_id", "pda", "generated_text", "json_started", "steps", "token_id")
+
+    def __init__(self, request_id, pda=None):
+        self.request_id = request_id
+        self.pda = pda.clone() if pda is not None else JsonPDA()
+        self.generated_text = ""
+        self.json_started = False
+        self.steps = 0
+        self.token_id = None
+
+
+class ContinuousBatchGenerator:
+    """
+    PDA-guided generation for many prompts with one batched forward per step.
+
+    Every row of the batch keeps its own PDA and is filtered independently.
+    Rows retire as soon as their PDA reaches ``END``, hit a dead end or use
+    up ``max_steps``; their slots are refilled from the queue of submitted
+    prompts before the next step, so the batch stays full until the queue
+    runs dry. Prompts are left-padded and the KV caches of newly admitted
+    rows are aligned with the running batch by padding the shorter side.
+    """
+
+    def __init__(self, model, tokenizer, batch_size=8, max_steps=500, top_k=50, vocab_trie=None, prefix_cache=None,
+                 max_top_k=1024):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = model.device
+        self.batch_size = batch_size
+        self.max_steps = max_steps
+        self.top_k = top_k
+        self.max_top_k = max_top_k
+        self.vocab_trie = vocab_trie
+        self.token_texts = full_token_texts(vocab_trie)
+        self.prefix_cache = prefix_cache
+        self.pad_token_id = tokenizer.pad_token_id
+        if self.pad_token_id is None:
+            self.pad_token_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+        self._forward_kwargs = last_position_kwargs(model)
+
+        self.queue = deque()
+        self.rows = []
+        self.past_key_values = None
+        self.attention_mask = None
+        self.positions = None
+        self.logits = None
+        self.num_generated_tokens = 0
+        self.num_forward_passes = 0
+        self.num_escalations = 0
+        self.max_escalation_depth = 0
+
+    def submit(self, request_id, prompt, pda=None):
+        """Queues a prompt; ``pda`` optionally replaces the default JsonPDA for it."""
+        self.queue.append((request_id, prompt, pda))
+
+    def has_pending(self):
+        return bool(self.queue or self.rows)
+
+    def step(self):
+        """
+        Admits queued prompts into free slots, picks one token per row and
+        runs the batched forward for the rows that continue.
+
+        Returns:
+            list: ``(request_id, json_text)`` for every row that finished in this step.
+        """
+        self._admit()
+        if not self.rows:
+            return []
+
+        finished = []
+        keep = []
+        next_token_ids = []
+        for index, row in enumerate(self.rows):
+            token_id = self._select(row, self.logits[index])
+            row.steps += 1
+            if token_id is None:
+                finished.append(row)
+                continue
+            self.num_generated_tokens += 1
+            if row.pda.state == "END" or row.steps >= self.max_steps:
+                finished.append(row)
+                continue
+            keep.append(index)
+            next_token_ids.append(token_id)
+
+        if len(keep) < len(self.rows):
+            self._retain(keep)
+        if self.rows:
+            self._decode(next_token_ids)
+
+        return [(row.request_id, extract_json(row.generated_text)) for row in finished]
+
+    def abort(self):
+        """
+        Drops every running and queued prompt, e.g. after a failed step, and
+        leaves the generator empty and usable.
+
+        Returns:
+            list: The request ids that were dropped.
+        """
+        request_ids = [row.request_id for row in self.rows] + [request_id for request_id, _, _ in self.queue]
+        self.queue.clear()
+        self._retain([])
+        return request_ids
+
+    def run(self):
+        """Steps until every submitted prompt has finished, yielding results in completion order."""
+        while self.has_pending():
+            for result in self.step():
+                yield result
+
+    def _select(self, row, logits):
+        if row.json_started and self.vocab_trie is not None:
+            choice = select_masked_token(logits, row.pda, self.vocab_trie)
+            if choice is None:
+                return None
+            token_id, token, row.pda = choice
+        else:
+            candidates = top_k_from_logits(logits, self.tokenizer, k=self.top_k, token_texts=self.token_texts)
+            choice = select_pda_candidate(candidates, row.pda, row.json_started)
+            if choice is None and self.max_top_k > self.top_k:
+                choice, _, depth = escalate_pda_candidate(
+                    logits, self.tokenizer, row.pda, row.json_started, self.top_k, self.max_top_k, self.token_texts
+                )
+                self.num_escalations += 1
+                self.max_escalation_depth = max(self.max_escalation_depth, depth)
+            if choice is None:
+                return None
+            token_id, token, row.pda, row.json_started = choice
+        row.generated_text += token
+        row.token_id = token_id
+        return token_id
+
+    def _admit(self):
+        free = self.batch_size - len(self.rows)
+        if free <= 0 or not self.queue:
+            return
+
+        admitted = [self.queue.popleft() for _ in range(min(free, len(self.queue)))]
+        sequences = [self.tokenizer(prompt).input_ids for _, prompt, _ in admitted]
+        input_ids, attention_mask = left_pad(sequences, self.pad_token_id)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+                position_ids=position_ids.to(self.device),
+                use_cache=True,
+                **self._forward_kwargs,
+            )
+        self.num_forward_passes += 1
+
+        new_cache = kv_cache.to_legacy(outputs.past_key_values)
+        if self.prefix_cache is not None:
+            # Publish each prompt's unpadded KV state for later single-prompt runs.
+            width = input_ids.shape[1]
+            for row, ids in enumerate(sequences):
+                start = width - len(ids)
+                row_cache = tuple((key[row:row + 1, :, start:, :], value[row:row + 1, :, start:, :])
+                                  for key, value in new_cache)
+                self.prefix_cache.insert(ids, row_cache)
+        new_mask = attention_mask.to(self.device)
+        new_positions = attention_mask.sum(-1).to(self.device)
+        new_logits = outputs.logits[:, -1, :]
+
+        if not self.rows:
+            cache, mask, positions, logits = new_cache, new_mask, new_positions, new_logits
+        else:
+            cache = kv_cache.to_legacy(self.past_key_values)
+            mask = self.attention_mask
+            difference = mask.shape[1] - new_mask.shape[1]
+            if difference > 0:
+                new_cache = kv_cache.pad_left(new_cache, difference)
+                new_mask = torch.cat([new_mask.new_zeros((new_mask.shape[0], difference)), new_mask], dim=1)
+            elif difference < 0:
+                cache = kv_cache.pad_left(cache, -difference)
+                mask = torch.cat([mask.new_zeros((mask.shape[0], -difference)), mask], dim=1)
+            cache = kv_cache.concat_rows(cache, new_cache)
+            mask = torch.cat([mask, new_mask], dim=0)
+            positions = torch.cat([self.positions, new_positions], dim=0)
+            logits = torch.cat([self.logits, new_logits], dim=0)
+
+        self.past_key_values = kv_cache.from_legacy(cache)
+        self.attention_mask = mask
+        self.positions = positions
+        self.logits = logits
+        self.rows.extend(_Row(request_id, pda) for request_id, _, pda in admitted)
+
+    def _retain(self, keep):
+        self.rows = [self.rows[index] for index in keep]
+        if not keep:
+            self.past_key_values = None
+            self.attention_mask = None
+            self.positions = None
+            self.logits = None
+            return
+        index = torch.tensor(keep, dtype=torch.long, device=self.device)
+        self.past_key_values = kv_cache.from_legacy(
+            kv_cache.select_rows(kv_cache.to_legacy(self.past_key_values), index)
+        )
+        self.attention_mask = self.attention_mask.index_select(0, index)
+        self.positions = self.positions.index_select(0, index)
+
+    def _decode(self, token_ids):
+        input_ids = torch.tensor(token_ids, dtype=torch.long, device=self.device).unsqueeze(-1)
+        self.attention_mask = torch.cat(
+            [self.attention_mask, self.attention_mask.new_ones((len(token_ids), 1))], dim=1
+        )
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=self.attention_mask,
+                position_ids=self.positions.unsqueeze(-1),
+                past_key_values=self.past_key_values,
+                use_cache=True,
+                **self._forward_kwargs,
+            )
+        self.num_forward_passes += 1
+        self.past_key_values = outputs.past_key_values
+        self.positions = self.positions + 1
+        self.logits = outputs.logits[:, -1, :]
+
+
+_worker_trie = None
+
+
+def _init_mask_worker(index_path, cache_size):
+    global _worker_trie
+    index = VocabIndex(index_path)
+    _worker_trie = TokenMaskCache(index, maxsize=cache_size) if cache_size > 0 else index
+
+
+def _worker_allowed_token_ids(pda):
+    start = time.perf_counter()
+    allowed = list(_worker_trie.allowed_token_ids(pda))
+    return allowed, time.perf_counter() - start
+
+
+class PipelinedBatchGenerator(ContinuousBatchGenerator):
+    """
+    ContinuousBatchGenerator that computes grammar masks while the model runs.
+
+    Once a row has picked its token, its new PDA state is known, so the
+    allowed tokens for its next step are submitted to a worker pool right
+    before the batched forward is launched and are ready (or nearly) when
+    the logits come back. At most ``pipeline_depth`` mask jobs are in
+    flight; rows beyond that, and rows still choosing from the top-k before
+    their JSON has started, are handled in the step as before.
+
+    With ``mask_executor="thread"`` the workers share the generator's
+    ``vocab_trie``. With ``"process"`` every worker opens the memory-mapped
+    VocabIndex behind it (see ``llm.grammar_mask.load_vocab_index``) and
+    keeps its own mask cache, which sidesteps the GIL at the cost of
+    pickling each PDA.
+
+    ``pipeline_stats`` measures the overlap: time spent in forward passes
+    (device busy), the rest of the step wall time (device idle), the mask
+    time spent by the workers and how long the step waited for it. Mask
+    time that was not waited for ran concurrently with a forward pass.
+    """
+
+    def __init__(self, model, tokenizer, pipeline_depth=8, mask_workers=1, mask_executor="thread", **kwargs):
+        super().__init__(model, tokenizer, **kwargs)
+        if self.vocab_trie is None:
+            raise ValueError("PipelinedBatchGenerator needs a vocab_trie to compute grammar masks")
+        self.pipeline_depth = pipeline_depth
+        if mask_executor == "process":
+            index = getattr(self.vocab_trie, "vocab_trie", self.vocab_trie)
+            if not isinstance(index, VocabIndex):
+                raise ValueError("mask_executor='process' needs a VocabIndex, see llm.grammar_mask.load_vocab_index")
+            self.executor = ProcessPoolExecutor(
+                max_workers=mask_workers, mp_context=mp.get_context("spawn"),
+                initializer=_init_mask_worker, initargs=(index.path, getattr(self.vocab_trie, "maxsize", 0)),
+            )
+            self._mask_job = _worker_allowed_token_ids
+        elif mask_executor == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=mask_workers)
+            self._mask_job = self._allowed_token_ids
+        else:
+            raise ValueError(f"unknown mask_executor {mask_executor!r}, expected 'thread' or 'process'")
+        self._pending = {}
+        self.pipeline_stats = {
+            "device_busy_seconds": 0.0,
+            "device_idle_seconds": 0.0,
+            "mask_seconds": 0.0,
+            "mask_wait_seconds": 0.0,
+            "prefetched_masks": 0,
+            "inline_masks": 0,
+        }
+
+    def _allowed_token_ids(self, pda):
+        # Thread-safe without a lock here: the trie walk is read-only and a
+        # TokenMaskCache only locks around its own lookup and insert.
+        start = time.perf_counter()
+        allowed = self.vocab_trie.allowed_token_ids(pda)
+        return allowed, time.perf_counter() - start
+
+    def step(self):
+        stats = self.pipeline_stats
+        start = time.perf_counter()
+        busy = stats["device_busy_seconds"]
+        finished = super().step()
+        stats["device_idle_seconds"] += time.perf_counter() - start - (stats["device_busy_seconds"] - busy)
+        return finished
+
+    def _select(self, row, logits):
+        if not row.json_started:
+            return super()._select(row, logits)
+
+        stats = self.pipeline_stats
+        future = self._pending.pop(row, None)
+        wait_start = time.perf_counter()
+        if future is not None:
+            allowed, seconds = future.result()
+            stats["prefetched_masks"] += 1
+        else:
+            allowed, seconds = self._allowed_token_ids(row.pda)
+            stats["inline_masks"] += 1
+        stats["mask_wait_seconds"] += time.perf_counter() - wait_start
+        stats["mask_seconds"] += seconds
+
+        choice = select_masked_token(logits, row.pda, self.vocab_trie, allowed)
+        if choice is None:
+            return None
+        token_id, token, row.pda = choice
+        row.generated_text += token
+        row.token_id = token_id
+        return token_id
+
+    def _prefetch_masks(self):
+        for row in [row for row in self._pending if row not in self.rows]:
+            self._pending.pop(row).cancel()
+        for row in self.rows:
+            if len(self._pending) >= self.pipeline_depth:
+                break
+            if row.json_started and row not in self._pending:
+                self._pending[row] = self.executor.submit(self._mask_job, row.pda)
+
+    def _timed_forward(self, forward, *args):
+        start = time.perf_counter()
+        forward(*args)
+        if self.device.type == "cuda":
+            # Forward kernels run asynchronously; wait for them so busy time is device time.
+            torch.cuda.synchronize(self.device)
+        self.pipeline_stats["device_busy_seconds"] += time.perf_counter() - start
+
+    def _admit(self):
+        self._timed_forward(super()._admit)
+
+    def _decode(self, token_ids):
+        self._prefetch_masks()
+        self._timed_forward(super()._decode, token_ids)
+
+    def pipeline_report(self):
+        stats = self.pipeline_stats
+        overlapped = max(stats["mask_seconds"] - stats["mask_wait_seconds"], 0.0)
+        host_idle = max(stats["device_busy_seconds"] - overlapped, 0.0)
+        return (f"device busy {stats['device_busy_seconds']:.2f}s, device idle {stats['device_idle_seconds']:.2f}s, "
+                f"mask work {stats['mask_seconds']:.2f}s of which {overlapped:.2f}s overlapped a forward, "
+                f"waited {stats['mask_wait_seconds']:.2f}s for masks, host idle during forwards {host_idle:.2f}s "
+                f"({stats['prefetched_masks']} prefetched, {stats['inline_masks']} inline masks)")
+
+    def abort(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        return super().abort()
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self.executor.shutdown(wait=True)
+
+
+def generate_with_pda_batch(
+    prompts: list,
+    model,
+    tokenizer,
+    batch_size: int = 8,
+    max_steps: int = 500,
+    top_k: int = 50,
+    vocab_trie=None,
+    pdas=None,
+    prefix_cache=None,
+    max_top_k: int = 1024,
+    pipeline_depth: int = 0,
+    mask_workers: int = 1,
+    mask_executor: str = "thread",
+) -> list:
+    """
+    Generate syntactically valid JSON for many prompts with continuous batching.
+
+    Args:
+        prompts (list): The input prompts.
+        model: A HuggingFace CausalLM model instance.
+        tokenizer: The corresponding tokenizer.
+        batch_size (int): Number of prompts decoded together in one forward pass.
+        max_steps (int): Maximum number of tokens generated per prompt.
+        top_k (int): Candidates checked per step when no vocab_trie is given.
+        vocab_trie: Optional VocabTrie, VocabIndex or TokenMaskCache for full-vocabulary masking.
+        pdas (list, optional): One automaton per prompt (None entries use a JsonPDA).
+        prefix_cache (PrefixCache, optional): Receives the KV state of every prompt.
+        max_top_k (int): Ceiling of the candidate escalation when none of the top_k is valid.
+        pipeline_depth (int): Grammar masks computed ahead, overlapped with the
+            forward pass (see PipelinedBatchGenerator); 0 disables pipelining.
+        mask_workers (int): Worker threads or processes computing the masks.
+        mask_executor (str): ``"thread"`` or ``"process"``.
+
+    Returns:
+        list: The generated JSON strings, in the order of ``prompts``.
+    """
+    options = dict(batch_size=batch_size, max_steps=max_steps, top_k=top_k, vocab_trie=vocab_trie,
+                   prefix_cache=prefix_cache, max_top_k=max_top_k)
+    pipelined = pipeline_depth > 0 and vocab_trie is not None
+    if pipelined:
+        generator = PipelinedBatchGenerator(
+            model, tokenizer, pipeline_depth=pipeline_depth, mask_workers=mask_workers,
+            mask_executor=mask_executor, **options,
+        )
+    else:
+        generator = ContinuousBatchGenerator(model, tokenizer, **options)
+    for index, prompt in enumerate(prompts):
+        generator.submit(index, prompt, pdas[index] if pdas is not None else None)
+
+    print(f"--- Starting Batched PDA-Guided JSON Generation ({len(prompts)} prompts, batch size {batch_size}) ---")
+    start_time = time.perf_counter()
+
+    results = [None] * len(prompts)
+    try:
+        for index, json_text in generator.run():
+            results[index] = json_text
+    finally:
+        if pipelined:
+            generator.close()
+
+    elapsed = time.perf_counter() - start_time
+    num_tokens = generator.num_generated_tokens
+    tokens_per_second = num_tokens / elapsed if elapsed > 0 else 0.0
+    print(f"--- Generated {num_tokens} tokens in {elapsed:.2f}s ({tokens_per_second:.1f} tokens/s, "
+          f"{generator.num_forward_passes} forward passes) ---")
+    if generator.num_escalations:
+        print(f"--- Top-k escalated in {generator.num_escalations} steps "
+              f"(max depth {generator.max_escalation_depth}) ---")
+    if pipelined:
+        print(f"--- Pipeline: {generator.pipeline_report()} ---")
+    return results
@@ -0,0 +1,182 @@
+import time
+
+import torch
+
+from llm import kv_cache
+from llm.grammar_mask import apply_grammar_mask, full_token_texts
+from llm.incremental_decoder import last_position_kwargs
+from llm.pda_augmented_generation import extract_json
+from pda.candidates import valid_pda_candidates
+from pda.json_pda import JsonPDA
+
+
+class _Hypothesis:
+    """
+    One beam. The generated text is a linked list of ``(token, parent)``
+    pairs and the PDA is persistent, so expanding a beam shares everything
+    it has in common with its parent instead of copying it.
+    """
+
+    __slots__ = ("text", "pda", "json_started", "score", "length")
+
+    def __init__(self, text, pda, json_started, score, length):
+        self.text = text
+        self.pda = pda
+        self.json_started = json_started
+        self.score = score
+        self.length = length
+
+    def normalized_score(self, length_penalty):
+        return self.score / (max(self.length, 1) ** length_penalty)
+
+    def generated_text(self):
+        tokens = []
+        node = self.text
+        while node is not None:
+            tokens.append(node[0])
+            node = node[1]
+        return "".join(reversed(tokens))
+
+
+def _expansions(hypothesis, log_probs, tokenizer, beam_width, top_k, vocab_trie, token_texts=None):
+    """Yields ``(token_id, token, new_pda, json_started, log_prob)`` for the grammatical expansions of a beam."""
+    if hypothesis.json_started and vocab_trie is not None:
+        allowed_token_ids = vocab_trie.allowed_token_ids(hypothesis.pda)
+        if len(allowed_token_ids) == 0:
+            return
+        masked = apply_grammar_mask(log_probs, allowed_token_ids)
+        values, indices = torch.topk(masked, min(beam_width, len(allowed_token_ids)))
+        for log_prob, token_id in zip(values.tolist(), indices.tolist()):
+            token = vocab_trie.token_texts[token_id]
+            new_pda = hypothesis.pda.clone()
+            new_pda.consume_token(token)
+            yield token_id, token, new_pda, True, log_prob
+        return
+
+    values, indices = torch.topk(log_probs, min(top_k, log_probs.shape[-1]))
+    if token_texts is not None:
+        candidates = [(token_id, token_texts[token_id]) for token_id in indices.tolist()]
+    else:
+        candidates = [(token_id, tokenizer.decode([token_id])) for token_id in indices.tolist()]
+    log_prob_of = dict(zip(indices.tolist(), values.tolist()))
+    found = 0
+    for token_id, token, new_pda, json_started in valid_pda_candidates(candidates, hypothesis.pda, hypothesis.json_started):
+        yield token_id, token, new_pda, json_started, log_prob_of[token_id]
+        found += 1
+        if found == beam_width:
+            return
+
+
+def generate_with_pda_beam(
+    prompt: str,
+    model,
+    tokenizer,
+    beam_width: int = 4,
+    max_steps: int = 500,
+    top_k: int = 50,
+    length_penalty: float = 1.0,
+    vocab_trie=None,
+    pda=None,
+) -> str:
+    """
+    Generate syntactically valid JSON with grammar-constrained beam search.
+
+    The prompt is prefilled once and its KV cache is shared by all beams. At
+    every step each beam proposes its best grammatical continuations; tokens
+    the PDA rejects are pruned before they reach the model, so only surviving
+    beams cost a row in the next batched forward. A beam finishes when its
+    PDA reaches ``END``, and finished beams are ranked by their log
+    probability divided by ``length ** length_penalty``.
+
+    The KV cache follows the beams: after a step, the rows of beams whose
+    parent changed are copied from their parent's row, from the end of the
+    prompt on (see ``kv_cache.reorder_rows``). Steps where every surviving
+    beam extends its own row copy nothing; a change in the number of beams
+    copies the whole cache once.
+
+    Args:
+        prompt (str): The input text for the model.
+        model: A HuggingFace CausalLM model instance.
+        tokenizer: The corresponding tokenizer.
+        beam_width (int): Number of beams kept per step.
+        max_steps (int): Maximum number of generated tokens.
+        top_k (int): Candidates checked per beam when no vocab_trie is given.
+        length_penalty (float): Exponent of the length normalization; 0 disables it.
+        vocab_trie: Optional VocabTrie, VocabIndex or TokenMaskCache for full-vocabulary
+            masking. A VocabIndex also replaces the decoding of top-k candidates with a lookup.
+        pda (optional): Automaton to start from instead of a fresh JsonPDA.
+
+    Returns:
+        str: The generated JSON of the best-scoring beam.
+    """
+    device = model.device
+    forward_kwargs = last_position_kwargs(model)
+    token_texts = full_token_texts(vocab_trie)
+    input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device)
+    prompt_length = input_ids.shape[1]
+
+    print(f"--- Starting PDA-Guided JSON Beam Search (beam width {beam_width}) ---")
+    start_time = time.perf_counter()
+
+    with torch.no_grad():
+        outputs = model(input_ids=input_ids, use_cache=True, **forward_kwargs)
+    num_forward_passes = 1
+    past_key_values = outputs.past_key_values
+    logits = outputs.logits[:, -1, :]
+
+    beams = [_Hypothesis(None, pda.clone() if pda is not None else JsonPDA(), False, 0.0, 0)]
+    finished = []
+
+    for step in range(max_steps):
+        log_probs = torch.log_softmax(logits.float(), dim=-1)
+
+        expansions = []
+        for beam_index, beam in enumerate(beams):
+            for token_id, token, new_pda, json_started, log_prob in _expansions(
+                beam, log_probs[beam_index], tokenizer, beam_width, top_k, vocab_trie, token_texts
+            ):
+                expansions.append((beam.score + log_prob, beam_index, token_id, token, new_pda, json_started))
+
+        expansions.sort(key=lambda expansion: expansion[0], reverse=True)
+        next_beams = []
+        parents = []
+        next_token_ids = []
+        for score, beam_index, token_id, token, new_pda, json_started in expansions:
+            parent = beams[beam_index]
+            hypothesis = _Hypothesis((token, parent.text), new_pda, json_started, score, parent.length + 1)
+            if new_pda.state == "END":
+                finished.append(hypothesis)
+            else:
+                next_beams.append(hypothesis)
+                parents.append(beam_index)
+                next_token_ids.append(token_id)
+            if len(next_beams) == beam_width:
+                break
+
+        if len(finished) >= beam_width or not next_beams or step == max_steps - 1:
+            beams = next_beams
+            break
+
+        # Only the beams whose parent changed are rewritten, and only after the shared prompt.
+        legacy = kv_cache.reorder_rows(kv_cache.to_legacy(past_key_values), parents, shared_length=prompt_length)
+        with torch.no_grad():
+            outputs = model(
+                input_ids=torch.tensor(next_token_ids, dtype=torch.long, device=device).unsqueeze(-1),
+                past_key_values=kv_cache.from_legacy(legacy),
+                use_cache=True,
+                **forward_kwargs,
+            )
+        num_forward_passes += 1
+        past_key_values = outputs.past_key_values
+        logits = outputs.logits[:, -1, :]
+        beams = next_beams
+
+    candidates = finished or beams
+    elapsed = time.perf_counter() - start_time
+    print(f"--- Beam search finished in {elapsed:.2f}s ({num_forward_passes} forward passes, "
+          f"{len(finished)} complete beams) ---")
+    if not candidates:
+        return "{}"
+
+    best = max(candidates, key=lambda hypothesis: hypothesis.normalized_score(length_penalty))
+    return extract_json(best.generated_text())
@@ -1,5 +1,44 @@
 import torch
 
+
+def _token_texts(token_ids, tokenizer, token_texts):
+    if token_texts is not None:
+        return [(idx, token_texts[idx]) for idx in token_ids]
+    return [(idx, tokenizer.decode([idx])) for idx in token_ids]
+
+
+def top_k_from_logits(logits, tokenizer, k=10, token_texts=None):
+    """
+    Returns the k most likely next tokens of a 1-D logits vector as
+    ``(token_id, token_text)`` pairs, ordered from most to least likely.
+
+    With ``token_texts`` (the per-id texts of a ``pda.vocab_index.VocabIndex``)
+    the texts are looked up instead of decoded.
+    """
+    k = min(k, logits.shape[-1])
+    _, top_k_indices = torch.topk(logits, k, dim=-1)
+    return _token_texts(top_k_indices.tolist(), tokenizer, token_texts)
+
+
+def next_candidate_chunks(logits, tokenizer, start, max_k, token_texts=None):
+    """
+    Lazily yields the tokens ranked ``start`` to ``max_k`` in chunks that
+    double the number of ranked tokens each time (``start..2*start``,
+    ``2*start..4*start``, ...).
+
+    Every chunk is cut from a ``topk`` over the logits that are already in
+    memory, so the model is not run again, the vocabulary is never fully
+    sorted and tokens are only decoded once their chunk is reached.
+    """
+    max_k = min(max_k, logits.shape[-1])
+    start = max(start, 1)
+    while start < max_k:
+        end = min(2 * start, max_k)
+        _, top_k_indices = torch.topk(logits, end, dim=-1)
+        yield _token_texts(top_k_indices[start:end].tolist(), tokenizer, token_texts)
+        start = end
+
+
 def get_top_k_candidates(prompt, k=10, model=None, tokenizer=None):
     if model is None or tokenizer is None:
         raise ValueError("Must provide both model and tokenizer")
@@ -11,6 +50,4 @@ def get_top_k_candidates(prompt, k=10, model=None, tokenizer=None):
         outputs = model(input_ids)
         logits = outputs.logits[:, -1, :]  
 
-    top_k_probs, top_k_indices = torch.topk(logits, k, dim=-1)
-    tokens = [tokenizer.decode([idx]) for idx in top_k_indices[0]]
-    return tokens
+    return [token for _, token in top_k_from_logits(logits[0], tokenizer, k)]
@@ -0,0 +1,106 @@
+import hashlib
+import os
+
+import torch
+
+from pda.mask_cache import TokenMaskCache
+from pda.vocab_index import TokenTexts, VocabIndex, write_vocab_index
+from pda.vocab_trie import VocabTrie
+
+VOCAB_INDEX_DIR = os.path.join("cache", "vocab_index")
+
+
+def build_vocab_trie(tokenizer):
+    """
+    Builds a VocabTrie from every non-special token of the tokenizer, decoded
+    the same way candidates are decoded during generation.
+    """
+    special_ids = set(tokenizer.all_special_ids)
+    tokens = (
+        (token_id, tokenizer.decode([token_id]))
+        for token_id in range(len(tokenizer))
+        if token_id not in special_ids
+    )
+    return VocabTrie(tokens)
+
+
+def apply_grammar_mask(logits, allowed_token_ids):
+    """
+    Returns a copy of the logits in which every token outside
+    ``allowed_token_ids`` is set to ``-inf``.
+    """
+    if not torch.is_tensor(allowed_token_ids):
+        allowed_token_ids = torch.as_tensor(allowed_token_ids, dtype=torch.long)
+    masked = torch.full_like(logits, float("-inf"))
+    index = allowed_token_ids.to(logits.device)
+    masked.index_copy_(-1, index, logits.index_select(-1, index))
+    return masked
+
+
+def build_mask_cache(vocab_trie, maxsize=256):
+    """
+    Wraps a VocabTrie in a TokenMaskCache that stores the allowed ids of each
+    PDA configuration as a ready-to-use index tensor.
+    """
+    return TokenMaskCache(
+        vocab_trie,
+        maxsize=maxsize,
+        transform=lambda ids: torch.as_tensor(ids, dtype=torch.long),
+    )
+
+
+def normalized_token_texts(tokenizer):
+    """
+    Decodes every token id on its own, keeping the leading space of the
+    word-initial tokens of SentencePiece and byte-level BPE vocabularies.
+
+    Some tokenizers drop that space when a token is decoded alone, so each
+    token is decoded after a fixed anchor token and the anchor's text is cut
+    off again.
+    """
+    anchor = tokenizer("a", add_special_tokens=False).input_ids[-1:]
+    anchor_text = tokenizer.decode(anchor, clean_up_tokenization_spaces=False)
+    texts = []
+    for token_id in range(len(tokenizer)):
+        text = tokenizer.decode(anchor + [token_id], clean_up_tokenization_spaces=False)
+        if anchor and text.startswith(anchor_text):
+            text = text[len(anchor_text):]
+        else:
+            text = tokenizer.decode([token_id], clean_up_tokenization_spaces=False)
+        texts.append(text)
+    return texts
+
+
+def vocab_index_path(tokenizer, directory=VOCAB_INDEX_DIR):
+    """Path of the tokenizer's index, named after a hash of its vocabulary."""
+    digest = hashlib.sha256()
+    digest.update(f"{type(tokenizer).__name__}\0{tokenizer.name_or_path}\0{len(tokenizer)}\0".encode("utf-8"))
+    for piece, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1]):
+        digest.update(f"{token_id}\0{piece}\0".encode("utf-8"))
+    digest.update(repr(sorted(tokenizer.all_special_ids)).encode("utf-8"))
+    name = os.path.basename(tokenizer.name_or_path.rstrip("/")) or "tokenizer"
+    return os.path.join(directory, f"{name}-{digest.hexdigest()[:16]}.vocab")
+
+
+def load_vocab_index(tokenizer, directory=VOCAB_INDEX_DIR):
+    """
+    Opens the memory-mapped VocabIndex of the tokenizer, building it first if
+    ``directory`` has none for this vocabulary. Workers on one node that use
+    the same directory share the file, and only the first run pays for
+    decoding the vocabulary.
+    """
+    path = vocab_index_path(tokenizer, directory)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        print(f"--- Building vocabulary index {path} ---")
+        write_vocab_index(path, normalized_token_texts(tokenizer), excluded_ids=tokenizer.all_special_ids)
+    return VocabIndex(path)
+
+
+def full_token_texts(vocab_trie):
+    """
+    The per-id text table of a VocabIndex (or of a TokenMaskCache around
+    one), or None for a VocabTrie, whose texts leave out special tokens.
+    """
+    token_texts = getattr(vocab_trie, "token_texts", None)
+    return token_texts if isinstance(token_texts, TokenTexts) else None
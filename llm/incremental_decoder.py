@@ -0,0 +1,114 @@
+import inspect
+
+import torch
+
+from llm import kv_cache
+
+
+def last_position_kwargs(model):
+    """
+    Returns the forward kwargs that make the model compute logits for the
+    last position only, if the installed transformers version supports it.
+    """
+    parameters = inspect.signature(model.forward).parameters
+    if "logits_to_keep" in parameters:
+        return {"logits_to_keep": 1}
+    if "num_logits_to_keep" in parameters:
+        return {"num_logits_to_keep": 1}
+    return {}
+
+
+class IncrementalDecoder:
+    """
+    Token-id based decoding engine that keeps the model's KV cache between steps.
+
+    The prompt is tokenized and prefilled once. Every following step feeds
+    only the newly accepted token id together with ``past_key_values`` and
+    reads the logits of the last position, so generating n tokens costs n
+    single-token forward passes instead of n re-encodings of the full text.
+
+    With a PrefixCache, prefill starts from the KV state of the longest
+    cached prefix of the prompt and stores the prompt's KV state afterwards.
+    """
+
+    def __init__(self, model, tokenizer, prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.device = model.device
+        self._forward_kwargs = last_position_kwargs(model)
+        self.reset()
+
+    def reset(self):
+        self.past_key_values = None
+        self.num_prompt_tokens = 0
+        self.num_generated_tokens = 0
+        self.num_forward_passes = 0
+
+    def prefill(self, prompt):
+        """Encodes the prompt into a fresh KV cache and returns the next-token logits."""
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids
+        self.reset()
+        self.num_prompt_tokens = input_ids.shape[1]
+        if self.prefix_cache is None:
+            return self._forward(input_ids)
+
+        # At least the last prompt token is run to get the next-token logits.
+        token_ids = input_ids[0].tolist()
+        matched, legacy = self.prefix_cache.lookup(token_ids[:-1])
+        if matched:
+            self.past_key_values = kv_cache.from_legacy(legacy)
+            input_ids = input_ids[:, matched:]
+        logits = self._forward(input_ids)
+        self.prefix_cache.insert(token_ids, kv_cache.to_legacy(self.past_key_values))
+        return logits
+
+    def step(self, token_id):
+        """Feeds one accepted token id and returns the logits for the following position."""
+        return self.extend([token_id])
+
+    def extend(self, token_ids):
+        """
+        Feeds several token ids in a single forward pass and returns the
+        logits after the last of them.
+        """
+        input_ids = torch.tensor([[int(token_id) for token_id in token_ids]])
+        self.num_generated_tokens += len(token_ids)
+        return self._forward(input_ids)
+
+    def extend_all(self, token_ids):
+        """
+        Like ``extend``, but returns the logits after each of the token ids,
+        as a (len(token_ids), vocab) tensor, e.g. to verify draft tokens.
+        """
+        input_ids = torch.tensor([[int(token_id) for token_id in token_ids]])
+        self.num_generated_tokens += len(token_ids)
+        return self._forward(input_ids, num_logits=len(token_ids))
+
+    @property
+    def cache_length(self):
+        if self.past_key_values is None:
+            return 0
+        return kv_cache.cache_length(kv_cache.to_legacy(self.past_key_values))
+
+    def crop(self, length):
+        """Drops the cached positions from ``length`` on, e.g. rejected draft tokens."""
+        legacy = kv_cache.to_legacy(self.past_key_values)
+        self.past_key_values = kv_cache.from_legacy(kv_cache.crop(legacy, length))
+
+    def _forward(self, input_ids, num_logits=1):
+        forward_kwargs = self._forward_kwargs
+        if num_logits != 1:
+            forward_kwargs = {key: num_logits for key in forward_kwargs}
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids.to(self.device),
+                past_key_values=self.past_key_values,
+                use_cache=True,
+                **forward_kwargs,
+            )
+        self.past_key_values = outputs.past_key_values
+        self.num_forward_passes += 1
+        if num_logits != 1:
+            return outputs.logits[0, -num_logits:, :]
+        return outputs.logits[0, -1, :]
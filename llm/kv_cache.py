@@ -0,0 +1,86 @@
+import torch
+
+
+def to_legacy(past_key_values):
+    """Returns the cache as a tuple of per-layer ``(key, value)`` tensors of shape (B, H, T, D)."""
+    if past_key_values is None:
+        return None
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(past_key_values)
+
+
+def from_legacy(legacy):
+    """Wraps a legacy tuple cache into the cache class the installed transformers version expects."""
+    if legacy is None:
+        return None
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return legacy
+    return DynamicCache.from_legacy_cache(legacy)
+
+
+def cache_length(legacy):
+    return legacy[0][0].shape[-2]
+
+
+def select_rows(legacy, rows):
+    """Keeps (and reorders) the batch rows given by an index tensor or list."""
+    index = torch.as_tensor(rows, dtype=torch.long, device=legacy[0][0].device)
+    return tuple((key.index_select(0, index), value.index_select(0, index)) for key, value in legacy)
+
+
+def reorder_rows(legacy, rows, shared_length=0):
+    """
+    ``select_rows`` for beam search, where each row of the result copies
+    row ``rows[i]`` of the cache.
+
+    The identity returns the cache as is. If the number of rows stays the
+    same, only the rows whose source row changes are rewritten, in place,
+    and only from position ``shared_length`` on: positions before it (a
+    prompt prefilled once for every beam) are equal in all rows. That costs
+    ``changed rows x (length - shared_length)`` positions per layer instead
+    of the full ``rows x length`` copy of ``select_rows``, which is still
+    used when the number of rows changes. Do not pass a cache whose tensors
+    are shared with another cache (e.g. views returned by ``crop``).
+    """
+    rows = [int(row) for row in rows]
+    if legacy[0][0].shape[0] != len(rows):
+        return select_rows(legacy, rows)
+    targets = [target for target, source in enumerate(rows) if target != source]
+    if not targets:
+        return legacy
+    device = legacy[0][0].device
+    target_index = torch.tensor(targets, dtype=torch.long, device=device)
+    source_index = torch.tensor([rows[target] for target in targets], dtype=torch.long, device=device)
+    for key, value in legacy:
+        # The right-hand side is gathered into a new tensor first, so swapped rows are safe.
+        key[target_index, :, shared_length:] = key[source_index, :, shared_length:]
+        value[target_index, :, shared_length:] = value[source_index, :, shared_length:]
+    return legacy
+
+
+def pad_left(legacy, length):
+    """Prepends ``length`` zero positions to every layer of the cache."""
+    if length == 0:
+        return legacy
+    padded = []
+    for key, value in legacy:
+        key_pad = key.new_zeros(key.shape[:-2] + (length, key.shape[-1]))
+        value_pad = value.new_zeros(value.shape[:-2] + (length, value.shape[-1]))
+        padded.append((torch.cat([key_pad, key], dim=-2), torch.cat([value_pad, value], dim=-2)))
+    return tuple(padded)
+
+
+def concat_rows(first, second):
+    """Stacks two caches of equal length along the batch dimension."""
+    return tuple(
+        (torch.cat([k1, k2], dim=0), torch.cat([v1, v2], dim=0))
+        for (k1, v1), (k2, v2) in zip(first, second)
+    )
+
+
+def crop(legacy, length):
+    """Keeps the first ``length`` positions of the cache."""
+    return tuple((key[..., :length, :], value[..., :length, :]) for key, value in legacy)
@@ -0,0 +1,184 @@
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+
+from llm.standard_generator import generate_standard
+from pda.json_pda import JsonPDA
+
+
+class PDATracker:
+    """
+    Keeps one PDA per sequence of a ``model.generate`` call in sync with the
+    generated ids.
+
+    The states are keyed by the ids generated so far rather than by row, so
+    beam search reordering its rows or sampling several sequences per prompt
+    needs no bookkeeping: every step looks up the state of a row's ids minus
+    the last token and consumes that token's text. Only the states of the
+    latest step are kept. A sequence whose token is not a valid continuation
+    (an end-of-sequence or padding token, or a token outside the table)
+    becomes finished.
+    """
+
+    def __init__(self, token_texts, pdas=None):
+        """
+        Args:
+            token_texts: Text of each token id, e.g. ``vocab_trie.token_texts``.
+            pdas (list, optional): Initial automaton per prompt of the batch;
+                None entries and the default use a JsonPDA.
+        """
+        self.token_texts = token_texts
+        self.pdas = pdas
+        self.reset()
+
+    def reset(self):
+        self.prompt_length = None
+        self._states = {}
+
+    def _initial(self, sample):
+        pda = self.pdas[sample] if self.pdas is not None else None
+        return (pda.clone() if pda is not None else JsonPDA()), False
+
+    def update(self, input_ids):
+        """
+        Advances the PDAs to ``input_ids`` (batch x sequence length). Calling
+        it again with the same ids is free.
+
+        Returns:
+            list: ``(pda, finished)`` for every row.
+        """
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1]
+        rows = input_ids.shape[0]
+        per_sample = max(rows // len(self.pdas), 1) if self.pdas else rows
+        generated = input_ids[:, self.prompt_length:].tolist()
+
+        states = {}
+        result = []
+        for row, ids in enumerate(generated):
+            key = (row // per_sample if self.pdas else 0, tuple(ids))
+            state = states.get(key) or self._states.get(key)
+            if state is None:
+                state = self._advance(key)
+            states[key] = state
+            result.append(state)
+        self._states = states
+        return result
+
+    def _advance(self, key):
+        sample, ids = key
+        if not ids:
+            return self._initial(sample)
+        parent = self._states.get((sample, ids[:-1]))
+        if parent is None:
+            # Not seen at the previous step (e.g. the tracker was created mid-run): replay the ids.
+            parent = self._initial(sample)
+            for index in range(len(ids) - 1):
+                parent = self._step(parent, ids[index])
+        return self._step(parent, ids[-1])
+
+    def _step(self, state, token_id):
+        pda, finished = state
+        if finished or pda.state == "END":
+            return pda, True
+        try:
+            text = self.token_texts[token_id]
+        except (KeyError, IndexError):
+            return pda, True
+        new_pda = pda.clone()
+        if not text or not new_pda.consume_token(text):
+            return pda, True
+        return new_pda, False
+
+
+class PDALogitsProcessor(LogitsProcessor):
+    """
+    Grammar mask for ``model.generate``: every token the sequence's PDA
+    would reject gets a score of ``-inf``.
+
+    The allowed ids of all rows are scattered into one boolean mask that is
+    applied to the whole score matrix at once, so generate's sampling
+    (``top_k``, ``top_p``, ``temperature``), beam search and batching work
+    unchanged on the constrained scores. Once a sequence's PDA reaches
+    ``END``, or it has no valid continuation, only the end-of-sequence
+    tokens are left.
+    """
+
+    def __init__(self, vocab_trie, tracker, eos_token_id=None):
+        """
+        Args:
+            vocab_trie: VocabTrie, VocabIndex or TokenMaskCache that computes the allowed ids.
+            tracker (PDATracker): The per-sequence automata.
+            eos_token_id (int | list, optional): Token ids that end a sequence.
+        """
+        self.vocab_trie = vocab_trie
+        self.tracker = tracker
+        if eos_token_id is None:
+            eos_token_id = []
+        elif isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        self.eos_token_ids = list(eos_token_id)
+
+    def __call__(self, input_ids, scores):
+        states = self.tracker.update(input_ids)
+        rows = []
+        columns = []
+        for row, (pda, finished) in enumerate(states):
+            allowed = []
+            if not finished and pda.state != "END":
+                allowed = self.vocab_trie.allowed_token_ids(pda)
+            if len(allowed) == 0:
+                allowed = self.eos_token_ids
+            allowed = torch.as_tensor(allowed, dtype=torch.long)
+            rows.append(torch.full_like(allowed, row))
+            columns.append(allowed)
+
+        mask = torch.zeros(scores.shape, dtype=torch.bool)
+        if rows:
+            mask[torch.cat(rows), torch.cat(columns)] = True
+        return scores.masked_fill(~mask.to(scores.device), float("-inf"))
+
+
+class PDAStoppingCriteria(StoppingCriteria):
+    """Ends each sequence of ``model.generate`` as soon as its PDA reaches ``END``."""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def __call__(self, input_ids, scores, **kwargs):
+        states = self.tracker.update(input_ids)
+        done = [finished or pda.state == "END" for pda, finished in states]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def pda_generate_kwargs(vocab_trie, tokenizer, pdas=None):
+    """
+    Builds the ``logits_processor`` and ``stopping_criteria`` arguments that
+    constrain a ``model.generate`` call with one PDA per prompt.
+
+    Args:
+        vocab_trie: A VocabIndex (see ``llm.grammar_mask.load_vocab_index``), VocabTrie
+            or a TokenMaskCache around either.
+        tokenizer: The model's tokenizer.
+        pdas (list, optional): Automaton per prompt of the batch, e.g. SchemaPDAs; JsonPDAs by default.
+
+    Returns:
+        dict: Keyword arguments for ``model.generate``. A fresh set is needed per call.
+    """
+    tracker = PDATracker(vocab_trie.token_texts, pdas=pdas)
+    return {
+        "logits_processor": LogitsProcessorList([PDALogitsProcessor(vocab_trie, tracker, tokenizer.eos_token_id)]),
+        "stopping_criteria": StoppingCriteriaList([PDAStoppingCriteria(tracker)]),
+    }
+
+
+def generate_with_logits_processor(prompt, model, tokenizer, vocab_trie, max_new_tokens=200, pda=None,
+                                   prefix_cache=None, **generate_kwargs):
+    """
+    PDA-constrained counterpart of ``generate_standard``: the same
+    ``model.generate`` call with ``pda_generate_kwargs`` added, so both runs
+    share caching, sampling settings and speed. The output is the JSON
+    document only; there is no free text before it as in ``generate_with_pda``.
+    """
+    constraints = pda_generate_kwargs(vocab_trie, tokenizer, pdas=[pda])
+    return generate_standard(prompt, model, tokenizer, max_new_tokens=max_new_tokens, prefix_cache=prefix_cache,
+                             **constraints, **generate_kwargs)
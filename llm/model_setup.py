@@ -1,21 +1,50 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 
-def load_model(model_name="google/gemma-2-2b"):
+# Loaded (tokenizer, model) pairs, so every stage of a run shares one warm model.
+_MODEL_CACHE = {}
+
+
+def _resolve_options(device, quantization, dtype):
+    """Picks the quantization and dtype that suit the device when they are not given."""
+    if device == "cuda":
+        if quantization is None:
+            quantization = "4bit"
+        if dtype is None:
+            dtype = torch.float16
+    else:
+        # bitsandbytes needs a GPU; on CPU, float32 is the safe default and
+        # dynamic int8 quantization of the linear layers is available on request.
+        if quantization is None or quantization in ("4bit", "8bit"):
+            quantization = "none"
+        if dtype is None:
+            dtype = torch.float32
+    return quantization, dtype
+
+
+def load_model(model_name="google/gemma-2-2b", device=None, quantization=None, dtype=None, use_cache=True):
     """
-    Loads the HuggingFace model and tokenizer with 4-bit quantization
-    to ensure it fits on GPUs with limited VRAM.
+    Loads the HuggingFace model and tokenizer, on a GPU with 4-bit
+    quantization to ensure it fits on GPUs with limited VRAM.
 
     This uses the bitsandbytes library to significantly reduce the memory
     footprint of the model, making it ideal for cluster environments.
+
+    Without a GPU the model is loaded unquantized in float32 (or ``dtype``),
+    or with dynamic int8 quantization of its linear layers if
+    ``quantization="int8"``. On a GPU, ``quantization`` may be "4bit"
+    (default), "8bit" or "none".
+
+    Loaded models are cached per process, so calling this again with the
+    same arguments returns the already loaded tokenizer and model.
     """
-    quantization_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_compute_dtype=torch.float16
-    )
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    quantization, dtype = _resolve_options(device, quantization, dtype)
+    key = (model_name, device, quantization, str(dtype))
+    if use_cache and key in _MODEL_CACHE:
+        return _MODEL_CACHE[key]
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Loading model on device: {device}")
+    print(f"Loading model on device: {device} ({quantization} quantization, {dtype})")
     if device == "cpu":
         print("--- WARNING: No GPU detected. Performance will be slow. ---")
 
@@ -23,11 +52,34 @@ def load_model(model_name="google/gemma-2-2b"):
     tokenizer = AutoTokenizer.from_pretrained(model_name)
 
     
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        quantization_config=quantization_config,
-        device_map="auto",
-    )
+    if device == "cuda" and quantization in ("4bit", "8bit"):
+        if quantization == "4bit":
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=dtype
+            )
+        else:
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            quantization_config=quantization_config,
+            device_map="auto",
+        )
+    elif device == "cuda":
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype, device_map="auto")
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype, low_cpu_mem_usage=True)
+        if quantization == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
 
     model.eval()
+    if use_cache:
+        _MODEL_CACHE[key] = (tokenizer, model)
     return tokenizer, model
+
+
+def clear_model_cache():
+    """Drops the cached models so their memory can be freed."""
+    _MODEL_CACHE.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -1,73 +1,94 @@
-import json
-from llm.generate_candidates import get_top_k_candidates
+import time
+
+from llm.generate_candidates import next_candidate_chunks, top_k_from_logits
+from llm.grammar_mask import apply_grammar_mask, full_token_texts
+from llm.incremental_decoder import IncrementalDecoder
+from llm.tracing import step_record
+from pda.candidates import select_pda_candidate, valid_pda_candidates
+from pda.json_events import JsonEventParser
 from pda.json_pda import JsonPDA
 
 
-def generate_with_pda(
-    prompt: str,
-    model,
-    tokenizer,
-    max_steps: int = 500,
-    top_k: int = 50,
-) -> str:
+def escalate_pda_candidate(logits, tokenizer, pda, json_started, top_k, max_top_k, token_texts=None):
     """
-    Generate syntactically valid JSON instances using PDA-guided decoding.
-    This version uses a robust stopping condition to prevent premature termination.
+    Fallback for a step in which none of the ``top_k`` candidates is valid:
+    checks the next most likely tokens in doubling chunks (see
+    ``next_candidate_chunks``) until one is valid or ``max_top_k`` tokens
+    have been tried.
+
+    Returns:
+        tuple: ``(choice, candidates, depth)`` with the choice as returned by
+        ``select_pda_candidate`` (or None), the extra candidates that were
+        checked and the number of chunks it took.
     """
-    pda = JsonPDA()
-    generated_text = ""
-    json_started = False
-    
-    print(f"--- Starting PDA-Guided JSON Generation ---")
+    checked = []
+    depth = 0
+    for depth, chunk in enumerate(next_candidate_chunks(logits, tokenizer, top_k, max_top_k, token_texts), start=1):
+        checked.extend(chunk)
+        choice = select_pda_candidate(chunk, pda, json_started)
+        if choice is not None:
+            return choice, checked, depth
+    return None, checked, depth
 
-    for step in range(max_steps):
-        context = prompt + generated_text
-        candidates = get_top_k_candidates(context, k=top_k, model=model, tokenizer=tokenizer)
-        
-        if not candidates:
-    
-            break
-
-   
-        token_accepted = False
-        for token in candidates:
-            if not json_started:
-                first_char_index = -1
-                for i, char in enumerate(token):
-                    if char in "{[":
-                        first_char_index = i
-                        break
-                
-                if first_char_index != -1:
-                    json_part = token[first_char_index:]
-                    temp_pda = pda.clone()
-                    is_token_valid = all(temp_pda.consume_char(c, partial=True) for c in json_part)
-                    
-                    if is_token_valid:
-                        pda = temp_pda
-                        generated_text += token
-                        token_accepted = True
-                        json_started = True
-                        break
-                else:
-                    generated_text += token
-                    token_accepted = True
-                    break
-            else:
-                temp_pda = pda.clone()
-                is_token_valid = all(temp_pda.consume_char(c, partial=True) for c in token)
-                
-                if is_token_valid:
-               
-                    pda = temp_pda
-                    generated_text += token
-                    token_accepted = True
-                    break
-               
-        if not token_accepted:
-        
-            break
 
+def select_masked_token(logits, pda, vocab_trie, allowed_token_ids=None):
+    """
+    Picks the most likely token of the whole vocabulary that the PDA accepts.
+
+    The trie is walked once to find every grammatical token, the rest of the
+    logits are masked out and the argmax of what remains is taken, so a step
+    only dead-ends when no token of the vocabulary can continue the JSON.
+    ``allowed_token_ids`` can be passed in if they were computed ahead of time.
+
+    Returns:
+        tuple | None: ``(token_id, token_text, new_pda)`` or None if no token is valid.
+    """
+    if allowed_token_ids is None:
+        allowed_token_ids = vocab_trie.allowed_token_ids(pda)
+    if len(allowed_token_ids) == 0:
+        return None
+
+    token_id = int(apply_grammar_mask(logits, allowed_token_ids).argmax())
+    token = vocab_trie.token_texts[token_id]
+    new_pda = pda.clone()
+    new_pda.consume_token(token)
+    return token_id, token, new_pda
+
+
+def forced_tokens(pda, tokenizer, token_texts=None):
+    """
+    Tokenizes the grammar-forced continuation of the PDA.
+
+    The ids must spell exactly the forced text in the middle of the
+    document, leading spaces included: a SentencePiece tokenizer turns
+    ``"rue"`` into ``"▁r"`` + ``"ue"``, which the model reads as ``" rue"``
+    although ``decode`` drops the space. So the ids are checked against
+    ``token_texts`` (see ``llm.grammar_mask.full_token_texts``) or, without
+    them, decoded after an anchor token as in
+    ``llm.grammar_mask.normalized_token_texts``.
+
+    Returns:
+        tuple: ``(token_ids, text)``, or ``([], "")`` if nothing is forced or
+        the forced text does not survive a tokenize/decode round trip.
+    """
+    forced = pda.forced_continuation()
+    if not forced:
+        return [], ""
+    token_ids = tokenizer(forced, add_special_tokens=False).input_ids
+    if token_texts is not None:
+        text = "".join(token_texts[token_id] for token_id in token_ids)
+    else:
+        anchor = tokenizer("a", add_special_tokens=False).input_ids[-1:]
+        anchor_text = tokenizer.decode(anchor, clean_up_tokenization_spaces=False)
+        text = tokenizer.decode(anchor + token_ids, clean_up_tokenization_spaces=False)
+        text = text[len(anchor_text):] if anchor and text.startswith(anchor_text) else None
+    if text != forced:
+        return [], ""
+    return token_ids, forced
+
+
+def extract_json(generated_text: str) -> str:
+    """Cuts the generated text down to the part starting at the first ``{`` or ``[``."""
     start_brace = generated_text.find('{')
     start_bracket = generated_text.find('[')
     start_index = -1
@@ -77,7 +98,206 @@ def generate_with_pda(
         start_index = start_brace
     else:
         start_index = start_bracket
-    final_json = generated_text[start_index:] if start_index != -1 else "{}"
+    return generated_text[start_index:] if start_index != -1 else "{}"
 
-   
-    return final_json
+
+def iter_pda_tokens(
+    prompt: str,
+    model,
+    tokenizer,
+    max_steps: int = 500,
+    top_k: int = 50,
+    max_top_k: int = 1024,
+    vocab_trie=None,
+    jump_forward: bool = False,
+    pda=None,
+    prefix_cache=None,
+    hooks=None,
+):
+    """
+    The decoding loop of ``generate_with_pda`` as a generator.
+
+    Yields ``(token_text, json_text)`` for every accepted token, where
+    ``json_text`` is the part of the token that belongs to the JSON document
+    (empty before the document has started). Grammar-forced continuations
+    added by ``jump_forward`` are yielded as tokens of their own. The loop
+    stops once the document is complete, on a dead end or after ``max_steps``.
+    ``hooks.on_end`` is called however the loop ends, with ``"closed"`` if
+    the generator is closed early and ``"error"`` if a step raises.
+    """
+    pda = pda.clone() if pda is not None else JsonPDA()
+    json_started = False
+    decoder = IncrementalDecoder(model, tokenizer, prefix_cache=prefix_cache)
+    token_texts = full_token_texts(vocab_trie)
+
+    print(f"--- Starting PDA-Guided JSON Generation ---")
+    start_time = time.perf_counter()
+
+    tracing = hooks is not None
+    if tracing:
+        hooks.on_start(prompt)
+    end_reason = "max_steps"
+    num_tokens = 0
+
+    pending_ids = []
+    num_skipped = 0
+    num_escalations = 0
+    max_escalation_depth = 0
+    try:
+        for step in range(max_steps):
+            if tracing:
+                started = time.perf_counter()
+            logits = decoder.prefill(prompt) if step == 0 else decoder.extend(pending_ids)
+            if tracing:
+                forward_done = topk_done = time.perf_counter()
+                candidates = None
+            escalation = 0
+
+            masked = json_started and vocab_trie is not None
+            if masked:
+                choice = select_masked_token(logits, pda, vocab_trie)
+            else:
+                candidates = top_k_from_logits(logits, tokenizer, k=top_k, token_texts=token_texts)
+                if tracing:
+                    topk_done = time.perf_counter()
+                choice = select_pda_candidate(candidates, pda, json_started)
+                if choice is None and max_top_k > top_k:
+                    choice, extra, escalation = escalate_pda_candidate(
+                        logits, tokenizer, pda, json_started, top_k, max_top_k, token_texts
+                    )
+                    num_escalations += 1
+                    max_escalation_depth = max(max_escalation_depth, escalation)
+                    if tracing:
+                        candidates = candidates + extra
+
+            if tracing:
+                num_input_tokens = decoder.num_prompt_tokens if step == 0 else len(pending_ids)
+                hooks.on_step(step_record(step, num_input_tokens, started, forward_done, topk_done,
+                                          time.perf_counter(), logits, candidates, choice, escalation))
+            if choice is None:
+                end_reason = "dead_end"
+                break
+            # Counted before the yield, so a token the caller received is counted even if it stops here.
+            num_tokens += 1
+            if masked:
+                token_id, token, pda = choice
+                yield token, token
+            else:
+                was_started = json_started
+                token_id, token, pda, json_started = choice
+                if was_started:
+                    yield token, token
+                elif json_started:
+                    yield token, token[min(index for index in (token.find("{"), token.find("[")) if index != -1):]
+                else:
+                    yield token, ""
+            pending_ids = [token_id]
+
+            if jump_forward and json_started:
+                forced_ids, forced_text = forced_tokens(pda, tokenizer, token_texts)
+                if forced_ids:
+                    pda.consume_token(forced_text)
+                    num_tokens += len(forced_ids)
+                    num_skipped += len(forced_ids)
+                    yield forced_text, forced_text
+                    pending_ids.extend(forced_ids)
+
+            if json_started and pda.state == "END":
+                end_reason = "end"
+                break
+    except GeneratorExit:
+        end_reason = "closed"
+        raise
+    except Exception:
+        end_reason = "error"
+        raise
+    finally:
+        # Runs however the loop ends, including when the caller stops iterating early.
+        elapsed = time.perf_counter() - start_time
+        if tracing:
+            hooks.on_end(end_reason, num_tokens, elapsed)
+        tokens_per_second = num_tokens / elapsed if elapsed > 0 else 0.0
+        print(f"--- Generated {num_tokens} tokens in {elapsed:.2f}s ({tokens_per_second:.1f} tokens/s) ---")
+        if jump_forward:
+            print(f"--- Jump-forward skipped {num_skipped} model calls ---")
+        if num_escalations:
+            print(f"--- Top-k escalated in {num_escalations} steps (max depth {max_escalation_depth}) ---")
+
+
+def generate_with_pda(
+    prompt: str,
+    model,
+    tokenizer,
+    max_steps: int = 500,
+    top_k: int = 50,
+    max_top_k: int = 1024,
+    vocab_trie=None,
+    jump_forward: bool = False,
+    pda=None,
+    prefix_cache=None,
+    hooks=None,
+) -> str:
+    """
+    Generate syntactically valid JSON instances using PDA-guided decoding.
+
+    The prompt is prefilled once and the model's KV cache is kept between
+    steps, so each step only feeds the previously accepted token id. For
+    greedy decoding this yields the same tokens as re-encoding
+    ``prompt + generated_text`` at every step, without the quadratic cost.
+
+    If a ``vocab_trie`` (see ``llm.grammar_mask.build_vocab_trie``) is given,
+    tokens inside the JSON document are chosen from a grammar mask over the
+    full vocabulary instead of from the top-k candidates. A TokenMaskCache
+    (see ``llm.grammar_mask.build_mask_cache``) can be passed in its place to
+    reuse the masks of recurring PDA configurations. A memory-mapped
+    VocabIndex (see ``llm.grammar_mask.load_vocab_index``) works as well and
+    also replaces the per-step decoding of top-k candidates with a lookup.
+
+    With ``jump_forward``, continuations the grammar forces (the ``:`` after
+    a key, the rest of ``true``/``false``/``null``) are appended without
+    sampling and prefilled into the KV cache together with the next token,
+    saving one forward pass per forced token.
+
+    When none of the ``top_k`` candidates is valid, the next most likely
+    tokens are tried in doubling chunks up to ``max_top_k`` before the run
+    is given up as a dead end; how often and how deep this escalation went
+    is reported at the end.
+
+    ``pda`` replaces the default JsonPDA, e.g. with a SchemaPDA from
+    ``pda.schema_pda.compile_schema(schema).new_pda()``. A ``prefix_cache``
+    (see ``llm.prefix_cache.PrefixCache``) lets the prefill reuse the KV state
+    of the longest prompt prefix seen before.
+
+    ``hooks`` (see ``llm.tracing.GenerationHooks``, e.g. a TraceCollector)
+    receive a record per step with the forward, top-k and filtering times,
+    the number of rejected candidates and the rank of the accepted token,
+    and the reason the run ended. Without hooks nothing is timed.
+
+    Generation stops as soon as the PDA reaches its end state. See
+    ``iter_pda_tokens`` and ``stream_with_pda`` for streaming variants.
+    """
+    generated_text = "".join(token for token, _ in iter_pda_tokens(
+        prompt, model, tokenizer, max_steps=max_steps, top_k=top_k, max_top_k=max_top_k, vocab_trie=vocab_trie,
+        jump_forward=jump_forward, pda=pda, prefix_cache=prefix_cache, hooks=hooks,
+    ))
+    return extract_json(generated_text)
+
+
+def stream_with_pda(prompt: str, model, tokenizer, **kwargs):
+    """
+    Streaming variant of ``generate_with_pda`` that takes the same keyword
+    arguments.
+
+    Yields ``(token_text, events)`` for every accepted token, where
+    ``events`` are the SAX-style events of ``pda.json_events.JsonEventParser``
+    that the token completes, e.g. ``("key", "name")`` followed by
+    ``("scalar", "Ada")``. Consumers can act on finished key/value pairs
+    while generation continues; the document ends with ``("end_document", None)``.
+    """
+    parser = JsonEventParser()
+    tokens = iter_pda_tokens(prompt, model, tokenizer, **kwargs)
+    try:
+        for token, json_text in tokens:
+            yield token, parser.feed(json_text) if json_text else []
+    finally:
+        tokens.close()
@@ -0,0 +1,170 @@
+import itertools
+
+import torch
+
+
+def _kv_bytes(kv):
+    return sum(key.element_size() * key.nelement() + value.element_size() * value.nelement() for key, value in kv)
+
+
+def _slice_kv(legacy, start, end):
+    """Copies positions ``[start, end)`` of a batch-size-1 legacy cache."""
+    return tuple(
+        (key[..., start:end, :].clone(), value[..., start:end, :].clone())
+        for key, value in legacy
+    )
+
+
+class _RadixNode:
+    __slots__ = ("tokens", "kv", "children", "parent", "last_access")
+
+    def __init__(self, tokens=(), kv=None, parent=None):
+        self.tokens = tokens
+        self.kv = kv
+        self.children = {}
+        self.parent = parent
+        self.last_access = 0
+
+
+class PrefixCache:
+    """
+    Radix tree of KV states keyed by token-id prefixes.
+
+    Every edge holds a token sequence together with the keys and values of
+    exactly those positions, so prompts that share a prefix (a system prompt,
+    the same prompt run by the PDA and the baseline generator) store it once.
+    ``lookup`` returns the KV state of the longest cached prefix, and the
+    least recently used leaves are evicted once the stored tensors exceed
+    ``max_megabytes``.
+    """
+
+    def __init__(self, max_megabytes=1024):
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.root = _RadixNode()
+        self.num_bytes = 0
+        self._clock = itertools.count(1)
+        self.lookups = 0
+        self.hits = 0
+        self.saved_tokens = 0
+        self.looked_up_tokens = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def lookup(self, token_ids):
+        """
+        Finds the longest cached prefix of ``token_ids``.
+
+        Returns:
+            tuple: ``(length, legacy_kv)`` where ``legacy_kv`` is a fresh
+            batch-size-1 cache of ``length`` positions, or ``(0, None)``.
+        """
+        token_ids = tuple(token_ids)
+        self.lookups += 1
+        self.looked_up_tokens += len(token_ids)
+
+        node = self.root
+        position = 0
+        pieces = []
+        now = next(self._clock)
+        while position < len(token_ids):
+            child = node.children.get(token_ids[position])
+            if child is None:
+                break
+            matched = 0
+            for expected, actual in zip(child.tokens, token_ids[position:]):
+                if expected != actual:
+                    break
+                matched += 1
+            child.last_access = now
+            if matched < len(child.tokens):
+                pieces.append(tuple((key[..., :matched, :], value[..., :matched, :]) for key, value in child.kv))
+                position += matched
+                break
+            pieces.append(child.kv)
+            position += matched
+            node = child
+
+        if position == 0:
+            return 0, None
+        self.hits += 1
+        self.saved_tokens += position
+        legacy = tuple(
+            (torch.cat([piece[layer][0] for piece in pieces], dim=-2),
+             torch.cat([piece[layer][1] for piece in pieces], dim=-2))
+            for layer in range(len(pieces[0]))
+        )
+        return position, legacy
+
+    def insert(self, token_ids, legacy_kv):
+        """
+        Stores the KV state of ``token_ids``. ``legacy_kv`` must be a
+        batch-size-1 cache covering at least ``len(token_ids)`` positions.
+        """
+        token_ids = tuple(token_ids)
+        node = self.root
+        position = 0
+        now = next(self._clock)
+        while position < len(token_ids):
+            child = node.children.get(token_ids[position])
+            if child is None:
+                kv = _slice_kv(legacy_kv, position, len(token_ids))
+                leaf = _RadixNode(token_ids[position:], kv, node)
+                leaf.last_access = now
+                node.children[token_ids[position]] = leaf
+                self.num_bytes += _kv_bytes(kv)
+                break
+
+            matched = 0
+            for expected, actual in zip(child.tokens, token_ids[position:]):
+                if expected != actual:
+                    break
+                matched += 1
+            if matched < len(child.tokens):
+                child = self._split(child, matched)
+            child.last_access = now
+            position += matched
+            node = child
+
+        self._evict()
+
+    def _split(self, node, length):
+        """Cuts the edge of ``node`` after ``length`` tokens and returns the new parent."""
+        head = _RadixNode(
+            node.tokens[:length],
+            tuple((key[..., :length, :].clone(), value[..., :length, :].clone()) for key, value in node.kv),
+            node.parent,
+        )
+        head.last_access = node.last_access
+        node.parent.children[node.tokens[0]] = head
+        node.tokens = node.tokens[length:]
+        node.kv = tuple((key[..., length:, :].clone(), value[..., length:, :].clone()) for key, value in node.kv)
+        node.parent = head
+        head.children[node.tokens[0]] = node
+        # Both halves are fresh copies; the byte count stays the same.
+        return head
+
+    def _evict(self):
+        while self.num_bytes > self.max_bytes:
+            leaves = []
+            pending = [self.root]
+            while pending:
+                node = pending.pop()
+                if not node.children and node is not self.root:
+                    leaves.append(node)
+                pending.extend(node.children.values())
+            if not leaves:
+                return
+            victim = min(leaves, key=lambda leaf: leaf.last_access)
+            del victim.parent.children[victim.tokens[0]]
+            self.num_bytes -= _kv_bytes(victim.kv)
+
+    def clear(self):
+        self.root = _RadixNode()
+        self.num_bytes = 0
+
+    def report(self):
+        return (f"{self.hits}/{self.lookups} lookups hit ({self.hit_rate:.1%}), "
+                f"{self.saved_tokens}/{self.looked_up_tokens} prefill tokens saved, "
+                f"{self.num_bytes / (1024 * 1024):.1f} MB cached")
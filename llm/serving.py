@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from pda.schema_pda import compile_schema
+
+
+def parse_request(line, line_number):
+    """
+    Parses one JSONL request: ``{"request_id": ..., "prompt": ..., "schema": {...}}``.
+    ``request_id`` defaults to the line number and ``schema`` is optional.
+
+    Raises:
+        ValueError: If the line is not a JSON object with a string prompt.
+    """
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"invalid JSON: {error}") from None
+    if not isinstance(request, dict) or not isinstance(request.get("prompt"), str):
+        raise ValueError("a request needs a string 'prompt'")
+    request.setdefault("request_id", line_number)
+    return request
+
+
+def read_requests(stream):
+    """
+    Lazily yields the requests of a JSONL stream. Blank lines are skipped and
+    unparsable lines are yielded as ``{"request_id": line_number, "error": ...}``.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_request(line, line_number)
+        except ValueError as error:
+            yield {"request_id": line_number, "error": str(error)}
+
+
+class RequestScheduler:
+    """
+    Tags requests on their way through a ContinuousBatchGenerator.
+
+    Each submitted request gets an internal key, so duplicate request ids
+    are harmless, and the schema of a request (if any, and if ``use_schema``)
+    is compiled into the PDA that constrains its row.
+    """
+
+    def __init__(self, generator, use_schema=True):
+        self.generator = generator
+        self.use_schema = use_schema
+        self._keys = itertools.count()
+        self._in_flight = {}
+        self._failed = []
+        self.num_completed = 0
+        self.num_failed = 0
+
+    @property
+    def num_queued(self):
+        return len(self.generator.queue)
+
+    def has_pending(self):
+        return bool(self._failed) or self.generator.has_pending()
+
+    def submit(self, request):
+        """
+        Queues a parsed request and returns its internal key. A request whose
+        schema does not compile is not queued; its error result is returned
+        by the next ``step``.
+        """
+        key = next(self._keys)
+        self._in_flight[key] = (request["request_id"], time.perf_counter())
+        schema = request.get("schema") if self.use_schema else None
+        try:
+            pda = compile_schema(schema).new_pda() if isinstance(schema, dict) else None
+        except Exception as error:
+            self._failed.append(self._result(key, error=f"invalid schema: {error}"))
+            return key
+        self.generator.submit(key, request["prompt"], pda)
+        return key
+
+    def step(self):
+        """
+        Runs one batched decoding step.
+
+        If the step raises, the error is logged and every request that was
+        running or queued gets an error result, so no caller waits forever
+        and the scheduler keeps serving later requests.
+
+        Returns:
+            list: ``(key, result)`` for every request that finished, where
+            ``result`` is ``{"request_id", "output", "latency_s"}``, or
+            ``{"request_id", "error", "latency_s"}`` for a failed request.
+        """
+        finished, self._failed = self._failed, []
+        try:
+            completed = self.generator.step()
+        except Exception as error:
+            print("--- Decoding step failed; failing the running and queued requests ---")
+            traceback.print_exc()
+            message = f"generation failed: {error}"
+            finished.extend(self._result(key, error=message) for key in self.generator.abort())
+            return finished
+        for key, json_text in completed:
+            finished.append(self._result(key, output=json_text))
+        return finished
+
+    def _result(self, key, **fields):
+        request_id, submitted = self._in_flight.pop(key)
+        if "error" in fields:
+            self.num_failed += 1
+        else:
+            self.num_completed += 1
+        return key, {"request_id": request_id, **fields, "latency_s": round(time.perf_counter() - submitted, 3)}
+
+
+def serve_requests(requests, scheduler, max_queued=32):
+    """
+    Streams requests through the scheduler and yields the results in
+    completion order.
+
+    At most ``max_queued`` requests wait for a batch slot at any time, so
+    the input is read only as fast as it is served and memory stays bounded
+    however long the stream is. Malformed requests are answered right away.
+    """
+    requests = iter(requests)
+    exhausted = False
+    while True:
+        while not exhausted and scheduler.num_queued < max_queued:
+            request = next(requests, None)
+            if request is None:
+                exhausted = True
+            elif "error" in request:
+                yield request
+            else:
+                scheduler.submit(request)
+
+        if not scheduler.has_pending():
+            if exhausted:
+                return
+            continue
+        for _, result in scheduler.step():
+            yield result
+
+
+def write_results(results, stream):
+    """Writes each result as one JSON line as soon as it is produced."""
+    count = 0
+    for result in results:
+        stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+        stream.flush()
+        count += 1
+    return count
+
+
+class SocketServer:
+    """
+    Asyncio front end that feeds a RequestScheduler from a local socket.
+
+    Clients send JSONL requests and receive one JSON line per request on the
+    same connection, in completion order. Requests from all connections share
+    the continuous batch. Decoding steps run on a single worker thread, so the
+    event loop keeps accepting requests while the model is busy. At most
+    ``max_queued`` requests wait in the scheduler for a batch slot and at
+    most ``max_queued`` more in ``incoming``; once that is full, readers
+    are paused until the batch catches up.
+    """
+
+    def __init__(self, scheduler, max_queued=32):
+        self.scheduler = scheduler
+        self.max_queued = max_queued
+        self.incoming = asyncio.Queue(maxsize=max_queued)
+        self._waiting = {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        replies = []
+        line_number = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    request = parse_request(line.decode("utf-8"), line_number)
+                except ValueError as error:
+                    await self._reply(writer, {"request_id": line_number, "error": str(error)})
+                    continue
+                future = loop.create_future()
+                await self.incoming.put((request, future))
+                replies.append(asyncio.ensure_future(self._reply_when_done(writer, future)))
+            if replies:
+                await asyncio.gather(*replies)
+        finally:
+            writer.close()
+
+    async def _reply_when_done(self, writer, future):
+        await self._reply(writer, await future)
+
+    async def _reply(self, writer, result):
+        writer.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def schedule(self):
+        """Admits queued requests and steps the batch until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.scheduler.has_pending():
+                request, future = await self.incoming.get()
+                self._waiting[self.scheduler.submit(request)] = future
+            while not self.incoming.empty() and self.scheduler.num_queued < self.max_queued:
+                request, future = self.incoming.get_nowait()
+                self._waiting[self.scheduler.submit(request)] = future
+
+            for key, result in await loop.run_in_executor(self._executor, self.scheduler.step):
+                future = self._waiting.pop(key)
+                if not future.done():
+                    future.set_result(result)
+
+    async def serve(self, path=None, host="127.0.0.1", port=8765):
+        """Listens on a Unix socket at ``path``, or on ``host:port`` if no path is given."""
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=path)
+            address = path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+            address = f"{host}:{port}"
+        print(f"--- Serving PDA-guided JSON generation on {address} ---")
+        scheduler = asyncio.ensure_future(self.schedule())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            scheduler.cancel()
+            self._executor.shutdown(wait=False)
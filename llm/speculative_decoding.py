@@ -0,0 +1,216 @@
+import time
+
+import torch
+
+from llm.grammar_mask import full_token_texts
+from llm.incremental_decoder import IncrementalDecoder
+from llm.pda_augmented_generation import extract_json, select_masked_token
+from pda.json_pda import JsonPDA
+
+
+def _propose(decoder, logits, pda, num_tokens, token_text):
+    """
+    Greedy draft tokens from ``logits`` on, cut at the first token the PDA
+    rejects and after the document ends.
+
+    Returns:
+        tuple: ``(proposals, fed)``, where ``fed`` is how many of the
+        proposals were fed to the draft decoder to get the next logits.
+    """
+    proposals = []
+    fed = 0
+    pda = pda.clone()
+    while len(proposals) < num_tokens:
+        token_id = int(torch.argmax(logits))
+        text = token_text(token_id)
+        if not text or not pda.consume_token(text):
+            break
+        proposals.append(token_id)
+        if pda.state == "END" or len(proposals) == num_tokens:
+            break
+        logits = decoder.step(token_id)
+        fed += 1
+    return proposals, fed
+
+
+def generate_with_pda_speculative(
+    prompt: str,
+    model,
+    draft_model,
+    tokenizer,
+    vocab_trie,
+    max_steps: int = 500,
+    num_draft_tokens: int = 4,
+    pda=None,
+    prefix_cache=None,
+    stats=None,
+) -> str:
+    """
+    PDA-guided JSON generation with speculative decoding.
+
+    Every round the small ``draft_model`` greedily proposes up to
+    ``num_draft_tokens`` tokens. The PDA cuts the proposal at its first
+    ungrammatical token, so the target ``model`` never verifies tokens that
+    are bound to be rejected. The target scores the pending token and all
+    proposals in one forward and keeps the longest prefix that matches its
+    own grammar-masked argmax, plus one token of its own: the correction at
+    the first mismatch, or the next token if every proposal was accepted.
+    Both KV caches are cropped back to the accepted tokens.
+
+    The output is the same as greedy decoding with the target model under
+    the full-vocabulary grammar mask (``select_masked_token``) from the
+    first token on, so unlike ``generate_with_pda`` there is no free text
+    before the JSON. ``draft_model=None`` runs exactly that baseline. The
+    draft must share the target's tokenizer.
+
+    Args:
+        vocab_trie: VocabTrie, VocabIndex or TokenMaskCache for the grammar mask.
+        num_draft_tokens (int): Tokens proposed per round.
+        stats (dict, optional): Filled with the round counts, the acceptance
+            rate and the forward passes of both models.
+
+    Returns:
+        str: The generated JSON, cut by ``extract_json`` like the other
+        generators' outputs (``"{}"`` if no token was valid).
+    """
+    pda = pda.clone() if pda is not None else JsonPDA()
+    texts = full_token_texts(vocab_trie)
+
+    def token_text(token_id):
+        return texts[token_id] if texts is not None else tokenizer.decode([token_id])
+
+    target = IncrementalDecoder(model, tokenizer, prefix_cache=prefix_cache)
+    draft = IncrementalDecoder(draft_model, tokenizer) if draft_model is not None else None
+
+    print(f"--- Starting Speculative PDA-Guided JSON Generation ({num_draft_tokens} draft tokens) ---")
+    start_time = time.perf_counter()
+
+    target_logits = target.prefill(prompt)
+    draft_logits = draft.prefill(prompt) if draft is not None else None
+    # Accepted tokens not yet fed to each model.
+    target_pending = []
+    draft_pending = []
+    generated_ids = []
+    generated_text = ""
+    num_rounds = 0
+    num_proposed = 0
+    num_accepted = 0
+    end_reason = "max_steps"
+
+    while len(generated_ids) < max_steps:
+        num_rounds += 1
+        proposals = []
+        draft_fed = 0
+        if draft is not None:
+            if draft_pending:
+                draft_logits = draft.extend(draft_pending)
+                draft_pending = []
+            draft_length = draft.cache_length
+            budget = min(num_draft_tokens, max_steps - len(generated_ids) - 1)
+            if budget > 0:
+                proposals, draft_fed = _propose(draft, draft_logits, pda, budget, token_text)
+            num_proposed += len(proposals)
+
+        target_length = target.cache_length
+        fed = target_pending + proposals
+        if fed:
+            verified = target.extend_all(fed)
+            # Logits before each proposal and after the last one.
+            if target_pending:
+                position_logits = list(verified[len(target_pending) - 1:])
+            else:
+                position_logits = [target_logits] + list(verified)
+        else:
+            position_logits = [target_logits]
+        target_length += len(target_pending)
+        target_pending = []
+
+        accepted = []
+        extra = None
+        for index, logits in enumerate(position_logits):
+            choice = select_masked_token(logits, pda, vocab_trie)
+            if choice is None:
+                break
+            token_id, token, pda = choice
+            generated_text += token
+            if index < len(proposals) and token_id == proposals[index]:
+                accepted.append(token_id)
+                if pda.state == "END":
+                    break
+                continue
+            # The target's correction, or its next token if every proposal was accepted.
+            extra = token_id
+            break
+        num_accepted += len(accepted)
+        generated_ids.extend(accepted)
+
+        # Drop the rejected proposals from both caches; the extra token is fed next round.
+        target.crop(target_length + len(accepted))
+        if extra is not None:
+            generated_ids.append(extra)
+            target_pending = [extra]
+        if draft is not None:
+            kept = min(len(accepted), draft_fed)
+            draft.crop(draft_length + kept)
+            draft_pending = (accepted + [extra] if extra is not None else accepted)[kept:]
+
+        if pda.state == "END":
+            end_reason = "end"
+            break
+        if extra is None:
+            end_reason = "dead_end"
+            break
+
+    elapsed = time.perf_counter() - start_time
+    num_tokens = len(generated_ids)
+    acceptance_rate = num_accepted / num_proposed if num_proposed else 0.0
+    tokens_per_second = num_tokens / elapsed if elapsed > 0 else 0.0
+    print(f"--- Generated {num_tokens} tokens in {elapsed:.2f}s ({tokens_per_second:.1f} tokens/s, "
+          f"{target.num_forward_passes} target forward passes) ---")
+    if draft is not None:
+        print(f"--- Draft: {num_accepted}/{num_proposed} proposed tokens accepted ({acceptance_rate:.1%}) "
+              f"in {num_rounds} rounds ---")
+    if stats is not None:
+        stats.update({
+            "num_tokens": num_tokens,
+            "seconds": elapsed,
+            "end_reason": end_reason,
+            "num_rounds": num_rounds,
+            "num_proposed": num_proposed,
+            "num_accepted": num_accepted,
+            "acceptance_rate": acceptance_rate,
+            "target_forward_passes": target.num_forward_passes,
+            "draft_forward_passes": draft.num_forward_passes if draft is not None else 0,
+        })
+    return extract_json(generated_text)
+
+
+def measure_speculative_speedup(prompt, model, draft_model, tokenizer, vocab_trie, **kwargs):
+    """
+    Runs the prompt without and with the draft model and compares them.
+
+    Returns:
+        dict: Wall times of both runs, ``speedup`` (baseline over speculative
+        time), the draft's ``acceptance_rate``, the target forward passes of
+        both runs and whether the outputs are identical, which they should be.
+    """
+    baseline_stats = {}
+    baseline = generate_with_pda_speculative(
+        prompt, model, None, tokenizer, vocab_trie, stats=baseline_stats, **kwargs
+    )
+    speculative_stats = {}
+    speculative = generate_with_pda_speculative(
+        prompt, model, draft_model, tokenizer, vocab_trie, stats=speculative_stats, **kwargs
+    )
+    seconds = speculative_stats["seconds"]
+    return {
+        "baseline_seconds": baseline_stats["seconds"],
+        "speculative_seconds": seconds,
+        "speedup": baseline_stats["seconds"] / seconds if seconds > 0 else 0.0,
+        "acceptance_rate": speculative_stats["acceptance_rate"],
+        "baseline_forward_passes": baseline_stats["target_forward_passes"],
+        "target_forward_passes": speculative_stats["target_forward_passes"],
+        "draft_forward_passes": speculative_stats["draft_forward_passes"],
+        "num_tokens": speculative_stats["num_tokens"],
+        "same_output": baseline == speculative,
+    }
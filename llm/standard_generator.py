@@ -1,4 +1,12 @@
-def generate_standard(prompt, model, tokenizer, max_new_tokens=200):
+from llm import kv_cache
+
+
+def generate_standard(prompt, model, tokenizer, max_new_tokens=200, prefix_cache=None, **generate_kwargs):
+    """
+    Generates a completion with ``model.generate``, the unconstrained
+    baseline. Extra keyword arguments go to ``model.generate``, e.g. sampling
+    settings or the PDA constraints of ``llm.logits_processor.pda_generate_kwargs``.
+    """
     device = model.device  # get model device (cpu or cuda)
     
     # Tokenize with attention mask and pad token
@@ -17,13 +25,26 @@ def generate_standard(prompt, model, tokenizer, max_new_tokens=200):
     if tokenizer.pad_token_id is None:
         tokenizer.pad_token_id = tokenizer.eos_token_id
 
+    # Start from the longest cached prefix of the prompt, if any
+    if prefix_cache is not None:
+        token_ids = input_ids[0].tolist()
+        matched, legacy = prefix_cache.lookup(token_ids[:-1])
+        if matched:
+            generate_kwargs["past_key_values"] = kv_cache.from_legacy(legacy)
+
     # Generate
-    output_ids = model.generate(
+    outputs = model.generate(
         input_ids,
         attention_mask=attention_mask,
         pad_token_id=tokenizer.pad_token_id,
-        max_new_tokens=max_new_tokens
-    )[0]
+        max_new_tokens=max_new_tokens,
+        return_dict_in_generate=True,
+        **generate_kwargs
+    )
+    output_ids = outputs.sequences[0]
+
+    if prefix_cache is not None and outputs.past_key_values is not None:
+        prefix_cache.insert(token_ids, kv_cache.to_legacy(outputs.past_key_values))
 
     # Decode only the new tokens
     output_text = tokenizer.decode(
@@ -0,0 +1,171 @@
+import json
+import time
+from collections import Counter
+
+# Upper bounds, in microseconds, of the latency histogram buckets.
+LATENCY_BUCKETS_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+TIMING_FIELDS = ("forward_s", "topk_s", "filter_s", "step_s")
+
+
+class GenerationHooks:
+    """
+    Callbacks invoked by ``generate_with_pda``. Every method is a no-op, so
+    subclasses only override what they need. Passing no hooks at all skips
+    the timing and bookkeeping entirely.
+    """
+
+    def on_start(self, prompt):
+        pass
+
+    def on_step(self, record):
+        """``record`` is a dict as built by ``step_record``."""
+
+    def on_end(self, reason, num_tokens, elapsed):
+        """
+        ``reason`` is ``"end"`` (document complete), ``"dead_end"``,
+        ``"max_steps"``, ``"closed"`` (the caller stopped iterating) or
+        ``"error"`` (a step raised).
+        """
+
+
+def step_record(step, num_input_tokens, started, forward_done, topk_done, filter_done, logits, candidates, choice,
+                escalation=0):
+    """
+    Builds the trace record of one decoding step.
+
+    ``candidates`` is the top-k list the choice was filtered from, or None
+    when the step used the full-vocabulary grammar mask. The rank of the
+    accepted token is its position among the model's preferences, so it is
+    also the number of more likely tokens the PDA rejected. ``escalation``
+    is the number of extra candidate chunks the step needed beyond top-k.
+    """
+    if candidates is not None:
+        num_candidates = len(candidates)
+        if choice is None:
+            rank = None
+            rejected = num_candidates
+        else:
+            rank = next(index for index, (token_id, _) in enumerate(candidates) if token_id == choice[0])
+            rejected = rank
+    else:
+        num_candidates = logits.shape[-1]
+        if choice is None:
+            rank = None
+            rejected = num_candidates
+        else:
+            rank = int((logits > logits[choice[0]]).sum())
+            rejected = rank
+
+    return {
+        "step": step,
+        "input_tokens": num_input_tokens,
+        "forward_s": forward_done - started,
+        "topk_s": topk_done - forward_done,
+        "filter_s": filter_done - topk_done,
+        "step_s": filter_done - started,
+        "masked": candidates is None,
+        "candidates": num_candidates,
+        "rejected": rejected,
+        "accepted_rank": rank,
+        "escalation_depth": escalation,
+        "token_id": None if choice is None else choice[0],
+        "token": None if choice is None else choice[1],
+        "pda_state": None if choice is None else choice[2].state,
+    }
+
+
+class TraceCollector(GenerationHooks):
+    """
+    Collects the per-step records of one or more generations.
+
+    With a ``path`` every record is appended to that file as a JSON line
+    (``"event": "step"`` per step and ``"event": "end"`` per run). With
+    ``keep_steps`` the records also stay in memory for ``histogram`` and
+    ``summary``; turn it off for long runs that only need the JSONL file.
+    """
+
+    def __init__(self, path=None, keep_steps=True):
+        self.path = path
+        self.keep_steps = keep_steps
+        self.steps = []
+        self.runs = []
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._run = 0
+
+    def on_start(self, prompt):
+        self._run += 1
+
+    def on_step(self, record):
+        record["run"] = self._run
+        if self.keep_steps:
+            self.steps.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps({"event": "step", **record}, ensure_ascii=False) + "\n")
+
+    def on_end(self, reason, num_tokens, elapsed):
+        run = {"run": self._run, "end_reason": reason, "num_tokens": num_tokens, "elapsed_s": elapsed,
+               "timestamp": time.time()}
+        self.runs.append(run)
+        if self._file is not None:
+            self._file.write(json.dumps({"event": "end", **run}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def histogram(self, field, buckets=LATENCY_BUCKETS_US):
+        """
+        Counts the kept steps per latency bucket of a timing field.
+
+        Returns:
+            list: ``(upper_bound_us, count)`` pairs; the last bound is ``inf``.
+        """
+        bounds = list(buckets) + [float("inf")]
+        counts = [0] * len(bounds)
+        for record in self.steps:
+            value = record[field] * 1e6
+            for index, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+        return list(zip(bounds, counts))
+
+    def summary(self):
+        """Aggregates the kept steps and finished runs into a dict."""
+        summary = {"steps": len(self.steps), "runs": len(self.runs)}
+        for field in TIMING_FIELDS:
+            values = sorted(record[field] for record in self.steps)
+            if values:
+                summary[field] = {
+                    "total": sum(values),
+                    "p50": values[len(values) // 2],
+                    "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+                }
+        accepted = [record for record in self.steps if record["accepted_rank"] is not None]
+        summary["rejected_total"] = sum(record["rejected"] for record in self.steps)
+        summary["accepted_at_rank_0"] = sum(1 for record in accepted if record["accepted_rank"] == 0)
+        summary["mean_accepted_rank"] = (
+            sum(record["accepted_rank"] for record in accepted) / len(accepted) if accepted else 0.0
+        )
+        summary["escalated_steps"] = sum(1 for record in self.steps if record["escalation_depth"])
+        summary["max_escalation_depth"] = max((record["escalation_depth"] for record in self.steps), default=0)
+        summary["end_reasons"] = dict(Counter(run["end_reason"] for run in self.runs))
+        return summary
+
+    def report(self):
+        """A printable overview: where the step time goes and how often the PDA overruled the model."""
+        summary = self.summary()
+        lines = [f"{summary['steps']} steps in {summary['runs']} runs, end reasons {summary['end_reasons']}"]
+        for field in TIMING_FIELDS:
+            if field in summary:
+                stats = summary[field]
+                lines.append(f"{field[:-2]:>8}: total {stats['total']:.3f}s, "
+                             f"p50 {stats['p50'] * 1e3:.3f}ms, p99 {stats['p99'] * 1e3:.3f}ms")
+        lines.append(f"rejected candidates: {summary['rejected_total']}, accepted at rank 0: "
+                     f"{summary['accepted_at_rank_0']}, mean accepted rank {summary['mean_accepted_rank']:.2f}")
+        lines.append(f"top-k escalations: {summary['escalated_steps']} steps, "
+                     f"max depth {summary['max_escalation_depth']}")
+        return "\n".join(lines)
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import torch
 
@@ -9,8 +10,22 @@ def main():
     
     This script runs the PDA-augmented generation evaluation for JSON.
     """
+    parser = argparse.ArgumentParser(description="PDA-guided JSON generation evaluation")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="shard the evaluation over this many worker processes (0 runs it in-process)")
+    parser.add_argument("--output-dir", default="results/json_evaluation",
+                        help="directory for the resumable per-shard JSONL results and the merged report")
+    parser.add_argument("--devices", default=None,
+                        help="comma-separated CUDA device indices to spread the workers over, e.g. 0,1")
+    parser.add_argument("--beam-size", type=int, default=None,
+                        help="run the PDA side as grammar-constrained beam search with this many beams "
+                             "(overrides BEAM_SIZE; 1 disables it)")
+    args = parser.parse_args()
+    devices = args.devices.split(",") if args.devices else None
+
     print("--- Starting JSON Evaluation ---")
-    run_json_evaluation() 
+    run_json_evaluation(num_workers=args.workers, output_dir=args.output_dir, devices=devices,
+                        beam_size=args.beam_size)
     print("--- JSON Evaluation Finished ---")
 
 if __name__ == "__main__":
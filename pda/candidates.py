@@ -0,0 +1,48 @@
+def valid_pda_candidates(candidates, pda, json_started):
+    """
+    Yields, in order, every candidate token that keeps the generation valid.
+
+    Before the JSON document has started, any token without a ``{`` or ``[``
+    is accepted as free text; a token that opens the document is validated
+    from its first bracket on. Afterwards every character must be accepted
+    by the PDA.
+
+    Args:
+        candidates (list): ``(token_id, token_text)`` pairs, most likely first.
+        pda (JsonPDA): The automaton for the text generated so far. It is not modified.
+        json_started (bool): Whether the JSON document has already been opened.
+
+    Yields:
+        tuple: ``(token_id, token_text, new_pda, json_started)`` per valid candidate.
+    """
+    for token_id, token in candidates:
+        if not json_started:
+            first_char_index = -1
+            for i, char in enumerate(token):
+                if char in "{[":
+                    first_char_index = i
+                    break
+
+            if first_char_index == -1:
+                yield token_id, token, pda, False
+                continue
+
+            json_part = token[first_char_index:]
+            temp_pda = pda.clone()
+            if temp_pda.consume_token(json_part):
+                yield token_id, token, temp_pda, True
+        else:
+            temp_pda = pda.clone()
+            if temp_pda.consume_token(token):
+                yield token_id, token, temp_pda, True
+
+
+def select_pda_candidate(candidates, pda, json_started):
+    """
+    Picks the first candidate token that keeps the generation valid.
+
+    Returns:
+        tuple | None: ``(token_id, token_text, new_pda, json_started)`` for the
+        accepted candidate, or None if no candidate is valid.
+    """
+    return next(valid_pda_candidates(candidates, pda, json_started), None)
@@ -0,0 +1,550 @@
+import hashlib
+import json
+import os
+import re
+
+FORMAT_VERSION = 1
+GRAMMAR_CACHE_DIR = os.path.join("cache", "grammars")
+
+
+class GrammarError(ValueError):
+    """Raised for grammar files that cannot be parsed or are not LL(1)."""
+
+
+# --- EBNF reader ----------------------------------------------------------------
+#
+# A grammar is a list of rules ``name ::= alternatives ;``. Alternatives are
+# separated by ``|`` and consist of items: "literals" or 'literals', character
+# classes like [a-z] or [^"\\], rule names and parenthesised groups, each
+# optionally followed by ``*``, ``+`` or ``?``. ``#`` starts a comment. The
+# first rule is the start symbol. Grammars are scannerless: terminals are
+# single characters, so whitespace has to be spelled out where it is allowed.
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<define>::=)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<literal>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<cls>\[(?:[^\]\\]|\\.)*\])
+  | (?P<op>[|()*+?;])
+""", re.VERBOSE)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "b": "\b", "0": "\0"}
+_ESCAPE = re.compile(r"\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|.)", re.DOTALL)
+
+
+def _unescape_char(sequence):
+    if sequence[0] in "xu" and len(sequence) > 1:
+        return chr(int(sequence[1:], 16))
+    return _ESCAPES.get(sequence, sequence)
+
+
+def _split_chars(body):
+    """Splits the inside of a literal or class into ``(char, was_escaped)`` pairs."""
+    chars = []
+    i = 0
+    while i < len(body):
+        match = _ESCAPE.match(body, i)
+        if match is not None:
+            chars.append((_unescape_char(match.group(1)), True))
+            i = match.end()
+        else:
+            chars.append((body[i], False))
+            i += 1
+    return chars
+
+
+def _parse_class(text):
+    body = text[1:-1]
+    negated = body.startswith("^")
+    if negated:
+        body = body[1:]
+    chars = _split_chars(body)
+    members = set()
+    i = 0
+    while i < len(chars):
+        char = chars[i][0]
+        if i + 2 < len(chars) and chars[i + 1] == ("-", False):
+            last = chars[i + 2][0]
+            if ord(last) < ord(char):
+                raise GrammarError(f"invalid range in {text}")
+            members.update(chr(code) for code in range(ord(char), ord(last) + 1))
+            i += 3
+        else:
+            members.add(char)
+            i += 1
+    return ("set", frozenset(members), negated)
+
+
+def _tokenize(source):
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if match is None:
+            line = source.count("\n", 0, position) + 1
+            raise GrammarError(f"unexpected {source[position]!r} on line {line}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group()))
+        position = match.end()
+    return tokens
+
+
+class _RuleParser:
+    """Recursive-descent reader producing nested tuples: alt, seq, repeat, set and ref nodes."""
+
+    def __init__(self, source):
+        self.tokens = _tokenize(source)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def expect(self, kind, value=None):
+        token = self.peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise GrammarError(f"expected {value or kind}, found {token[1]!r}")
+        self.position += 1
+        return token[1]
+
+    def rules(self):
+        rules = []
+        while self.peek()[0] is not None:
+            name = self.expect("name")
+            self.expect("define")
+            rules.append((name, self.alternatives()))
+            self.expect("op", ";")
+        if not rules:
+            raise GrammarError("the grammar has no rules")
+        return rules
+
+    def alternatives(self):
+        options = [self.sequence()]
+        while self.peek() == ("op", "|"):
+            self.position += 1
+            options.append(self.sequence())
+        return ("alt", options)
+
+    def sequence(self):
+        items = []
+        while True:
+            kind, value = self.peek()
+            if kind is None or (kind == "op" and value in "|);"):
+                return ("seq", items)
+            items.append(self.item())
+
+    def item(self):
+        kind, value = self.peek()
+        self.position += 1
+        if kind == "name":
+            node = ("ref", value)
+        elif kind == "literal":
+            node = ("seq", [("set", frozenset(char), False) for char, _ in _split_chars(value[1:-1])])
+        elif kind == "cls":
+            node = _parse_class(value)
+        elif (kind, value) == ("op", "("):
+            node = self.alternatives()
+            self.expect("op", ")")
+        else:
+            raise GrammarError(f"unexpected {value!r}")
+        while self.peek()[0] == "op" and self.peek()[1] in "*+?":
+            node = ("repeat", self.peek()[1], node)
+            self.position += 1
+        return node
+
+
+# --- Compilation ------------------------------------------------------------------
+
+
+def _to_productions(rules):
+    """Desugars the EBNF nodes into plain ``(lhs, [symbols])`` productions."""
+    names = {name for name, _ in rules}
+    productions = []
+    counter = [0]
+
+    def helper(owner, kind):
+        counter[0] += 1
+        return f"{owner}__{kind}{counter[0]}"
+
+    def symbols(owner, node):
+        tag = node[0]
+        if tag == "set":
+            return [node]
+        if tag == "ref":
+            if node[1] not in names:
+                raise GrammarError(f"undefined rule {node[1]!r} in {owner!r}")
+            return [("ref", node[1])]
+        if tag == "seq":
+            result = []
+            for item in node[1]:
+                result.extend(symbols(owner, item))
+            return result
+        if tag == "alt":
+            if len(node[1]) == 1:
+                return symbols(owner, node[1][0])
+            name = helper(owner, "group")
+            for option in node[1]:
+                productions.append((name, symbols(owner, option)))
+            return [("ref", name)]
+        # Repetition: X* -> N ::= X N | ; X+ -> X X* ; X? -> N ::= X | .
+        operator, inner = node[1], node[2]
+        body = symbols(owner, inner)
+        if operator == "?":
+            name = helper(owner, "opt")
+            productions.append((name, body))
+            productions.append((name, []))
+            return [("ref", name)]
+        name = helper(owner, "rep")
+        productions.append((name, body + [("ref", name)]))
+        productions.append((name, []))
+        return body + [("ref", name)] if operator == "+" else [("ref", name)]
+
+    for name, node in rules:
+        options = node[1] if node[0] == "alt" else [node]
+        for option in options:
+            productions.append((name, symbols(name, option)))
+    return productions
+
+
+def _char_classes(terminals):
+    """
+    Partitions the characters into classes that no terminal tells apart.
+    Characters never listed in a terminal share the default class.
+    """
+    listed = set()
+    for members, _ in terminals:
+        listed.update(members)
+    signatures = {}
+    char_class = {}
+
+    def class_of(signature):
+        if signature not in signatures:
+            signatures[signature] = len(signatures)
+        return signatures[signature]
+
+    default = class_of(tuple(negated for _, negated in terminals))
+    for char in sorted(listed):
+        signature = tuple((char in members) != negated for members, negated in terminals)
+        cls = class_of(signature)
+        if cls != default:
+            char_class[char] = cls
+    masks = [0] * len(terminals)
+    for signature, cls in signatures.items():
+        for index, matches in enumerate(signature):
+            if matches:
+                masks[index] |= 1 << cls
+    return char_class, default, len(signatures), masks
+
+
+def _bits(mask):
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+def _terminal_name(members, negated):
+    if len(members) == 1 and not negated:
+        return repr(next(iter(members)))
+    return f"[{'^' if negated else ''}{len(members)} chars]"
+
+
+def compile_grammar(source):
+    """
+    Compiles EBNF grammar text into an LL(1) parse table.
+
+    Raises:
+        GrammarError: If the text cannot be read or the grammar is not LL(1).
+    """
+    rules = _RuleParser(source).rules()
+    productions = _to_productions(rules)
+
+    terminal_ids = {}
+    for _, body in productions:
+        for symbol in body:
+            if symbol[0] == "set":
+                terminal_ids.setdefault(symbol[1:], len(terminal_ids))
+    terminals = list(terminal_ids)
+    char_class, default_class, num_classes, terminal_masks = _char_classes(terminals)
+    end_bit = 1 << num_classes
+
+    nonterminals = []
+    for name, _ in productions:
+        if name not in nonterminals:
+            nonterminals.append(name)
+    offset = len(terminals)
+    symbol_id = {name: offset + index for index, name in enumerate(nonterminals)}
+    encoded = [
+        (symbol_id[name], [terminal_ids[symbol[1:]] if symbol[0] == "set" else symbol_id[symbol[1]]
+                           for symbol in body])
+        for name, body in productions
+    ]
+
+    nullable = [False] * len(nonterminals)
+    first = [0] * len(nonterminals)
+
+    def first_of(body):
+        mask = 0
+        for symbol in body:
+            if symbol < offset:
+                return mask | terminal_masks[symbol], False
+            mask |= first[symbol - offset]
+            if not nullable[symbol - offset]:
+                return mask, False
+        return mask, True
+
+    changed = True
+    while changed:
+        changed = False
+        for lhs, body in encoded:
+            mask, empty = first_of(body)
+            index = lhs - offset
+            if mask | first[index] != first[index]:
+                first[index] |= mask
+                changed = True
+            if empty and not nullable[index]:
+                nullable[index] = True
+                changed = True
+
+    follow = [0] * len(nonterminals)
+    follow[0] = end_bit
+    changed = True
+    while changed:
+        changed = False
+        for lhs, body in encoded:
+            for position, symbol in enumerate(body):
+                if symbol < offset:
+                    continue
+                mask, empty = first_of(body[position + 1:])
+                if empty:
+                    mask |= follow[lhs - offset]
+                index = symbol - offset
+                if mask | follow[index] != follow[index]:
+                    follow[index] |= mask
+                    changed = True
+
+    examples = {cls: char for char, cls in char_class.items()}
+    table = [[-1] * (num_classes + 1) for _ in nonterminals]
+    conflicts = []
+    for number, (lhs, body) in enumerate(encoded):
+        mask, empty = first_of(body)
+        if empty:
+            mask |= follow[lhs - offset]
+        row = table[lhs - offset]
+        for cls in _bits(mask):
+            if row[cls] not in (-1, number):
+                example = "end of input" if cls == num_classes else repr(examples.get(cls, "any other character"))
+                conflicts.append(f"{nonterminals[lhs - offset]} on {example}")
+            row[cls] = number
+
+    if conflicts:
+        raise GrammarError("grammar is not LL(1): conflicts for " + ", ".join(sorted(set(conflicts))))
+
+    return CompiledGrammar({
+        "format_version": FORMAT_VERSION,
+        "digest": grammar_digest(source),
+        "names": [_terminal_name(members, negated) for members, negated in terminals] + nonterminals,
+        "num_terminals": offset,
+        "char_class": char_class,
+        "default_class": default_class,
+        "terminal_masks": terminal_masks,
+        "productions": [body for _, body in encoded],
+        "table": table,
+        "nullable": nullable,
+    })
+
+
+def grammar_digest(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class CompiledGrammar:
+    """The tables of a compiled grammar, shared by every GrammarPDA created from it."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.digest = tables["digest"]
+        self.names = tables["names"]
+        self.num_terminals = tables["num_terminals"]
+        self.char_class = tables["char_class"]
+        self.default_class = tables["default_class"]
+        self.terminal_masks = tables["terminal_masks"]
+        # Productions are stored reversed, ready to be pushed onto the stack.
+        self.pushes = [list(reversed(body)) for body in tables["productions"]]
+        self.table = tables["table"]
+        self.nullable = tables["nullable"]
+        self.end_class = len(self.table[0]) - 1
+        # A terminal that matches exactly one character forces that character.
+        self.forced_char = {}
+        for terminal, mask in enumerate(self.terminal_masks):
+            classes = list(_bits(mask))
+            if len(classes) == 1 and classes[0] != self.default_class:
+                chars = [char for char, cls in self.char_class.items() if cls == classes[0]]
+                if len(chars) == 1:
+                    self.forced_char[terminal] = chars[0]
+
+    def new_pda(self):
+        return GrammarPDA(self)
+
+    def save(self, path):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.tables, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            tables = json.load(f)
+        if tables.get("format_version") != FORMAT_VERSION:
+            raise GrammarError(f"{path} was written by another version of the grammar compiler")
+        return cls(tables)
+
+
+def load_grammar(path, tables_path=None, directory=GRAMMAR_CACHE_DIR):
+    """
+    Returns the compiled grammar of an EBNF file. The tables are stored in
+    ``tables_path`` (default: ``<directory>/<grammar name>-<hash>.tables.json``)
+    and reused as long as the grammar file has not changed. If they cannot
+    be written, e.g. on a read-only installation, the grammar is compiled
+    in memory on every call.
+    """
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    digest = grammar_digest(source)
+    if tables_path is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+        tables_path = os.path.join(directory, f"{name}-{digest[:16]}.tables.json")
+    if os.path.exists(tables_path):
+        try:
+            grammar = CompiledGrammar.load(tables_path)
+        except (OSError, ValueError):
+            grammar = None
+        if grammar is not None and grammar.digest == digest:
+            return grammar
+    grammar = compile_grammar(source)
+    try:
+        os.makedirs(os.path.dirname(tables_path) or ".", exist_ok=True)
+        grammar.save(tables_path)
+    except OSError:
+        pass
+    return grammar
+
+
+# --- Runtime ------------------------------------------------------------------------
+
+
+class GrammarPDA:
+    """
+    Table-driven LL(1) push-down automaton for a compiled grammar, with the
+    interface of JsonPDA (``consume_char``/``consume_token``/``clone``/``accepts``).
+
+    The stack of pending grammar symbols is a persistent linked list, so
+    ``clone`` is constant time. For each character the top nonterminal is
+    expanded by the production the table assigns to the character's class
+    until a terminal is on top, which then has to match the character.
+    """
+
+    __slots__ = ("grammar", "_stack")
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.reset()
+
+    def reset(self):
+        self._stack = (self.grammar.num_terminals, None)
+
+    def clone(self):
+        other = GrammarPDA.__new__(GrammarPDA)
+        other.grammar = self.grammar
+        other._stack = self._stack
+        return other
+
+    @property
+    def state(self):
+        """``END`` once the input forms a complete sentence, otherwise the name of the symbol on top."""
+        if self.is_complete():
+            return "END"
+        return self.grammar.names[self._stack[0]]
+
+    @property
+    def stack(self):
+        items = []
+        node = self._stack
+        while node is not None:
+            items.append(self.grammar.names[node[0]])
+            node = node[1]
+        items.reverse()
+        return items
+
+    def config_signature(self, stack_depth=16):
+        """
+        The whole stack. Nullable symbols can be popped without consuming a
+        character, so unlike JsonPDA no bounded prefix of it is safe to use.
+        """
+        return self._stack
+
+    def forced_continuation(self):
+        """The characters of the single-character terminals on top of the stack."""
+        forced = []
+        node = self._stack
+        forced_char = self.grammar.forced_char
+        while node is not None and node[0] in forced_char:
+            forced.append(forced_char[node[0]])
+            node = node[1]
+        return "".join(forced)
+
+    def consume_char(self, char, *, partial=False):
+        return self.consume_token(char)
+
+    def consume_token(self, text):
+        grammar = self.grammar
+        num_terminals = grammar.num_terminals
+        char_class = grammar.char_class
+        default_class = grammar.default_class
+        masks = grammar.terminal_masks
+        table = grammar.table
+        pushes = grammar.pushes
+        stack = self._stack
+        valid = True
+        for char in text:
+            cls = char_class.get(char, default_class)
+            while True:
+                if stack is None:
+                    valid = False
+                    break
+                top, stack = stack
+                if top < num_terminals:
+                    if not masks[top] >> cls & 1:
+                        valid = False
+                    break
+                production = table[top - num_terminals][cls]
+                if production < 0:
+                    valid = False
+                    break
+                for symbol in pushes[production]:
+                    stack = (symbol, stack)
+            if not valid:
+                break
+        self._stack = stack
+        return valid
+
+    def is_complete(self):
+        """Whether everything left on the stack can derive the empty string."""
+        grammar = self.grammar
+        node = self._stack
+        while node is not None:
+            symbol = node[0]
+            if symbol < grammar.num_terminals or not grammar.nullable[symbol - grammar.num_terminals]:
+                return False
+            node = node[1]
+        return True
+
+    def accepts(self, text, *, partial=False):
+        self.reset()
+        if not self.consume_token(text):
+            return False
+        return partial or self.is_complete()
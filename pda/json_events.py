@@ -0,0 +1,133 @@
+import json
+import re
+
+from pda.json_pda import (
+    END,
+    EXPECT_COLON,
+    IN_PRIMITIVE,
+    IN_STRING,
+    JsonPDA,
+    _STRING_SPECIAL,
+)
+
+START_OBJECT = "start_object"
+END_OBJECT = "end_object"
+START_ARRAY = "start_array"
+END_ARRAY = "end_array"
+KEY = "key"
+SCALAR = "scalar"
+END_DOCUMENT = "end_document"
+
+_BRACKET_EVENTS = {"{": START_OBJECT, "}": END_OBJECT, "[": START_ARRAY, "]": END_ARRAY}
+_LITERALS = {"true": True, "false": False, "null": None}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+
+
+def _primitive_value(raw):
+    """Converts a number or literal as accepted by the PDA, which is a little laxer than ``json``."""
+    literal = raw.lower()
+    if literal in _LITERALS:
+        return _LITERALS[literal]
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return float(raw)
+
+
+def _string_value(raw):
+    """
+    Decodes a quoted string as accepted by the PDA, which allows any escape
+    character and short ``\\u`` escapes. Escapes ``json`` rejects are kept
+    as their raw text.
+    """
+    try:
+        return json.loads(raw, strict=False)
+    except json.JSONDecodeError:
+        pass
+
+    def decode(match):
+        escape = match.group(1)
+        if len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        return _ESCAPES.get(escape, match.group())
+
+    return _ESCAPE.sub(decode, raw[1:-1])
+
+
+class JsonEventParser:
+    """
+    Incremental SAX-style parser driven by the transitions of a JsonPDA.
+
+    ``feed`` takes any piece of JSON text and returns the events it
+    completes as ``(event, value)`` pairs: ``start_object``/``end_object``,
+    ``start_array``/``end_array``, ``key`` with the decoded key, ``scalar``
+    with the decoded string, number, boolean or None, and ``end_document``.
+    Only the string or primitive in progress is buffered, never the
+    document, and string contents are consumed in bulk.
+
+    A number or literal is only complete once the character after it has
+    been seen, so its ``scalar`` event comes with that character.
+    """
+
+    __slots__ = ("pda", "_buffer", "_ended", "offset")
+
+    def __init__(self, pda=None):
+        self.pda = pda.clone() if pda is not None else JsonPDA()
+        self._buffer = []
+        self._ended = False
+        self.offset = 0
+
+    def feed(self, text):
+        """
+        Consumes the next piece of the document.
+
+        Raises:
+            ValueError: If the text cannot continue valid JSON.
+        """
+        pda = self.pda
+        buffer = self._buffer
+        events = []
+        i = 0
+        n = len(text)
+        while i < n:
+            state = pda._state
+            if state == IN_STRING and not pda.escape:
+                match = _STRING_SPECIAL.search(text, i)
+                end = match.start() if match is not None else n
+                if end > i:
+                    buffer.append(text[i:end])
+                    pda.consume_token(text[i:end])
+                    i = end
+                    continue
+
+            char = text[i]
+            if not pda.consume_token(char):
+                raise ValueError(f"invalid JSON at offset {self.offset + i}: {char!r}")
+            after = pda._state
+
+            if state == IN_STRING:
+                buffer.append(char)
+                if after != IN_STRING:
+                    value = _string_value("".join(buffer))
+                    buffer.clear()
+                    events.append((KEY if after == EXPECT_COLON else SCALAR, value))
+            elif state == IN_PRIMITIVE and after == IN_PRIMITIVE:
+                buffer.append(char)
+            else:
+                if state == IN_PRIMITIVE:
+                    events.append((SCALAR, _primitive_value("".join(buffer))))
+                    buffer.clear()
+                if after == IN_STRING or after == IN_PRIMITIVE:
+                    buffer.append(char)
+                elif char in _BRACKET_EVENTS:
+                    events.append((_BRACKET_EVENTS[char], None))
+
+            if after == END and pda._stack is None and not self._ended:
+                self._ended = True
+                events.append((END_DOCUMENT, None))
+            i += 1
+
+        self.offset += n
+        return events
+
@@ -1,233 +1,365 @@
-import copy
+import re
+
+# Integer state codes. The stack holds return states and the two closing
+# brackets, which share this code space.
+START = 0
+EXPECT_KEY_OR_END = 1
+EXPECT_COLON = 2
+EXPECT_VALUE = 3
+EXPECT_VALUE_OR_END = 4
+EXPECT_COMMA_OR_END = 5
+IN_STRING = 6
+IN_PRIMITIVE = 7
+END = 8
+CLOSE_OBJECT = 9
+CLOSE_ARRAY = 10
+
+STATE_NAMES = (
+    "START",
+    "EXPECT_KEY_OR_END",
+    "EXPECT_COLON",
+    "EXPECT_VALUE",
+    "EXPECT_VALUE_OR_END",
+    "EXPECT_COMMA_OR_END",
+    "IN_STRING",
+    "IN_PRIMITIVE",
+    "END",
+    "}",
+    "]",
+)
+
+# --- Character classes --------------------------------------------------------
+
+C_OTHER = 0
+C_SPACE = 1
+C_LBRACE = 2
+C_RBRACE = 3
+C_LBRACKET = 4
+C_RBRACKET = 5
+C_QUOTE = 6
+C_COLON = 7
+C_COMMA = 8
+C_PRIMITIVE = 9
+
+_CHAR_CLASS = [C_OTHER] * 128
+for _char in " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f":
+    _CHAR_CLASS[ord(_char)] = C_SPACE
+for _char, _cls in (("{", C_LBRACE), ("}", C_RBRACE), ("[", C_LBRACKET), ("]", C_RBRACKET),
+                    ('"', C_QUOTE), (":", C_COLON), (",", C_COMMA)):
+    _CHAR_CLASS[ord(_char)] = _cls
+for _char in "0123456789-.tfnTFN":
+    _CHAR_CLASS[ord(_char)] = C_PRIMITIVE
+
+# --- Structural transitions ---------------------------------------------------
+
+A_FAIL = 0
+A_SKIP = 1
+A_OPEN_OBJECT = 2
+A_OPEN_ARRAY = 3
+A_OPEN_STRING = 4
+A_OPEN_PRIMITIVE = 5
+A_CLOSE_OBJECT = 6
+A_CLOSE_ARRAY = 7
+A_COLON = 8
+A_COMMA = 9
+
+_VALUE_ACTIONS = {
+    C_SPACE: A_SKIP,
+    C_LBRACE: A_OPEN_OBJECT,
+    C_LBRACKET: A_OPEN_ARRAY,
+    C_QUOTE: A_OPEN_STRING,
+    C_PRIMITIVE: A_OPEN_PRIMITIVE,
+}
+
+
+def _action_row(actions):
+    row = [A_FAIL] * (C_PRIMITIVE + 1)
+    for cls, action in actions.items():
+        row[cls] = action
+    return row
+
+
+# _ACTIONS[state][char_class] -> action. IN_STRING and IN_PRIMITIVE are
+# handled by their own fast paths and only need a row to keep indices aligned.
+_ACTIONS = [
+    _action_row(_VALUE_ACTIONS),                                                   # START
+    _action_row({C_SPACE: A_SKIP, C_RBRACE: A_CLOSE_OBJECT, C_QUOTE: A_OPEN_STRING}),  # EXPECT_KEY_OR_END
+    _action_row({C_SPACE: A_SKIP, C_COLON: A_COLON}),                             # EXPECT_COLON
+    _action_row(_VALUE_ACTIONS),                                                   # EXPECT_VALUE
+    _action_row({**_VALUE_ACTIONS, C_RBRACKET: A_CLOSE_ARRAY}),                    # EXPECT_VALUE_OR_END
+    _action_row({C_SPACE: A_SKIP, C_COMMA: A_COMMA,
+                 C_RBRACE: A_CLOSE_OBJECT, C_RBRACKET: A_CLOSE_ARRAY}),            # EXPECT_COMMA_OR_END
+    _action_row({}),                                                               # IN_STRING
+    _action_row({}),                                                               # IN_PRIMITIVE
+    _action_row({C_SPACE: A_SKIP}),                                                # END
+]
+
+# State to return to once a string or primitive opened in a given state ends.
+_RETURN_STATE = {
+    START: END,
+    EXPECT_KEY_OR_END: EXPECT_COLON,
+    EXPECT_VALUE: EXPECT_COMMA_OR_END,
+    EXPECT_VALUE_OR_END: EXPECT_COMMA_OR_END,
+}
+
+# --- Primitive sub-automaton ----------------------------------------------------
+#
+# Numbers and the literals true/false/null are recognised by a small DFA, so
+# their progress is a single integer instead of a growing buffer.
+
+P_SIGN = 0        # "-"
+P_DOT_LEAD = 1    # "." or "-." without integer digits
+P_INT = 2         # "12"
+P_DOT = 3         # "12."
+P_FRAC = 4        # "12.5" or ".5"
+P_EXP = 5         # "12e"
+P_EXP_SIGN = 6    # "12e-"
+P_EXP_DIGITS = 7  # "12e-3"
+
+_DIGITS = "0123456789"
+
+
+def _transitions(chars, target):
+    return {char: target for char in chars}
+
+
+_PRIMITIVE_START = _transitions(_DIGITS, P_INT)
+_PRIMITIVE_START.update({"-": P_SIGN, ".": P_DOT_LEAD})
+_PRIMITIVE_NEXT = [
+    {**_transitions(_DIGITS, P_INT), ".": P_DOT_LEAD},                            # P_SIGN
+    _transitions(_DIGITS, P_FRAC),                                                # P_DOT_LEAD
+    {**_transitions(_DIGITS, P_INT), ".": P_DOT, **_transitions("eE", P_EXP)},    # P_INT
+    {**_transitions(_DIGITS, P_FRAC), **_transitions("eE", P_EXP)},               # P_DOT
+    {**_transitions(_DIGITS, P_FRAC), **_transitions("eE", P_EXP)},               # P_FRAC
+    {**_transitions(_DIGITS, P_EXP_DIGITS), **_transitions("+-", P_EXP_SIGN)},    # P_EXP
+    _transitions(_DIGITS, P_EXP_DIGITS),                                          # P_EXP_SIGN
+    _transitions(_DIGITS, P_EXP_DIGITS),                                          # P_EXP_DIGITS
+]
+_PRIMITIVE_ACCEPTING = [False, False, True, True, True, False, False, True]
+
+# Literals get one DFA state per matched prefix. As before, the first letter
+# may also be upper case ("True"), the remaining ones may not.
+# _LITERAL_REST maps those states to the characters still missing.
+_LITERAL_REST = {}
+for _literal in ("true", "false", "null"):
+    _edges = _PRIMITIVE_START
+    for _i, _char in enumerate(_literal):
+        _PRIMITIVE_NEXT.append({})
+        _PRIMITIVE_ACCEPTING.append(_i == len(_literal) - 1)
+        _target = len(_PRIMITIVE_NEXT) - 1
+        _LITERAL_REST[_target] = _literal[_i + 1:]
+        _edges[_char] = _target
+        if _i == 0:
+            _edges[_char.upper()] = _target
+        _edges = _PRIMITIVE_NEXT[_target]
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+
 
 class JsonPDA:
     """
     Push-down automaton that validates JSON *incrementally*.
     This version includes full support for the JSON number format, including
     scientific notation and leading decimal points.
+
+    The stack is persistent: a linked list of ``(top, rest)`` tuples that is
+    never mutated in place, so ``clone`` shares it with the original and
+    branching costs the same at any nesting depth.
+
+    Transitions are table driven: characters are mapped to integer classes,
+    numbers and literals advance a small DFA, and string contents are skipped
+    up to the next quote or backslash without being stored. Every character
+    therefore costs constant time and memory, whatever the length of the
+    string or number it belongs to.
     """
 
-   
+    __slots__ = ("_state", "_stack", "_primitive", "escape")
+
     def __init__(self):
         self.reset()
 
     def reset(self):
-        self.state = "START"
-        self.stack = []          
-        self.buffer = ""         
-        self.escape = False     
+        self._state = START
+        self._stack = None
+        self._primitive = 0
+        self.escape = False
 
     def clone(self):
-        """Deep-copy so each beam can branch independently."""
-        return copy.deepcopy(self)
-
-   
-    def consume_char(self, char, *, partial=False):
-        """
-        Feed one character. Return **True** if the prefix can still form
-        valid JSON; **False** if it is already impossible.
-        """
-        
-        if self.state == "IN_STRING":
-            if self.escape:
-                self.buffer += char
-                self.escape = False
-                return True
-            if char == "\\":
-                self.escape = True
-                return True
-            if char == '"':
-                self.state = self.stack.pop()
-                return True
-            self.buffer += char
-            return True
+        """Constant-time copy so each beam can branch independently."""
+        other = JsonPDA.__new__(JsonPDA)
+        other._state = self._state
+        other._stack = self._stack
+        other._primitive = self._primitive
+        other.escape = self.escape
+        return other
 
-        if char.isspace():
-            return True
+    @property
+    def state(self):
+        return STATE_NAMES[self._state]
 
-        if self.state == "START":
-            if char == "{":
-                self.stack.append("}")
-                self.state = "EXPECT_KEY_OR_END"
-                return True
-            if char == "[":
-                self.stack.append("]")
-                self.state = "EXPECT_VALUE_OR_END"
-                return True
-            if char == '"':
-                self.stack.append("END")
-                self.state = "IN_STRING"
-                self.buffer = ""
-                return True
-            if self._is_primitive_start(char):
-                self.stack.append("END") 
-                self.state = "IN_PRIMITIVE"
-                self.buffer = char
-                return True
-            return False
+    @property
+    def stack(self):
+        """The stack as a list of names, bottom first."""
+        items = []
+        node = self._stack
+        while node is not None:
+            items.append(STATE_NAMES[node[0]])
+            node = node[1]
+        items.reverse()
+        return items
 
-        
-        if self.state == "EXPECT_KEY_OR_END":
-            if char == "}":
-                if not self.stack or self.stack.pop() != "}": return False
-                self.state = self._get_next_state()
-                return True
-            if char == '"':
-                self.stack.append("EXPECT_COLON")
-                self.state = "IN_STRING"
-                self.buffer = ""
-                return True
-            return False
-
-        if self.state == "EXPECT_COLON":
-            if char == ":":
-                self.state = "EXPECT_VALUE"
-                return True
-            return False
-
-        if self.state == "EXPECT_VALUE":
-            if char == "{":
-                self.stack.append("}")
-                self.state = "EXPECT_KEY_OR_END"
-                return True
-            if char == "[":
-                self.stack.append("]")
-                self.state = "EXPECT_VALUE_OR_END"
-                return True
-            if char == '"':
-                self.stack.append("EXPECT_COMMA_OR_END")
-                self.state = "IN_STRING"
-                self.buffer = ""
-                return True
-            if self._is_primitive_start(char):
-                self.stack.append("EXPECT_COMMA_OR_END")
-                self.state = "IN_PRIMITIVE"
-                self.buffer = char
-                return True
-            return False
-
-       
-        if self.state == "IN_PRIMITIVE":
-            if self._is_primitive_char(char):
-                self.buffer += char
-                return True
-            if not self._validate_primitive():
-                return False
-            self.state = self.stack.pop()
-            return self.consume_char(char, partial=partial)
-
-        if self.state == "EXPECT_VALUE_OR_END":
-            if char == "]":
-                if not self.stack or self.stack.pop() != "]": return False
-                self.state = self._get_next_state()
-                return True
-            if char == "{":
-                self.stack.append("}")
-                self.state = "EXPECT_KEY_OR_END"
-                return True
-            if char == "[":
-                self.stack.append("]")
-                self.state = "EXPECT_VALUE_OR_END"
-                return True
-            if char == '"':
-                self.stack.append("EXPECT_COMMA_OR_END")
-                self.state = "IN_STRING"
-                self.buffer = ""
-                return True
-            if self._is_primitive_start(char):
-                self.stack.append("EXPECT_COMMA_OR_END")
-                self.state = "IN_PRIMITIVE"
-                self.buffer = char
-                return True
-            return False
-
-        if self.state == "EXPECT_COMMA_OR_END":
-            if char == ",":
-                top = self.stack[-1] if self.stack else None
-                self.state = "EXPECT_KEY_OR_END" if top == "}" else "EXPECT_VALUE_OR_END"
-                return True
-            if char in "]}":
-                if not self.stack or self.stack[-1] != char:
-                    return False
-                self.stack.pop()
-                self.state = self._get_next_state()
-                return True
-            return False
-
-        if self.state == "END":
-            return False
-
-        return False
+    def config_signature(self, stack_depth=16):
+        """
+        Hashable key for the parts of the configuration that decide which
+        continuations are valid: the state, the top ``stack_depth`` stack
+        entries, the escape flag and the DFA state of a primitive in progress.
 
-   
-    def _get_next_state(self):
-        if not self.stack:
-            return "END"
-        top = self.stack[-1]
-        if top == "END": 
-             return "END"
-        return "EXPECT_COMMA_OR_END"
+        A token of n characters pops at most n + 1 stack entries and then
+        looks at the entry below, so two configurations with equal signatures
+        accept the same tokens of length up to ``stack_depth - 2``.
+        """
+        top = []
+        node = self._stack
+        while node is not None and len(top) < stack_depth:
+            top.append(node[0])
+            node = node[1]
+        primitive = self._primitive if self._state == IN_PRIMITIVE else None
+        return (self._state, tuple(top), self.escape, primitive)
 
-    def _is_primitive_start(self, char):
-        return char.isdigit() or char in "-." or char.lower() in ("t", "f", "n")
+    def forced_continuation(self):
+        """
+        Returns the characters that every valid continuation has to start
+        with, apart from optional whitespace: the ``:`` after a key or the
+        rest of a started literal. Returns an empty string if more than one
+        continuation is possible.
+        """
+        if self._state == EXPECT_COLON:
+            return ":"
+        if self._state == IN_PRIMITIVE:
+            return _LITERAL_REST.get(self._primitive, "")
+        return ""
 
-    def _is_primitive_char(self, char):
-        if not self.buffer:
-            return False
-        first = self.buffer[0].lower()
+    def consume_char(self, char, *, partial=False):
+        """
+        Feed one character. Return **True** if the prefix can still form
+        valid JSON; **False** if it is already impossible.
+        """
+        return self.consume_token(char)
 
-        if first in "tfn":
-            if first == "t": return len(self.buffer) < 4 and char in "true"[len(self.buffer):]
-            if first == "f": return len(self.buffer) < 5 and char in "false"[len(self.buffer):]
-            if first == "n": return len(self.buffer) < 4 and char in "null"[len(self.buffer):]
-            return False
+    def consume_token(self, text):
+        """
+        Feed a whole token in one loop. Return **True** if the prefix can
+        still form valid JSON; **False** if it is already impossible, in
+        which case the automaton is left in an unspecified state and should
+        be discarded (clone before trying a candidate).
+        """
+        state = self._state
+        stack = self._stack
+        primitive = self._primitive
+        escape = self.escape
+        actions = _ACTIONS
+        char_class = _CHAR_CLASS
+        valid = True
 
-        if char.isdigit():
-            return True
+        i = 0
+        n = len(text)
+        while i < n:
+            char = text[i]
 
-        if char == '.':
-           
-            return '.' not in self.buffer and 'e' not in self.buffer.lower()
+            if state == IN_STRING:
+                if escape:
+                    escape = False
+                elif char == '"':
+                    state, stack = stack
+                elif char == "\\":
+                    escape = True
+                else:
+                    match = _STRING_SPECIAL.search(text, i + 1) if i + 1 < n else None
+                    i = match.start() if match is not None else n
+                    continue
+                i += 1
+                continue
 
-        if char.lower() == 'e':
-     
-            return 'e' not in self.buffer.lower()
+            if state == IN_PRIMITIVE:
+                target = _PRIMITIVE_NEXT[primitive].get(char)
+                if target is not None:
+                    primitive = target
+                    i += 1
+                    continue
+                if not _PRIMITIVE_ACCEPTING[primitive]:
+                    valid = False
+                    break
+                # The primitive ends here; the character is handled again
+                # by the state it returns to.
+                state, stack = stack
+                continue
 
-        if char in "+-":
-           
-            if len(self.buffer) == 1 and self.buffer[0] == '-':
-                 return False
-            last_char = self.buffer[-1].lower()
-            return last_char == 'e'
+            code = ord(char)
+            if code < 128:
+                cls = char_class[code]
+            else:
+                cls = C_SPACE if char.isspace() else C_OTHER
+            action = actions[state][cls]
 
-        return False
+            if action == A_SKIP:
+                pass
+            elif action == A_OPEN_STRING:
+                stack = (_RETURN_STATE[state], stack)
+                state = IN_STRING
+            elif action == A_COLON:
+                state = EXPECT_VALUE
+            elif action == A_COMMA:
+                top = stack[0] if stack is not None else None
+                state = EXPECT_KEY_OR_END if top == CLOSE_OBJECT else EXPECT_VALUE_OR_END
+            elif action == A_OPEN_PRIMITIVE:
+                stack = (_RETURN_STATE[state], stack)
+                state = IN_PRIMITIVE
+                primitive = _PRIMITIVE_START[char]
+            elif action == A_OPEN_OBJECT:
+                stack = (CLOSE_OBJECT, stack)
+                state = EXPECT_KEY_OR_END
+            elif action == A_OPEN_ARRAY:
+                stack = (CLOSE_ARRAY, stack)
+                state = EXPECT_VALUE_OR_END
+            elif action == A_CLOSE_OBJECT or action == A_CLOSE_ARRAY:
+                closer = CLOSE_OBJECT if action == A_CLOSE_OBJECT else CLOSE_ARRAY
+                if stack is None or stack[0] != closer:
+                    valid = False
+                    break
+                stack = stack[1]
+                state = END if stack is None or stack[0] == END else EXPECT_COMMA_OR_END
+            else:
+                valid = False
+                break
+            i += 1
 
-    def _validate_primitive(self):
-        if not self.buffer:
-            return False
-        s = self.buffer.lower()
-        if s in ("true", "false", "null"):
-            return True
-        try:
-            float(s)
-            return True
-        except ValueError:
-            return False
+        self._state = state
+        self._stack = stack
+        self._primitive = primitive
+        self.escape = escape
+        return valid
 
     def accepts(self, text, *, partial=False):
+        """
+        Validate a whole text from scratch. With ``partial=True`` any text
+        that can still be completed to valid JSON is accepted.
+        """
         self.reset()
-        for idx, ch in enumerate(text):
-            if not self.consume_char(ch, partial=True): 
-                return False
-        
-        if self.buffer and not self._validate_primitive():
+        if not self.consume_token(text):
             return False
-        
-        final_state = self.state
-        if self.buffer:
-            final_state = self.stack[-1] if self.stack else "END"
+        if partial:
+            return True
+        return self.is_complete()
 
-        return partial or (final_state == "END" and not self.stack)
+    def is_complete(self):
+        """Whether the text consumed so far is a complete JSON document."""
+        state = self._state
+        stack = self._stack
+        if state == IN_PRIMITIVE:
+            if not _PRIMITIVE_ACCEPTING[self._primitive]:
+                return False
+            state, stack = stack
+        return state == END and stack is None
 
     def _is_partial_acceptable(self):
-        return True 
+        return True
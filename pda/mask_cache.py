@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+class TokenMaskCache:
+    """
+    LRU cache from PDA configuration signatures to the allowed-token set of
+    a VocabTrie.
+
+    It exposes the same ``allowed_token_ids``/``token_texts`` interface as
+    the trie, so it can be passed wherever a trie is expected. Recurring
+    configurations (inside a string, expecting a colon, ...) then cost a
+    dictionary lookup instead of a walk over the vocabulary.
+
+    It can be shared by threads: a lock guards the lookup and the insert,
+    while the walk on a miss runs outside it, so concurrent misses proceed
+    in parallel (the trie itself is read-only).
+    """
+
+    def __init__(self, vocab_trie, maxsize=256, transform=None, stack_depth=None):
+        """
+        Args:
+            vocab_trie (VocabTrie): The trie that computes allowed tokens on a miss.
+            maxsize (int): Maximum number of cached configurations.
+            transform (callable, optional): Applied to the list of allowed ids
+                before caching, e.g. to store a ready-made tensor.
+            stack_depth (int, optional): Stack entries included in the signature.
+                Defaults to the longest token length plus two, which keeps
+                the cache exact for every token of the vocabulary.
+        """
+        self.vocab_trie = vocab_trie
+        self.maxsize = maxsize
+        self.transform = transform
+        if stack_depth is None:
+            stack_depth = vocab_trie.max_token_length + 2
+        self.stack_depth = stack_depth
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def token_texts(self):
+        return self.vocab_trie.token_texts
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def allowed_token_ids(self, pda):
+        key = pda.config_signature(self.stack_depth)
+        with self._lock:
+            allowed = self._entries.get(key)
+            if allowed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return allowed
+            self.misses += 1
+
+        allowed = self.vocab_trie.allowed_token_ids(pda)
+        if self.transform is not None:
+            allowed = self.transform(allowed)
+        with self._lock:
+            self._entries[key] = allowed
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return allowed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
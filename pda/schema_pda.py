@@ -0,0 +1,437 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from pda.json_pda import (
+    END,
+    EXPECT_COLON,
+    EXPECT_COMMA_OR_END,
+    EXPECT_KEY_OR_END,
+    EXPECT_VALUE,
+    EXPECT_VALUE_OR_END,
+    IN_PRIMITIVE,
+    IN_STRING,
+    START,
+    JsonPDA,
+)
+
+_VALUE_STATES = (START, EXPECT_VALUE, EXPECT_VALUE_OR_END)
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# Context kinds on the schema stack.
+OBJECT = 0
+ARRAY = 1
+
+# What the characters of the current string or primitive are collected for.
+TEXT_KEY = 1
+TEXT_VALUE = 2
+
+
+class SchemaNode:
+    """
+    Compiled form of one (sub)schema: the allowed JSON types, known property
+    names in their escaped JSON spelling, required names, the item schema of
+    arrays and the compact JSON spelling of enum values.
+    """
+
+    __slots__ = ("types", "properties", "key_names", "required", "closed", "items", "enum_texts", "integer_only")
+
+    def __init__(self):
+        self.types = None
+        self.properties = {}
+        self.key_names = {}
+        self.required = frozenset()
+        self.closed = False
+        self.items = None
+        self.enum_texts = None
+        self.integer_only = False
+
+    def allows(self, kind):
+        return self.types is None or kind in self.types
+
+
+ANY = SchemaNode()
+ANY.items = ANY
+
+
+def _resolve_ref(ref, root):
+    if not ref.startswith("#"):
+        return None
+    target = root
+    for part in ref[1:].split("/"):
+        if not part:
+            continue
+        part = part.replace("~1", "/").replace("~0", "~")
+        if not isinstance(target, dict) or part not in target:
+            return None
+        target = target[part]
+    return target
+
+
+def _compile_node(schema, root, nodes, depth=0):
+    if depth > 32:
+        return ANY
+    if isinstance(schema, dict) and isinstance(schema.get("$ref"), str):
+        schema = _resolve_ref(schema["$ref"], root)
+    if not isinstance(schema, dict) or not schema:
+        return ANY
+    if id(schema) in nodes:
+        return nodes[id(schema)]
+
+    node = SchemaNode()
+    nodes[id(schema)] = node
+
+    types = schema.get("type")
+    if isinstance(types, str):
+        types = [types]
+    if isinstance(types, list):
+        node.types = frozenset("number" if t == "integer" else t for t in types)
+        node.integer_only = "integer" in types and "number" not in types
+    elif "properties" in schema:
+        node.types = frozenset(["object"])
+    elif "items" in schema:
+        node.types = frozenset(["array"])
+
+    values = schema.get("enum")
+    if "const" in schema:
+        values = [schema["const"]]
+    if isinstance(values, list) and values and all(isinstance(v, _SCALAR_TYPES) for v in values):
+        node.enum_texts = tuple(json.dumps(v, ensure_ascii=False, separators=(",", ":")) for v in values)
+
+    properties = schema.get("properties")
+    if isinstance(properties, dict):
+        for name, subschema in properties.items():
+            node.properties[name] = _compile_node(subschema, root, nodes, depth + 1)
+        additional = schema.get("additionalProperties")
+        node.closed = bool(properties) and additional in (None, False)
+    required = schema.get("required")
+    if isinstance(required, list):
+        node.required = frozenset(name for name in required if isinstance(name, str))
+        for name in node.required:
+            node.properties.setdefault(name, ANY)
+    node.key_names = {json.dumps(name, ensure_ascii=False)[1:-1]: name for name in node.properties}
+
+    items = schema.get("items")
+    node.items = _compile_node(items, root, nodes, depth + 1) if isinstance(items, dict) else ANY
+    return node
+
+
+def _common_prefix(texts):
+    if not texts:
+        return ""
+    first, last = min(texts), max(texts)
+    i = 0
+    while i < len(first) and first[i] == last[i]:
+        i += 1
+    return first[:i]
+
+
+class CompiledSchema:
+    """A JSON schema compiled into SchemaNodes; ``new_pda`` creates automata for it."""
+
+    def __init__(self, schema, digest):
+        self.digest = digest
+        self.root = _compile_node(schema, schema, {})
+
+    def new_pda(self):
+        return SchemaPDA(self.root)
+
+
+class SchemaPDA:
+    """
+    JsonPDA that additionally enforces a compiled JSON schema.
+
+    Syntax is checked by an inner JsonPDA; on top of it a persistent stack of
+    object/array contexts tracks which schema applies to the next value.
+    Object keys must be known property names (unless ``additionalProperties``
+    is set), may not repeat, and an object cannot close before its required
+    keys are present. Values must match the schema's types and enums, and
+    integers may not contain a fraction or exponent.
+
+    It exposes the same interface as JsonPDA, so it plugs into the decoders,
+    the vocabulary trie and the mask cache unchanged. ``forced_continuation``
+    follows the schema as far as it is unambiguous, e.g. through the rest of
+    a key name and its colon.
+    """
+
+    __slots__ = ("root", "_syntax", "_contexts", "_text", "_text_kind", "_node")
+
+    def __init__(self, root):
+        self.root = root
+        self.reset()
+
+    def reset(self):
+        self._syntax = JsonPDA()
+        self._contexts = None
+        self._text = None
+        self._text_kind = None
+        self._node = None
+
+    def clone(self):
+        other = SchemaPDA.__new__(SchemaPDA)
+        other.root = self.root
+        other._syntax = self._syntax.clone()
+        other._contexts = self._contexts
+        other._text = self._text
+        other._text_kind = self._text_kind
+        other._node = self._node
+        return other
+
+    @property
+    def state(self):
+        return self._syntax.state
+
+    @property
+    def stack(self):
+        return self._syntax.stack
+
+    @property
+    def escape(self):
+        return self._syntax.escape
+
+    def config_signature(self, stack_depth=16):
+        contexts = []
+        node = self._contexts
+        while node is not None and len(contexts) < stack_depth:
+            contexts.append(node[0])
+            node = node[1]
+        return (
+            self._syntax.config_signature(stack_depth),
+            tuple(contexts),
+            self._text_kind,
+            self._text,
+            self._node,
+        )
+
+    def _value_node(self):
+        if self._contexts is None:
+            return self.root
+        context = self._contexts[0]
+        if context[0] == ARRAY:
+            return context[1].items
+        return context[3]
+
+    def _remaining_keys(self, context):
+        """Escaped names of the known keys that the object context has not used yet."""
+        node, seen = context[1], context[2]
+        return [text for text, name in node.key_names.items() if name not in seen]
+
+    def consume_token(self, text):
+        for char in text:
+            if not self.consume_char(char):
+                return False
+        return True
+
+    def consume_char(self, char, *, partial=False):
+        previous = self._syntax._state
+        if not self._syntax.consume_char(char):
+            return False
+        state = self._syntax._state
+
+        if previous == IN_STRING:
+            closed = state != IN_STRING
+            if self._text_kind == TEXT_KEY:
+                return self._key_char(char, closed)
+            if self._text_kind == TEXT_VALUE:
+                self._text += char
+                if closed:
+                    return self._finish_scalar()
+                return any(t.startswith(self._text) for t in self._node.enum_texts)
+            return True
+
+        if previous == IN_PRIMITIVE:
+            if state == IN_PRIMITIVE:
+                if self._node is not None and self._node.integer_only and char in ".eE":
+                    return False
+                if self._text_kind == TEXT_VALUE:
+                    self._text += char
+                    return any(t.startswith(self._text) for t in self._node.enum_texts)
+                return True
+            if not self._finish_scalar():
+                return False
+            # The primitive ended and the character was handled by the state
+            # it returned to.
+            previous = EXPECT_COMMA_OR_END if self._contexts is not None else END
+
+        if char.isspace():
+            return True
+
+        if previous in _VALUE_STATES and not (char == "]" and previous == EXPECT_VALUE_OR_END):
+            return self._start_value(char)
+
+        if char == "}" or char == "]":
+            context = self._contexts[0]
+            if context[0] == OBJECT and not context[1].required <= context[2]:
+                return False
+            self._contexts = self._contexts[1]
+            return True
+
+        if previous == EXPECT_KEY_OR_END or (char == "," and self._contexts[0][0] == OBJECT):
+            context = self._contexts[0]
+            if context[1].closed and not self._remaining_keys(context):
+                return False
+            if char == '"':
+                self._text = ""
+                self._text_kind = TEXT_KEY
+            return True
+
+        return True
+
+    def _start_value(self, char):
+        node = self._value_node()
+        if char == "{":
+            kind = "object"
+        elif char == "[":
+            kind = "array"
+        elif char == '"':
+            kind = "string"
+        elif char in "tTfF":
+            kind = "boolean"
+        elif char in "nN":
+            kind = "null"
+        else:
+            kind = "number"
+            if node.integer_only and char == ".":
+                return False
+        if not node.allows(kind):
+            return False
+        if node.enum_texts is not None and kind in ("object", "array"):
+            return False
+
+        if kind == "object":
+            self._contexts = ((OBJECT, node, frozenset(), None), self._contexts)
+        elif kind == "array":
+            self._contexts = ((ARRAY, node), self._contexts)
+        elif node.enum_texts is not None:
+            if not any(t.startswith(char) for t in node.enum_texts):
+                return False
+            self._text = char
+            self._text_kind = TEXT_VALUE
+            self._node = node
+        elif node.integer_only:
+            self._node = node
+        return True
+
+    def _finish_scalar(self):
+        valid = self._text_kind != TEXT_VALUE or self._text in self._node.enum_texts
+        self._text = None
+        self._text_kind = None
+        self._node = None
+        return valid
+
+    def _key_char(self, char, closed):
+        context = self._contexts[0]
+        node, seen = context[1], context[2]
+        if not closed:
+            self._text += char
+            if node.closed:
+                return any(t.startswith(self._text) for t in self._remaining_keys(context))
+            return True
+
+        key = self._text
+        self._text = None
+        self._text_kind = None
+        name = node.key_names.get(key)
+        if name is None:
+            if node.closed:
+                return False
+            name = key
+        if name in seen:
+            return False
+        self._contexts = ((OBJECT, node, seen | {name}, node.properties.get(name, ANY)), self._contexts[1])
+        return True
+
+    def _forced_step(self):
+        """The next unambiguous piece of text, or an empty string."""
+        state = self._syntax._state
+        context = self._contexts[0] if self._contexts is not None else None
+
+        if state == IN_STRING or state == IN_PRIMITIVE:
+            if self._text_kind == TEXT_KEY and context[1].closed:
+                candidates = [t[len(self._text):] for t in self._remaining_keys(context) if t.startswith(self._text)]
+                if len(candidates) == 1:
+                    return candidates[0] + '"'
+                return _common_prefix(candidates)
+            if self._text_kind == TEXT_VALUE:
+                return _common_prefix([t[len(self._text):] for t in self._node.enum_texts if t.startswith(self._text)])
+            return self._syntax.forced_continuation() if state == IN_PRIMITIVE else ""
+
+        if state == EXPECT_COLON:
+            return ":"
+
+        if state in (EXPECT_KEY_OR_END, EXPECT_COMMA_OR_END) and context is not None and context[0] == OBJECT:
+            node, seen = context[1], context[2]
+            if node.closed and not self._remaining_keys(context):
+                return "}"
+            if not node.required <= seen:
+                return '"' if state == EXPECT_KEY_OR_END else ","
+            return ""
+
+        if state in _VALUE_STATES and not (state == EXPECT_VALUE_OR_END and context is not None):
+            node = self._value_node()
+            if node.enum_texts is not None:
+                return _common_prefix(list(node.enum_texts))
+            if node.types is not None and len(node.types) == 1:
+                return {"object": "{", "array": "[", "string": '"', "null": "null"}.get(next(iter(node.types)), "")
+        return ""
+
+    def forced_continuation(self, limit=256):
+        """
+        Returns the text that every schema-valid continuation has to start
+        with, apart from optional whitespace, following the schema through
+        as many unambiguous steps as possible.
+        """
+        probe = self.clone()
+        forced = ""
+        while len(forced) < limit:
+            step = probe._forced_step()
+            if not step or not probe.consume_token(step):
+                break
+            forced += step
+        return forced
+
+    def accepts(self, text, *, partial=False):
+        self.reset()
+        if not self.consume_token(text):
+            return False
+        if partial:
+            return True
+        return self.is_complete()
+
+    def is_complete(self):
+        # Trailing whitespace closes a top-level primitive.
+        probe = self.clone()
+        return probe.consume_char(" ") and probe._syntax._state == END and probe._syntax._stack is None
+
+
+_COMPILED_SCHEMAS = OrderedDict()
+_CACHE_SIZE = 256
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def schema_digest(schema):
+    """SHA-256 of the schema's canonical JSON encoding."""
+    text = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compile_schema(schema):
+    """
+    Compiles a JSON schema (dict or JSON string), reusing the compiled form
+    of any schema with the same hash that was compiled before.
+    """
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    digest = schema_digest(schema)
+    compiled = _COMPILED_SCHEMAS.get(digest)
+    if compiled is not None:
+        _COMPILED_SCHEMAS.move_to_end(digest)
+        cache_stats["hits"] += 1
+        return compiled
+
+    cache_stats["misses"] += 1
+    compiled = CompiledSchema(schema, digest)
+    _COMPILED_SCHEMAS[digest] = compiled
+    if len(_COMPILED_SCHEMAS) > _CACHE_SIZE:
+        _COMPILED_SCHEMAS.popitem(last=False)
+    return compiled
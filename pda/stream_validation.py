@@ -0,0 +1,131 @@
+import codecs
+import mmap
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from pda.json_pda import JsonPDA
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# ``error_offset`` is None for a valid document. It counts bytes for byte
+# input and characters for text input; an offset equal to ``length`` means
+# the input ended before the document was complete.
+ValidationResult = namedtuple("ValidationResult", ("valid", "error_offset", "length", "message"))
+
+
+def _first_error(pda, text):
+    """Index of the first character of ``text`` that ``pda`` rejects, stepping a copy one character at a time."""
+    probe = pda.clone()
+    for index, char in enumerate(text):
+        if not probe.consume_char(char):
+            return index
+    return len(text)
+
+
+def validate_chunks(chunks, pda=None):
+    """
+    Validates a JSON document that arrives in pieces.
+
+    ``chunks`` is any iterable of ``str`` or ``bytes`` (UTF-8). The PDA state
+    carries over from one chunk to the next, so a string, number or escape
+    sequence may be split anywhere, including inside a multi-byte character.
+    Each chunk is fed with a single ``consume_token`` call, which skips the
+    ordinary characters of strings in bulk. Only when a chunk fails is it
+    walked again character by character to locate the error.
+
+    Args:
+        chunks: Iterable of text or byte chunks.
+        pda (optional): Automaton to validate with, e.g. a SchemaPDA; a JsonPDA by default.
+
+    Returns:
+        ValidationResult: Validity, offset of the first error, input length and a message.
+    """
+    pda = pda.clone() if pda is not None else JsonPDA()
+    decoder = None
+    length = 0
+    for chunk in chunks:
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder("utf-8")()
+            # Bytes of a character split at the previous boundary are decoded with this chunk.
+            start = length - len(decoder.getstate()[0])
+            try:
+                text = decoder.decode(chunk)
+            except UnicodeDecodeError as error:
+                return ValidationResult(False, start + error.start, length + len(chunk), "invalid UTF-8")
+            length += len(chunk)
+        else:
+            text = chunk
+            start = length
+            length += len(chunk)
+
+        before = pda.clone()
+        if not pda.consume_token(text):
+            index = _first_error(before, text)
+            offset = start + (len(text[:index].encode("utf-8")) if decoder is not None else index)
+            return ValidationResult(False, offset, length, f"unexpected {text[index]!r}")
+
+    if decoder is not None and decoder.getstate()[0]:
+        return ValidationResult(False, length - len(decoder.getstate()[0]), length, "truncated UTF-8 sequence")
+    if not pda.is_complete():
+        return ValidationResult(False, length, length, "unexpected end of input")
+    return ValidationResult(True, None, length, "")
+
+
+def _mapped_chunks(mapped, chunk_size):
+    for start in range(0, len(mapped), chunk_size):
+        yield mapped[start:start + chunk_size]
+
+
+def validate_file(path, chunk_size=DEFAULT_CHUNK_SIZE, pda=None):
+    """
+    Validates a JSON file without reading it into memory: the file is
+    memory-mapped and fed to ``validate_chunks`` ``chunk_size`` bytes at a
+    time. Offsets in the result are byte offsets.
+    """
+    if os.path.getsize(path) == 0:
+        return ValidationResult(False, 0, 0, "unexpected end of input")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return validate_chunks(_mapped_chunks(mapped, chunk_size), pda=pda)
+
+
+def _validate_path(path, chunk_size):
+    try:
+        return path, validate_file(path, chunk_size)
+    except OSError as error:
+        return path, ValidationResult(False, None, 0, str(error))
+
+
+def validate_files(paths, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Validates many JSON files in parallel on a process pool of ``workers``
+    processes (one per CPU by default).
+
+    Returns:
+        list: ``(path, ValidationResult)`` pairs in the order of ``paths``.
+    """
+    paths = list(paths)
+    if workers == 1 or len(paths) <= 1:
+        return [_validate_path(path, chunk_size) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_validate_path, paths, [chunk_size] * len(paths), chunksize=8))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate JSON files with the JSON PDA")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    invalid = 0
+    for path, result in validate_files(args.paths, workers=args.workers, chunk_size=args.chunk_size):
+        if result.valid:
+            print(f"{path}: valid ({result.length} bytes)")
+        else:
+            invalid += 1
+            print(f"{path}: invalid at byte {result.error_offset}: {result.message}")
+    raise SystemExit(1 if invalid else 0)
@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from pda.vocab_trie import VocabTrie
+
+MAGIC = b"PDAVOCAB"
+FORMAT_VERSION = 1
+
+# Section order of the file. Every section is an array of uint32 except the
+# UTF-8 text blob; all of them start on a 4-byte boundary.
+_SECTIONS = (
+    "text_offsets",  # vocab_size + 1 byte offsets into text_blob
+    "text_blob",  # UTF-8 decoded text of every token id, concatenated
+    "first_chars",  # sorted code points that start a trie token
+    "first_offsets",  # len(first_chars) + 1 offsets into first_tokens
+    "first_tokens",  # trie token ids grouped by first character
+    "child_start",  # num_nodes + 1: the children of node n are nodes child_start[n]..child_start[n + 1] - 1
+    "node_char",  # code point on the edge into each node (0 for the root)
+    "token_start",  # num_nodes + 1 offsets into node_tokens
+    "node_tokens",  # ids of the tokens that end at each node
+)
+_HEADER = struct.Struct("<8sII4s" + "II" * len(_SECTIONS))
+
+
+def _uint32(values=()):
+    return array("I", values)
+
+
+class TokenTexts:
+    """
+    Read-only sequence of the decoded text of every token id of a VocabIndex.
+    Texts are cut out of the mapped blob on first use and kept per process.
+    """
+
+    __slots__ = ("_offsets", "_blob", "_cache")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, token_id):
+        text = self._cache.get(token_id)
+        if text is None:
+            if not 0 <= token_id < len(self._offsets) - 1:
+                raise IndexError(token_id)
+            text = str(self._blob[self._offsets[token_id]:self._offsets[token_id + 1]], "utf-8")
+            self._cache[token_id] = text
+        return text
+
+
+def write_vocab_index(path, token_texts, excluded_ids=()):
+    """
+    Writes the vocabulary index of a tokenizer to ``path``.
+
+    Args:
+        path (str): Output file. It is written next to its final name and
+            renamed into place, so readers never see a partial file.
+        token_texts (list): Decoded text of every token id, in id order.
+        excluded_ids (iterable): Ids (e.g. special tokens) that keep their text
+            but are left out of the trie and the first-character index.
+    """
+    excluded_ids = set(excluded_ids)
+    trie = VocabTrie(
+        (token_id, text) for token_id, text in enumerate(token_texts) if token_id not in excluded_ids
+    )
+
+    encoded = [text.encode("utf-8") for text in token_texts]
+    text_offsets = _uint32([0])
+    for data in encoded:
+        text_offsets.append(text_offsets[-1] + len(data))
+    text_blob = b"".join(encoded)
+
+    by_first_char = {}
+    for token_id, text in trie.token_texts.items():
+        by_first_char.setdefault(ord(text[0]), []).append(token_id)
+    first_chars = _uint32(sorted(by_first_char))
+    first_offsets = _uint32([0])
+    first_tokens = _uint32()
+    for code in first_chars:
+        first_tokens.extend(sorted(by_first_char[code]))
+        first_offsets.append(len(first_tokens))
+
+    # Breadth-first numbering keeps the children of every node contiguous.
+    child_start = _uint32()
+    node_char = _uint32([0])
+    token_start = _uint32([0])
+    node_tokens = _uint32()
+    queue = [trie.root]
+    next_node = 1
+    for node in queue:
+        child_start.append(next_node)
+        for char in sorted(node.children):
+            node_char.append(ord(char))
+            queue.append(node.children[char])
+            next_node += 1
+        node_tokens.extend(sorted(node.token_ids))
+        token_start.append(len(node_tokens))
+    child_start.append(next_node)
+
+    sections = [text_offsets, text_blob, first_chars, first_offsets, first_tokens,
+                child_start, node_char, token_start, node_tokens]
+    layout = []
+    position = _HEADER.size
+    for section in sections:
+        size = len(section) * 4 if isinstance(section, array) else len(section)
+        layout.extend((position, len(section)))
+        position += size + (-size % 4)
+
+    byte_order = b"LE\0\0" if sys.byteorder == "little" else b"BE\0\0"
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, trie.max_token_length, byte_order, *layout))
+        for section in sections:
+            data = section.tobytes() if isinstance(section, array) else section
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 4))
+    os.replace(temporary, path)
+
+
+class VocabIndex:
+    """
+    Memory-mapped vocabulary index written by ``write_vocab_index``.
+
+    Opening one is a file open and an mmap: the token texts, the
+    first-character index and the character trie are read straight from the
+    mapped pages, so every process on a node that opens the same file shares
+    one read-only copy in the page cache. It has the ``allowed_token_ids``,
+    ``token_texts`` and ``max_token_length`` interface of VocabTrie and can
+    be wrapped in a TokenMaskCache in the same way. Unlike the trie's,
+    ``token_texts`` covers every id of the vocabulary, so it can replace
+    ``tokenizer.decode([token_id])``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mmap)
+        magic, version, self.max_token_length, byte_order = header[:4]
+        native = b"LE\0\0" if sys.byteorder == "little" else b"BE\0\0"
+        if magic != MAGIC or version != FORMAT_VERSION or byte_order != native:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a vocabulary index of this version and platform; rebuild it")
+
+        view = memoryview(self._mmap)
+        layout = header[4:]
+        sections = {}
+        for index, name in enumerate(_SECTIONS):
+            offset, length = layout[2 * index], layout[2 * index + 1]
+            if name == "text_blob":
+                sections[name] = view[offset:offset + length]
+            else:
+                sections[name] = view[offset:offset + 4 * length].cast("I")
+        self._sections = sections
+        self.token_texts = TokenTexts(sections["text_offsets"], sections["text_blob"])
+        self._first_chars = sections["first_chars"]
+        self._first_offsets = sections["first_offsets"]
+        self._first_tokens = sections["first_tokens"]
+        self._child_start = sections["child_start"]
+        self._node_char = sections["node_char"]
+        self._token_start = sections["token_start"]
+        self._node_tokens = sections["node_tokens"]
+
+    def __len__(self):
+        """Number of tokens in the trie, as for VocabTrie."""
+        return len(self._node_tokens)
+
+    @property
+    def vocab_size(self):
+        return len(self.token_texts)
+
+    def tokens_starting_with(self, char):
+        """Ids of the trie tokens whose text starts with ``char``."""
+        code = ord(char)
+        index = bisect_left(self._first_chars, code)
+        if index == len(self._first_chars) or self._first_chars[index] != code:
+            return []
+        return self._first_tokens[self._first_offsets[index]:self._first_offsets[index + 1]].tolist()
+
+    def allowed_token_ids(self, pda):
+        """Same walk as ``VocabTrie.allowed_token_ids``, over the flat arrays."""
+        child_start = self._child_start
+        node_char = self._node_char
+        token_start = self._token_start
+        node_tokens = self._node_tokens
+        allowed = []
+        pending = [(0, pda.clone())]
+        while pending:
+            node, state = pending.pop()
+            if token_start[node] != token_start[node + 1]:
+                allowed.extend(node_tokens[token_start[node]:token_start[node + 1]])
+            first, end = child_start[node], child_start[node + 1]
+            last = end - 1
+            for child in range(first, end):
+                branch = state if child == last else state.clone()
+                if branch.consume_char(chr(node_char[child]), partial=True):
+                    pending.append((child, branch))
+        return allowed
+
+    def close(self):
+        for section in self._sections.values():
+            section.release()
+        self._sections = {}
+        self.token_texts = None
+        self._mmap.close()
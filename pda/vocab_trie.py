@@ -0,0 +1,64 @@
+class _TrieNode:
+    __slots__ = ("children", "token_ids")
+
+    def __init__(self):
+        self.children = {}
+        self.token_ids = []
+
+
+class VocabTrie:
+    """
+    Character trie over the decoded vocabulary of a tokenizer.
+
+    Tokens that share a prefix share the path for that prefix, so walking the
+    trie once with a PDA validates every prefix a single time and yields the
+    ids of all tokens that are a valid continuation of the PDA's current
+    configuration.
+    """
+
+    def __init__(self, tokens=()):
+        """
+        Args:
+            tokens (iterable): ``(token_id, token_text)`` pairs. Empty strings are skipped.
+        """
+        self.root = _TrieNode()
+        self.token_texts = {}
+        self.max_token_length = 0
+        for token_id, text in tokens:
+            self.insert(token_id, text)
+
+    def __len__(self):
+        return len(self.token_texts)
+
+    def insert(self, token_id, text):
+        if not text:
+            return
+        node = self.root
+        for char in text:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        node.token_ids.append(token_id)
+        self.token_texts[token_id] = text
+        self.max_token_length = max(self.max_token_length, len(text))
+
+    def allowed_token_ids(self, pda):
+        """
+        Walks the trie with the given PDA and returns the ids of every token
+        whose characters are all accepted. The PDA itself is not modified.
+        """
+        allowed = []
+        pending = [(self.root, pda.clone())]
+        while pending:
+            node, state = pending.pop()
+            allowed.extend(node.token_ids)
+            children = list(node.children.items())
+            last = len(children) - 1
+            for i, (char, child) in enumerate(children):
+                # The last child can take over the parent's PDA, which no
+                # other branch needs anymore.
+                branch = state if i == last else state.clone()
+                if branch.consume_char(char, partial=True):
+                    pending.append((child, branch))
+        return allowed
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import contextlib
+import sys
+
+from llm.batch_generation import ContinuousBatchGenerator, PipelinedBatchGenerator
+from llm.grammar_mask import build_mask_cache, load_vocab_index
+from llm.model_setup import load_model
+from llm.serving import RequestScheduler, SocketServer, read_requests, serve_requests, write_results
+
+
+def main():
+    """
+    Offline batch serving for PDA-guided JSON generation.
+
+    Reads JSONL requests (``{"request_id": ..., "prompt": ..., "schema": {...}}``)
+    from a file or stdin and writes one JSON line per request, in completion
+    order, to a file or stdout. With ``--socket`` or ``--port`` the same
+    continuous-batching scheduler is served from a local socket instead.
+    """
+    parser = argparse.ArgumentParser(description="Serve PDA-guided JSON generation with continuous batching")
+    parser.add_argument("--input", default="-", help="JSONL request file, '-' for stdin")
+    parser.add_argument("--output", default="-", help="JSONL result file, '-' for stdout")
+    parser.add_argument("--socket", default=None, help="serve on this Unix socket path instead of a file")
+    parser.add_argument("--port", type=int, default=None, help="serve on this localhost TCP port instead of a file")
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-1.3b-instruct")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--max-top-k", type=int, default=1024,
+                        help="candidates tried in growing chunks before a top-k step counts as a dead end")
+    parser.add_argument("--max-queued", type=int, default=32, help="requests waiting for a batch slot at most")
+    parser.add_argument("--mask-cache-size", type=int, default=512,
+                        help="PDA configurations whose grammar masks are cached; 0 uses top-k filtering")
+    parser.add_argument("--pipeline-depth", type=int, default=0,
+                        help="grammar masks computed ahead while the forward pass runs; 0 disables pipelining")
+    parser.add_argument("--mask-workers", type=int, default=1, help="workers computing pipelined grammar masks")
+    parser.add_argument("--mask-executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--no-schema", action="store_true", help="ignore request schemas, only enforce JSON syntax")
+    args = parser.parse_args()
+
+    serving_socket = args.socket is not None or args.port is not None
+    # Results may go to stdout, so progress output goes to stderr.
+    with contextlib.redirect_stdout(sys.stderr):
+        tokenizer, model = load_model(args.model)
+        mask_cache = None
+        if args.mask_cache_size > 0:
+            mask_cache = build_mask_cache(load_vocab_index(tokenizer), maxsize=args.mask_cache_size)
+        options = dict(batch_size=args.batch_size, max_steps=args.max_steps, vocab_trie=mask_cache,
+                       max_top_k=args.max_top_k)
+        if args.pipeline_depth > 0 and mask_cache is not None:
+            generator = PipelinedBatchGenerator(
+                model, tokenizer, pipeline_depth=args.pipeline_depth, mask_workers=args.mask_workers,
+                mask_executor=args.mask_executor, **options,
+            )
+        else:
+            generator = ContinuousBatchGenerator(model, tokenizer, **options)
+        scheduler = RequestScheduler(generator, use_schema=not args.no_schema)
+
+        if serving_socket:
+            server = SocketServer(scheduler, max_queued=args.max_queued)
+            asyncio.run(server.serve(path=args.socket, port=args.port or 8765))
+            return
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            results = serve_requests(read_requests(source), scheduler, max_queued=args.max_queued)
+            count = write_results(results, target)
+            print(f"--- Served {count} requests ({scheduler.num_completed} generated, {scheduler.num_failed} failed, "
+                  f"{generator.num_generated_tokens} tokens, {generator.num_forward_passes} forward passes) ---")
+            if isinstance(generator, PipelinedBatchGenerator):
+                print(f"--- Pipeline: {generator.pipeline_report()} ---")
+    finally:
+        if isinstance(generator, PipelinedBatchGenerator):
+            generator.close()
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == "__main__":
+    main()
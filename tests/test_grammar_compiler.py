@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from pda.grammar_compiler import GrammarError, compile_grammar, load_grammar
+
+from tests.test_json_pda import INVALID, PREFIXES, VALID
+
+JSON_GRAMMAR = os.path.join(os.path.dirname(__file__), "..", "pda", "grammars", "json.ebnf")
+
+
+@pytest.fixture(scope="module")
+def grammar(tmp_path_factory):
+    return load_grammar(JSON_GRAMMAR, directory=tmp_path_factory.mktemp("grammars"))
+
+
+def test_json_grammar_accepts_valid_documents(grammar):
+    for text in VALID:
+        assert grammar.new_pda().accepts(text), text
+
+
+def test_json_grammar_rejects_invalid_documents(grammar):
+    # Unlike JsonPDA the grammar is strict about commas, numbers and escapes.
+    for text in INVALID + ['[1,]', '{"a": 1,}', '01', '"\\q"', 'tru']:
+        assert not grammar.new_pda().accepts(text), text
+
+
+def test_json_grammar_partial_prefixes(grammar):
+    for text in PREFIXES:
+        assert grammar.new_pda().accepts(text, partial=True), text
+        assert not grammar.new_pda().accepts(text), text
+
+
+def test_tables_are_reused(tmp_path):
+    first = load_grammar(JSON_GRAMMAR, directory=tmp_path)
+    assert len(os.listdir(tmp_path)) == 1
+    second = load_grammar(JSON_GRAMMAR, directory=tmp_path)
+    assert second.digest == first.digest
+    assert second.new_pda().accepts('{"a": [1]}')
+
+
+def test_left_recursion_is_rejected():
+    with pytest.raises(GrammarError):
+        compile_grammar('root ::= root "a" | "a"')
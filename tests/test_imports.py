@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay importable on a machine without torch and transformers.
+LIGHT_MODULES = [
+    "llm",
+    "llm.serving",
+    "llm.tracing",
+    "pda.candidates",
+    "pda.grammar_compiler",
+    "pda.mask_cache",
+    "pda.schema_pda",
+    "pda.vocab_index",
+    "benchmarks.bench_pda",
+    "benchmarks.bench_tokenizer",
+    "evaluation.parallel_runner",
+    "evaluation.result_cache",
+    "tokenizors.json_tokenizor",
+]
+
+
+def test_light_modules_do_not_import_torch():
+    code = f"import sys\nimport {', '.join(LIGHT_MODULES)}\nprint(sorted({{'torch', 'transformers'}} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,42 @@
+import pytest
+
+from pda.json_events import JsonEventParser
+from pda.json_pda import JsonPDA
+
+
+def events_of(chunks):
+    parser = JsonEventParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_events_of_a_document_split_into_chunks():
+    document = '{"name": "Ada", "tags": [1, 2.5, true, null], "a\\u00e9": "x\\ny"}'
+    expected = [
+        ("start_object", None), ("key", "name"), ("scalar", "Ada"), ("key", "tags"), ("start_array", None),
+        ("scalar", 1), ("scalar", 2.5), ("scalar", True), ("scalar", None), ("end_array", None),
+        ("key", "aé"), ("scalar", "x\ny"), ("end_object", None), ("end_document", None),
+    ]
+    assert events_of([document]) == expected
+    assert events_of(document) == expected
+    assert events_of([document[:7], document[7:20], document[20:]]) == expected
+
+
+@pytest.mark.parametrize("document, value", [
+    ('{"a": "\\q"}', "\\q"),
+    ('{"a": "\\u12"}', "\\u12"),
+    ('{"a": "x\\u12\\ty"}', "x\\u12\ty"),
+])
+def test_escapes_the_pda_accepts_do_not_raise(document, value):
+    assert JsonPDA().accepts(document)
+    assert ("scalar", value) in events_of([document])
+    assert ("scalar", value) in events_of(document)
+
+
+def test_invalid_text_raises_with_offset():
+    parser = JsonEventParser()
+    parser.feed('{"a": ')
+    with pytest.raises(ValueError, match="offset 6"):
+        parser.feed("}")
@@ -0,0 +1,44 @@
+from pda.json_pda import JsonPDA
+
+VALID = ['{}', '[]', '"text"', '-0.5e3', 'true', 'null', ' {"key": "value", "list": [1, 12, false, {"a": null}]} ',
+         '{"escaped": "\\"\\\\\\n\\u00e9"}', '[[[]], {}]']
+INVALID = ['}', '{"key" 1}', '{"key": 1 "other": 2}', '{1: 2}', '[1, 2}', '{"key": [1]]', '{} {}', '[]]']
+PREFIXES = ['{', '{"ke', '{"key"', '{"key": ', '{"key": [1, tr', '[1, 2', '"unfinished \\']
+
+
+def test_accepts_valid_documents():
+    for text in VALID:
+        assert JsonPDA().accepts(text), text
+
+
+def test_rejects_invalid_documents():
+    for text in INVALID:
+        assert not JsonPDA().accepts(text), text
+        assert not JsonPDA().accepts(text, partial=True), text
+
+
+def test_prefixes_are_only_partially_accepted():
+    for text in PREFIXES:
+        assert JsonPDA().accepts(text, partial=True), text
+        assert not JsonPDA().accepts(text), text
+
+
+def test_consume_token_matches_consume_char():
+    for text in VALID + INVALID + PREFIXES:
+        by_char = JsonPDA()
+        char_results = [by_char.consume_char(char) for char in text]
+        by_token = JsonPDA()
+        assert by_token.consume_token(text) == all(char_results), text
+        if all(char_results):
+            assert by_token.stack == by_char.stack and by_token.state == by_char.state, text
+
+
+def test_clones_are_independent():
+    pda = JsonPDA()
+    assert pda.consume_token('{"key": [1')
+    stack, state = pda.stack, pda.state
+    clone = pda.clone()
+    assert clone.consume_token(', 2]}')
+    assert clone.state == "END"
+    assert (pda.stack, pda.state) == (stack, state)
+    assert pda.consume_token(']}') and pda.state == "END"
@@ -0,0 +1,36 @@
+import pytest
+
+from tokenizors.json_tokenizor import IncrementalJsonTokenizer, JsonTokenizer
+
+
+def finish_partial(text):
+    tokenizer = IncrementalJsonTokenizer()
+    tokens = tokenizer.feed(text)
+    return tokens + tokenizer.finish(allow_partial=True)
+
+
+@pytest.mark.parametrize("text", ["e3", "f", "-", ".", "tr", "nul", "[1, e3", '{"a": -', '"ab\\'])
+def test_finish_partial_rejects_invalid_lexemes(text):
+    with pytest.raises(SyntaxError):
+        JsonTokenizer().tokenize(text, allow_partial=True)
+    with pytest.raises(SyntaxError):
+        finish_partial(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('"abc', ['"abc']),
+    ('{"key": "val', ['{', '"key"', ':', '"val']),
+    ('[12', ['[', '12']),
+    ('[12.', ['[', '12.']),
+    ('[-1e+', ['[', '-1e+']),
+    ('[true', ['[', 'true']),
+])
+def test_finish_partial_keeps_string_and_number_prefixes(text, expected):
+    assert finish_partial(text) == expected
+
+
+def test_finish_strict_rejects_prefixes():
+    tokenizer = IncrementalJsonTokenizer()
+    tokenizer.feed('[12.')
+    with pytest.raises(SyntaxError):
+        tokenizer.finish()
@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pda.json_pda import JsonPDA
+from pda.mask_cache import TokenMaskCache
+from pda.vocab_trie import VocabTrie
+
+VOCAB = ['{', '}', '[', ']', ',', ':', '"', '{"', '":', '",', '"}', 'a', 'ab', 'key', 'value', ' ', '1', '12',
+         '0.', '.5', 'e3', '-', 'true', 'tr', 'ue', 'null', 'false', '\\n', '\\', 'u00e9', '": "', '"]']
+DOCUMENTS = ['{"key": "value", "ab": [1, 12, true]}', '[null, false, -0.5e3, {"a": "\\n\\u00e9"}]']
+
+
+def pda_states():
+    states = []
+    for document in DOCUMENTS:
+        pda = JsonPDA()
+        states.append(pda.clone())
+        for char in document:
+            assert pda.consume_char(char)
+            states.append(pda.clone())
+    return states
+
+
+def cached_masks(num_workers):
+    cache = TokenMaskCache(VocabTrie(enumerate(VOCAB)), maxsize=8)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return [sorted(allowed) for allowed in executor.map(cache.allowed_token_ids, pda_states() * 3)]
+
+
+def test_thread_workers_match_the_trie():
+    trie = VocabTrie(enumerate(VOCAB))
+    expected = [sorted(trie.allowed_token_ids(pda)) for pda in pda_states() * 3]
+    assert cached_masks(1) == expected
+    assert cached_masks(4) == expected
+
+
+class _BarrierTrie:
+    """Trie stand-in whose walk only returns once two walks are running at the same time."""
+
+    max_token_length = 1
+    token_texts = {}
+
+    def __init__(self):
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def allowed_token_ids(self, pda):
+        self.barrier.wait()
+        return [0]
+
+
+def test_misses_walk_concurrently():
+    cache = TokenMaskCache(_BarrierTrie())
+    first = JsonPDA()
+    second = JsonPDA()
+    assert second.consume_char("[")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(cache.allowed_token_ids, [first, second]))
+    assert results == [[0], [0]]
+    assert cache.misses == 2
@@ -0,0 +1,90 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from llm import pda_augmented_generation
+from llm.tracing import GenerationHooks
+
+VOCAB = ["{", '"a"', ":", " 1", "}", "x"]
+SCRIPT = [0, 1, 2, 3, 4]
+
+
+class _Tokenizer:
+    def decode(self, token_ids):
+        return "".join(VOCAB[token_id] for token_id in token_ids)
+
+
+class _ScriptedDecoder:
+    """Stands in for IncrementalDecoder: the logits favour the next token of SCRIPT."""
+
+    def __init__(self, model, tokenizer, prefix_cache=None):
+        self.num_prompt_tokens = 1
+        self.position = 0
+
+    def _logits(self):
+        logits = torch.zeros(len(VOCAB))
+        logits[SCRIPT[min(self.position, len(SCRIPT) - 1)]] = 10.0
+        self.position += 1
+        return logits
+
+    def prefill(self, prompt):
+        return self._logits()
+
+    def extend(self, token_ids):
+        return self._logits()
+
+
+class _EndRecorder(GenerationHooks):
+    def __init__(self):
+        self.ends = []
+
+    def on_end(self, reason, num_tokens, elapsed):
+        self.ends.append((reason, num_tokens))
+
+
+@pytest.fixture(autouse=True)
+def scripted_decoder(monkeypatch):
+    monkeypatch.setattr(pda_augmented_generation, "IncrementalDecoder", _ScriptedDecoder)
+
+
+def test_on_end_after_complete_document():
+    hooks = _EndRecorder()
+    tokens = list(pda_augmented_generation.iter_pda_tokens("prompt", None, _Tokenizer(), top_k=3, hooks=hooks))
+    assert "".join(token for token, _ in tokens) == '{"a": 1}'
+    assert hooks.ends == [("end", 5)]
+
+
+def test_on_end_when_closed_early():
+    hooks = _EndRecorder()
+    tokens = pda_augmented_generation.iter_pda_tokens("prompt", None, _Tokenizer(), top_k=3, hooks=hooks)
+    assert next(tokens) == ("{", "{")
+    assert next(tokens) == ('"a"', '"a"')
+    tokens.close()
+    assert hooks.ends == [("closed", 2)]
+
+
+class _SentencePieceLike:
+    """Adds a word-initial space marker when tokenizing and drops it at the start of a decode."""
+
+    pieces = ["▁r", "ue", "r", "a", "▁a"]
+
+    class _Encoding:
+        def __init__(self, input_ids):
+            self.input_ids = input_ids
+
+    def __call__(self, text, add_special_tokens=True):
+        ids = {"rue": [0, 1], "a": [4]}[text]
+        return self._Encoding(ids)
+
+    def decode(self, token_ids, clean_up_tokenization_spaces=True):
+        return "".join(self.pieces[token_id] for token_id in token_ids).replace("▁", " ").lstrip(" ")
+
+
+def test_forced_tokens_rejects_a_leading_space_the_decode_hides():
+    pda = pda_augmented_generation.JsonPDA()
+    assert pda.consume_token("[t")
+    tokenizer = _SentencePieceLike()
+    assert tokenizer.decode([0, 1]) == "rue"
+    assert pda_augmented_generation.forced_tokens(pda, tokenizer) == ([], "")
+    token_texts = [" r", "ue", "r", "a", " a"]
+    assert pda_augmented_generation.forced_tokens(pda, tokenizer, token_texts) == ([], "")
@@ -0,0 +1,46 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from llm.prefix_cache import PrefixCache
+
+NUM_LAYERS = 2
+
+
+def kv(token_ids):
+    """Legacy cache whose keys and values at each position are the token id there."""
+    positions = torch.tensor(token_ids, dtype=torch.float32).view(1, 1, -1, 1)
+    return tuple((positions + layer, -positions - layer) for layer in range(NUM_LAYERS))
+
+
+def assert_kv_of(legacy, token_ids):
+    for (key, value), (expected_key, expected_value) in zip(legacy, kv(token_ids)):
+        assert torch.equal(key, expected_key) and torch.equal(value, expected_value)
+
+
+def test_longest_prefix_hit():
+    cache = PrefixCache()
+    cache.insert([1, 2, 3, 4], kv([1, 2, 3, 4]))
+    cache.insert([1, 2, 5], kv([1, 2, 5]))
+
+    for token_ids, expected in (([1, 2, 3, 9], [1, 2, 3]), ([1, 2, 5, 6], [1, 2, 5]),
+                                ([1, 2, 3, 4, 5], [1, 2, 3, 4]), ([1, 7], [1])):
+        length, legacy = cache.lookup(token_ids)
+        assert length == len(expected)
+        assert_kv_of(legacy, expected)
+    assert cache.lookup([7, 1]) == (0, None)
+    assert (cache.hits, cache.lookups) == (4, 5)
+
+
+def test_least_recently_used_leaf_is_evicted():
+    position_bytes = NUM_LAYERS * 2 * 4
+    cache = PrefixCache(max_megabytes=(9 * position_bytes + 1) / (1024 * 1024))
+    cache.insert([1, 2, 3, 4], kv([1, 2, 3, 4]))
+    cache.insert([5, 6, 7, 8], kv([5, 6, 7, 8]))
+    assert cache.lookup([1, 2, 3, 4])[0] == 4
+
+    cache.insert([9, 10, 11, 12], kv([9, 10, 11, 12]))
+    assert cache.num_bytes == 8 * position_bytes
+    assert cache.lookup([5, 6, 7, 8]) == (0, None)
+    assert cache.lookup([1, 2, 3, 4])[0] == 4
+    assert cache.lookup([9, 10, 11, 12])[0] == 4
@@ -0,0 +1,49 @@
+from pda.schema_pda import compile_schema
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "color": {"$ref": "#/$defs/color"},
+        "tags": {"type": "array", "items": {"$ref": "#/$defs/color"}},
+    },
+    "required": ["name", "age"],
+    "$defs": {"color": {"enum": ["red", "green"]}},
+}
+
+
+def accepts(text, partial=False):
+    return compile_schema(SCHEMA).new_pda().accepts(text, partial=partial)
+
+
+def test_required_keys():
+    assert accepts('{"name": "Ada", "age": 36}')
+    assert accepts('{"age": 36, "name": "Ada"}')
+    assert not accepts('{"name": "Ada"}')
+    assert not accepts('{}')
+    assert accepts('{"name": "Ada"', partial=True)
+
+
+def test_unknown_repeated_and_mistyped_keys():
+    assert not accepts('{"name": "Ada", "age": 36, "other": 1}')
+    assert not accepts('{"name": "Ada", "name": "Bob", "age": 36}')
+    assert not accepts('{"name": 1, "age": 36}')
+    assert not accepts('{"name": "Ada", "age": 36.5}')
+
+
+def test_enums_through_refs():
+    assert accepts('{"name": "Ada", "age": 36, "color": "red"}')
+    assert not accepts('{"name": "Ada", "age": 36, "color": "blue"}')
+    assert not accepts('{"name": "Ada", "age": 36, "color": "re"}')
+    assert accepts('{"name": "Ada", "age": 36, "tags": ["green", "red"]}')
+    assert not accepts('{"name": "Ada", "age": 36, "tags": ["green", "yellow"]}')
+
+
+def test_forced_continuation_follows_the_schema():
+    pda = compile_schema(SCHEMA).new_pda()
+    assert pda.consume_token('{"na')
+    assert pda.forced_continuation() == 'me":"'
+    pda = compile_schema(SCHEMA).new_pda()
+    assert pda.consume_token('{"name": "Ada", "age": 36, "color": "g')
+    assert pda.forced_continuation().startswith('reen"')
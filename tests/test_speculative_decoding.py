@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("tokenizers")
+
+from benchmarks.bench_decoding import PROMPT, build_local_tokenizer, build_tiny_model
+from llm.grammar_mask import build_mask_cache, build_vocab_trie
+from llm.speculative_decoding import generate_with_pda_speculative
+from pda.json_pda import JsonPDA
+
+
+@pytest.fixture(scope="module")
+def setup():
+    tokenizer = build_local_tokenizer()
+    model = build_tiny_model(len(tokenizer), seed=0)
+    draft_model = build_tiny_model(len(tokenizer), seed=1, hidden_size=32, num_layers=1)
+    mask_cache = build_mask_cache(build_vocab_trie(tokenizer), maxsize=512)
+    return tokenizer, model, draft_model, mask_cache
+
+
+def is_json_prefix(text):
+    pda = JsonPDA()
+    return all(pda.consume_char(char, partial=True) for char in text)
+
+
+def test_speculative_output_matches_greedy_baseline(setup):
+    tokenizer, model, draft_model, mask_cache = setup
+    baseline_stats = {}
+    baseline = generate_with_pda_speculative(PROMPT, model, None, tokenizer, mask_cache, max_steps=40,
+                                             stats=baseline_stats)
+    for draft in (model, draft_model):
+        stats = {}
+        output = generate_with_pda_speculative(PROMPT, model, draft, tokenizer, mask_cache, max_steps=40,
+                                               stats=stats)
+        assert output == baseline
+        assert stats["num_tokens"] == baseline_stats["num_tokens"]
+    assert baseline[0] in "{["
+    assert is_json_prefix(baseline)
+
+
+def test_self_draft_accepts_every_proposal(setup):
+    tokenizer, model, _, mask_cache = setup
+    stats = {}
+    generate_with_pda_speculative(PROMPT, model, model, tokenizer, mask_cache, max_steps=40, stats=stats)
+    assert stats["num_accepted"] == stats["num_proposed"]
+    assert stats["target_forward_passes"] < stats["num_tokens"]
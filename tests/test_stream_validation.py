@@ -0,0 +1,56 @@
+from pda.schema_pda import compile_schema
+from pda.stream_validation import validate_chunks, validate_file, validate_files
+
+DOCUMENT = '{"name": "Zoë ∑", "values": [1, -2.5e3, true, null], "nested": {"escape": "\\"\\u00e9"}}'
+
+
+def splits(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_valid_document_in_any_split():
+    encoded = DOCUMENT.encode("utf-8")
+    for size in (1, 2, 3, 7, len(DOCUMENT)):
+        assert validate_chunks(splits(DOCUMENT, size)) == (True, None, len(DOCUMENT), "")
+        assert validate_chunks(splits(encoded, size)) == (True, None, len(encoded), "")
+
+
+def test_error_offsets_across_chunks():
+    text = DOCUMENT.replace("true", "true}")
+    error = text.index("}", text.index("true"))
+    encoded = text.encode("utf-8")
+    byte_error = len(text[:error].encode("utf-8"))
+    for size in (1, 3, 5, 16, len(text)):
+        result = validate_chunks(splits(text, size))
+        assert (result.valid, result.error_offset, result.message) == (False, error, "unexpected '}'")
+        result = validate_chunks(splits(encoded, size))
+        assert (result.valid, result.error_offset) == (False, byte_error)
+
+
+def test_truncated_and_invalid_input():
+    assert validate_chunks(['{"a": [1', ', 2']) == (False, 11, 11, "unexpected end of input")
+    encoded = DOCUMENT.encode("utf-8")
+    cut = encoded.index("ë".encode("utf-8")) + 1
+    result = validate_chunks([encoded[:cut]])
+    assert (result.valid, result.error_offset, result.message) == (False, cut - 1, "truncated UTF-8 sequence")
+    result = validate_chunks([b'{"a": "', b'\xff"}'])
+    assert (result.valid, result.error_offset, result.message) == (False, 7, "invalid UTF-8")
+
+
+def test_schema_pda():
+    pda = compile_schema({"properties": {"name": {"type": "string"}}}).new_pda()
+    assert validate_chunks(['{"na', 'me": "x"}'], pda=pda).valid
+    result = validate_chunks(['{"na', 'me": 1}'], pda=pda)
+    assert (result.valid, result.error_offset) == (False, 9)
+
+
+def test_files(tmp_path):
+    valid = tmp_path / "valid.json"
+    valid.write_text(DOCUMENT, encoding="utf-8")
+    invalid = tmp_path / "invalid.json"
+    invalid.write_text(DOCUMENT[:-1] + "]", encoding="utf-8")
+    size = len(DOCUMENT.encode("utf-8"))
+    assert validate_file(str(valid), chunk_size=4).valid
+    assert validate_file(str(invalid), chunk_size=4).error_offset == size - 1
+    results = validate_files([str(valid), str(invalid), str(tmp_path / "missing.json")], workers=1)
+    assert [result.valid for _, result in results] == [True, False, False]
@@ -0,0 +1,41 @@
+from pda.schema_pda import compile_schema
+from pda.vocab_index import VocabIndex, write_vocab_index
+from pda.vocab_trie import VocabTrie
+
+from tests.test_mask_cache import VOCAB, pda_states
+
+SPECIAL = ['<s>', '</s>']
+TOKEN_TEXTS = SPECIAL + VOCAB + ['é', '"é', '∑']
+EXCLUDED = range(len(SPECIAL))
+
+
+def open_index(tmp_path):
+    path = str(tmp_path / "vocab.idx")
+    write_vocab_index(path, TOKEN_TEXTS, excluded_ids=EXCLUDED)
+    return VocabIndex(path)
+
+
+def test_allowed_token_ids_match_the_trie(tmp_path):
+    index = open_index(tmp_path)
+    trie = VocabTrie((token_id, text) for token_id, text in enumerate(TOKEN_TEXTS) if token_id not in EXCLUDED)
+    schema_pda = compile_schema({"properties": {"key": {"enum": ["value"]}}}).new_pda()
+    try:
+        for pda in pda_states() + [schema_pda]:
+            assert sorted(index.allowed_token_ids(pda)) == sorted(trie.allowed_token_ids(pda))
+        assert len(index) == len(trie)
+        assert index.max_token_length == trie.max_token_length
+    finally:
+        index.close()
+
+
+def test_token_texts_cover_the_whole_vocabulary(tmp_path):
+    index = open_index(tmp_path)
+    try:
+        assert index.vocab_size == len(TOKEN_TEXTS)
+        assert [index.token_texts[token_id] for token_id in range(index.vocab_size)] == TOKEN_TEXTS
+        assert sorted(index.tokens_starting_with('"')) == [
+            token_id for token_id, text in enumerate(TOKEN_TEXTS) if text.startswith('"')
+        ]
+        assert index.tokens_starting_with('<') == []
+    finally:
+        index.close()
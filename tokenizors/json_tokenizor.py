@@ -46,3 +46,227 @@ class JsonTokenizer:
                 tokens.append(value)
             pos = match.end()
         return tokens
+
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NUMBER_PREFIX = re.compile(r'-?\d*(?:\.\d*)?(?:[eE][+-]?\d*)?')
+_COMPLETE_NUMBER = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = ('true', 'false', 'null')
+
+
+class IncrementalJsonTokenizer:
+    """
+    Lexer for a document that grows by appended chunks, e.g. after every
+    decoding step.
+
+    ``feed`` returns only the lexemes completed by the new chunk, in the
+    same form as ``JsonTokenizer.tokenize``. A lexeme that may still go on
+    (an open string, a number or literal at the end of the text so far) is
+    kept back until a later chunk ends it, so the text is scanned once in
+    total instead of once per call. Open strings are kept as a list of
+    pieces and only the new chunk is searched for the closing quote.
+    """
+
+    def __init__(self, tokenizer=None):
+        tokenizer = tokenizer or JsonTokenizer()
+        self.regex = tokenizer.regex
+        shapes = dict(tokenizer.token_specification)
+        self._partial_lexeme = re.compile(f"{shapes['PARTIAL_STRING']}|{shapes['PARTIAL_NUMBER']}")
+        self.offset = 0
+        self._pending = ""
+        self._string_parts = None
+        self._escape = False
+
+    @property
+    def partial(self):
+        """The incomplete lexeme at the end of the text fed so far."""
+        if self._string_parts is not None:
+            return "".join(self._string_parts)
+        return self._pending
+
+    def _continue_string(self, chunk):
+        """Returns the index just past the closing quote in ``chunk``, or -1 if the string stays open."""
+        i = 0
+        if self._escape:
+            if not chunk:
+                return -1
+            self._escape = False
+            i = 1
+        while True:
+            match = _STRING_SPECIAL.search(chunk, i)
+            if match is None:
+                return -1
+            if match.group() == '"':
+                return match.end()
+            if match.end() == len(chunk):
+                self._escape = True
+                return -1
+            i = match.end() + 1
+
+    def _may_continue(self, rest):
+        return _NUMBER_PREFIX.fullmatch(rest) is not None or any(
+            literal.startswith(rest) and literal != rest for literal in _LITERALS
+        )
+
+    def feed(self, chunk):
+        """Lexes an appended chunk and returns the lexemes it completes."""
+        tokens = []
+        base = self.offset - len(self._pending)
+        self.offset += len(chunk)
+
+        if self._string_parts is not None:
+            end = self._continue_string(chunk)
+            if end == -1:
+                self._string_parts.append(chunk)
+                return tokens
+            self._string_parts.append(chunk[:end])
+            tokens.append("".join(self._string_parts))
+            self._string_parts = None
+            base = self.offset - len(chunk) + end
+            chunk = chunk[end:]
+
+        text = self._pending + chunk
+        self._pending = ""
+        pos = 0
+        while pos < len(text):
+            match = self.regex.match(text, pos)
+            kind = match.lastgroup
+
+            if kind == 'WHITESPACE':
+                pos = match.end()
+                continue
+            if kind == 'PARTIAL_STRING':
+                self._string_parts = ['"']
+                self._escape = False
+                self._continue_string(text[pos + 1:])
+                self._string_parts.append(text[pos + 1:])
+                break
+            if kind != 'STRING' and self._may_continue(text[pos:]):
+                self._pending = text[pos:]
+                break
+            if kind == 'MISMATCH':
+                raise SyntaxError(f"Unexpected character at position {base + pos}: {text[pos]!r}")
+            tokens.append(match.group())
+            pos = match.end()
+        return tokens
+
+    def finish(self, allow_partial=False):
+        """
+        Ends the document and returns the lexeme still held back, if any.
+        With ``allow_partial`` an incomplete string or number is returned
+        instead of raising, as long as it has the shape of JsonTokenizer's
+        PARTIAL_STRING or PARTIAL_NUMBER; anything else (``"-"``, ``"e3"``,
+        ``"tr"``, a string ending in a lone backslash) still raises.
+        """
+        partial = self.partial
+        complete = self._string_parts is None and (
+            _COMPLETE_NUMBER.fullmatch(partial) is not None or partial in _LITERALS
+        )
+        self.offset = 0
+        self._pending = ""
+        self._string_parts = None
+        self._escape = False
+        if not partial:
+            return []
+        if complete or allow_partial and self._partial_lexeme.fullmatch(partial) is not None:
+            return [partial]
+        raise SyntaxError(f"Incomplete token: {partial}")
+
+
+# Strict JSON forms of the lexemes whose contents need checking.
+_STRING_LEXEME = re.compile(r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"')
+_NUMBER_LEXEME = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+
+_EXPECT_VALUE = 0
+_EXPECT_VALUE_OR_END = 1
+_EXPECT_KEY = 2
+_EXPECT_KEY_OR_END = 3
+_EXPECT_COLON = 4
+_EXPECT_COMMA_OR_END = 5
+_DONE = 6
+
+
+class LexemeValidator:
+    """
+    Validates a JSON document lexeme by lexeme, e.g. the output of
+    ``IncrementalJsonTokenizer.feed``.
+
+    Structure is checked with a small stack machine, while every string and
+    number is checked with a single strict regex match instead of a
+    character-by-character automaton loop.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._state = _EXPECT_VALUE
+
+    def feed(self, tokens):
+        """Returns False as soon as a lexeme cannot continue a valid document."""
+        for token in tokens:
+            if not self._feed_one(token):
+                return False
+        return True
+
+    def is_complete(self):
+        return self._state == _DONE
+
+    def _value_done(self):
+        self._state = _EXPECT_COMMA_OR_END if self._stack else _DONE
+
+    def _feed_one(self, token):
+        state = self._state
+        first = token[0]
+        if first == '"':
+            if _STRING_LEXEME.fullmatch(token) is None:
+                return False
+            if state in (_EXPECT_KEY, _EXPECT_KEY_OR_END):
+                self._state = _EXPECT_COLON
+                return True
+            if state in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+                self._value_done()
+                return True
+            return False
+
+        if first == '{' or first == '[':
+            if state not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+                return False
+            self._stack.append(first)
+            self._state = _EXPECT_KEY_OR_END if first == '{' else _EXPECT_VALUE_OR_END
+            return True
+
+        if first == '}' or first == ']':
+            opener, empty_state = ('{', _EXPECT_KEY_OR_END) if first == '}' else ('[', _EXPECT_VALUE_OR_END)
+            if state not in (empty_state, _EXPECT_COMMA_OR_END) or not self._stack or self._stack[-1] != opener:
+                return False
+            self._stack.pop()
+            self._value_done()
+            return True
+
+        if token == ':':
+            if state != _EXPECT_COLON:
+                return False
+            self._state = _EXPECT_VALUE
+            return True
+
+        if token == ',':
+            if state != _EXPECT_COMMA_OR_END:
+                return False
+            self._state = _EXPECT_KEY if self._stack[-1] == '{' else _EXPECT_VALUE
+            return True
+
+        if token in _LITERALS or _NUMBER_LEXEME.fullmatch(token) is not None:
+            if state not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END):
+                return False
+            self._value_done()
+            return True
+        return False
+
+
+def validate_json(text):
+    """Checks a complete document with the lexer and the lexeme-level validator."""
+    try:
+        tokens = JsonTokenizer().tokenize(text)
+    except SyntaxError:
+        return False
+    validator = LexemeValidator()
+    return validator.feed(tokens) and validator.is_complete()